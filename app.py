@@ -1,15 +1,30 @@
 import streamlit as st
+from utils import logger, setup_logging
+
+# Logging is configured here rather than on import, so importing app modules
+# (tests, benchmarks, CLIs) has no side effects
+setup_logging()
+
 from ui import render_ui, display_sidebar, display_chat
-from utils import logger
+from metrics import rerun_scope, start_metrics_server
+from model_lifecycle import start_model_lifecycle
+from cluster import start_cluster_sync
+from sessions import restore_active_session
+from const import METRICS_PORT
 from streamlit.runtime.scriptrunner.script_runner import StopException
 
 st.set_page_config(page_title="Mini Chat GPT", layout="wide")
 
 def main():
+    start_metrics_server(METRICS_PORT)
+    start_model_lifecycle()
+    start_cluster_sync()
     try:
-        render_ui()
-        display_sidebar()
-        display_chat()
+        with rerun_scope():
+            restore_active_session()
+            render_ui()
+            display_sidebar()
+            display_chat()
     except StopException:
         # This is a normal Streamlit control flow mechanism, not an error
         pass
@@ -0,0 +1,271 @@
+"""Offline benchmark of a chat turn against local stand-ins.
+
+Drives the real app (app.py -> ui -> input_handle -> config/process_stream)
+headlessly with Streamlit's AppTest, with Ollama replaced by a local fake
+server and Redis by the in-process cache. With --storage postgres the
+database is a local server (e.g. the docker-compose one) and all tables live
+in a throwaway schema; with --storage sqlite it is a throwaway file.
+
+    python -m benchmarks.chat_turn --history 0,100,1000 --turns 10
+    python -m benchmarks.chat_turn --storage sqlite
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+INIT_SQL = os.path.join(ROOT, "postgres", "init.sql")
+
+from benchmarks.fake_ollama import FakeOllama
+
+
+class Counters:
+    """Round trips observed by the instrumented stand-ins."""
+
+    def __init__(self, caches, fake_ollama):
+        self.caches = caches
+        self.ollama = fake_ollama
+        self.db_queries = 0
+        self.db_commits = 0
+        self.db_connects = 0
+
+    def snapshot(self):
+        return {
+            "db_queries": self.db_queries,
+            "db_commits": self.db_commits,
+            "db_connects": self.db_connects,
+            "redis_round_trips": sum(cache.round_trips for cache in self.caches),
+            "ollama_requests": sum(self.ollama.requests.values()),
+        }
+
+    @staticmethod
+    def delta(before, after):
+        return {key: after[key] - before[key] for key in before}
+
+
+class CountingCursor:
+    def __init__(self, cursor, counters):
+        self._cursor = cursor
+        self._counters = counters
+
+    def execute(self, *args, **kwargs):
+        self._counters.db_queries += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    def __init__(self, conn, counters):
+        self._conn = conn
+        self._counters = counters
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._counters)
+
+    def commit(self):
+        self._counters.db_commits += 1
+        return self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    ms = [s["seconds"] * 1000 for s in samples]
+    summary = {
+        "n": len(ms),
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "mean_ms": statistics.fmean(ms) if ms else float("nan"),
+    }
+    for key in ("db_queries", "db_commits", "db_connects", "redis_round_trips", "ollama_requests"):
+        summary[key] = statistics.fmean(s[key] for s in samples) if samples else float("nan")
+    return summary
+
+
+def setup_environment(args):
+    """Points the app at the stand-ins; must run before any app module is imported."""
+    fake = FakeOllama(tokens=args.tokens, token_rate=args.token_rate, latency=args.latency).start()
+    os.environ["OLLAMA_HOST"] = fake.url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["STORAGE_BACKEND"] = args.storage
+    os.environ["CACHE_BACKEND"] = "local"
+    if args.storage == "sqlite":
+        os.environ["SQLITE_PATH"] = args.sqlite_path
+
+    import const
+    const.DB_PARAMS["options"] = f"-c search_path={args.schema}"
+
+    import config
+    counters = Counters([config.get_cache(), config.get_cache(binary=True)], fake)
+    if args.storage == "sqlite":
+        import sqlite_storage as backend
+    else:
+        import postgres_storage as backend
+    connect = backend._connect
+
+    def counting_connect(*a, **k):
+        counters.db_connects += 1
+        return CountingConnection(connect(*a, **k), counters)
+    backend._connect = counting_connect
+    return fake, counters
+
+
+def reset_storage(args):
+    if args.storage == "sqlite":
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.sqlite_path + suffix):
+                os.remove(args.sqlite_path + suffix)
+    else:
+        reset_storage(args)
+
+
+def reset_schema(schema):
+    """Recreates the benchmark schema from postgres/init.sql."""
+    import psycopg2
+    from const import DB_PARAMS
+    params = {k: v for k, v in DB_PARAMS.items() if k != "options"}
+    with psycopg2.connect(**params) as conn, conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema};")
+        cur.execute(f"SET search_path TO {schema};")
+        with open(INIT_SQL) as f:
+            cur.execute(f.read())
+    conn.close()
+
+
+def seed_session(name, model, length):
+    """Creates a session with `length` alternating user/assistant messages."""
+    from message_format import normalize_message
+    from storage import get_storage
+    storage = get_storage()
+    session_id = storage.save_session(name, model)
+    start = datetime.utcnow() - timedelta(days=1)
+    rows = []
+    for i in range(length):
+        role = "user" if i % 2 == 0 else "assistant"
+        m = normalize_message(role, f"Message {i}: " + "lorem ipsum dolor sit amet " * 20)
+        rows.append((session_id, role, m["content"], start + timedelta(milliseconds=i),
+                     m["reasoning"], m["rendered"], m["tokens"]))
+    for offset in range(0, len(rows), 1000):
+        storage.save_messages(rows[offset:offset + 1000])
+    return session_id
+
+
+def measure(counters, action):
+    before = counters.snapshot()
+    start = time.perf_counter()
+    action()
+    seconds = time.perf_counter() - start
+    sample = Counters.delta(before, counters.snapshot())
+    sample["seconds"] = seconds
+    return sample
+
+
+def run(args):
+    fake, counters = setup_environment(args)
+    reset_storage(args)
+
+    from streamlit.testing.v1 import AppTest
+    from const import DEFAULT_MODEL
+
+    results = []
+    for length in args.history:
+        name = f"bench-{length}"
+        seed_session(name, DEFAULT_MODEL, length)
+        for cache in counters.caches:
+            cache.flushall()
+
+        at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+        at.session_state["active_session"] = name
+
+        def rerun():
+            at.run()
+            if at.exception:
+                raise RuntimeError(f"App raised: {at.exception[0].value}")
+
+        cold = measure(counters, rerun)
+        warm = [measure(counters, rerun) for _ in range(args.reruns)]
+
+        def turn(i):
+            def action():
+                at.chat_input[0].set_value(f"Benchmark question {i}").run()
+                if at.exception:
+                    raise RuntimeError(f"App raised: {at.exception[0].value}")
+            return action
+        turns = [measure(counters, turn(i)) for i in range(args.turns)]
+
+        results.append({
+            "storage": args.storage,
+            "history": length,
+            "cold_rerun": summarize([cold]),
+            "warm_rerun": summarize(warm),
+            "turn": summarize(turns),
+        })
+
+    fake.stop()
+    return results
+
+
+def print_result(result):
+    print(f"\n== storage={result['storage']} history={result['history']} messages")
+    print(f"{'phase':<12}{'n':>4}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'db q':>8}{'db conn':>9}{'redis rt':>10}{'ollama':>8}")
+    for phase in ("cold_rerun", "warm_rerun", "turn"):
+        s = result[phase]
+        print(f"{phase:<12}{s['n']:>4}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+              f"{s['db_queries']:>8.1f}{s['db_connects']:>9.1f}{s['redis_round_trips']:>10.1f}"
+              f"{s['ollama_requests']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=lambda v: [int(x) for x in v.split(",")], default=[0, 100, 1000],
+                        help="comma-separated history lengths to seed (default: 0,100,1000)")
+    parser.add_argument("--reruns", type=int, default=10, help="warm reruns per history length")
+    parser.add_argument("--turns", type=int, default=10, help="chat turns per history length")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per fake response")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="fake tokens/sec (0 = unthrottled)")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake time to first token in seconds")
+    parser.add_argument("--storage", choices=("postgres", "sqlite"), default="postgres", help="storage backend")
+    parser.add_argument("--schema", default="chat_bench", help="PostgreSQL schema to (re)create")
+    parser.add_argument("--sqlite-path", default=os.path.join(tempfile.gettempdir(), "chat_bench.db"),
+                        help="SQLite file to (re)create")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds allowed per app run")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print_result(result)
+
+
+if __name__ == "__main__":
+    main()
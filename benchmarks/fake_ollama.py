@@ -0,0 +1,184 @@
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_MODELS = ["deepseek-r1:latest", "deepseek-v3:latest", "deepseek-coder:latest"]
+
+
+class FakeOllama:
+    """Local HTTP server speaking the parts of the Ollama API the app calls.
+
+    /api/chat streams `tokens` NDJSON chunks after `latency` seconds, at
+    `token_rate` tokens per second (0 streams as fast as possible). /api/ps
+    reports `loaded` (default: every model) as resident. Setting `down`
+    answers every request with 503, and `fail_after` drops chat streams
+    after that many chunks, to exercise failover.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, models=None, tokens=200, token_rate=0.0,
+                 latency=0.0, think=True, loaded=None, fail_after=None):
+        self.models = list(models or DEFAULT_MODELS)
+        self.loaded = list(self.models if loaded is None else loaded)
+        self.down = False
+        self.fail_after = fail_after
+        self.tokens = tokens
+        self.token_rate = token_rate
+        self.latency = latency
+        self.think = think
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def response_tokens(self):
+        body = [f"word{i} " for i in range(self.tokens)]
+        if self.think and body:
+            return ["<think>", "Reasoning ", "about it.", "</think>"] + body
+        return body
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _read_json(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _start_stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+            def _send_chunk(self, payload):
+                data = (json.dumps(payload) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _end_stream(self):
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                fake._count(self.path)
+                if fake.down:
+                    self._send_json({"error": "unavailable"}, status=503)
+                elif self.path == "/api/tags":
+                    self._send_json({"models": [
+                        {"name": m, "model": m, "size": 0, "digest": "0" * 64,
+                         "modified_at": datetime.now(timezone.utc).isoformat()} for m in fake.models]})
+                elif self.path == "/api/ps":
+                    self._send_json({"models": [{"name": m, "model": m, "size": 0} for m in fake.loaded]})
+                elif self.path in ("/", "/api/version"):
+                    self._send_json({"version": "0.0.0-fake"})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                fake._count(self.path)
+                request = self._read_json()
+                if fake.down:
+                    self._send_json({"error": "unavailable"}, status=503)
+                elif self.path == "/api/chat":
+                    self._chat(request)
+                elif self.path in ("/api/pull", "/api/generate"):
+                    if self.path == "/api/pull" and request.get("model") not in fake.models:
+                        fake.models.append(request.get("model"))
+                    if self.path == "/api/generate" and request.get("model") not in fake.loaded:
+                        fake.loaded.append(request.get("model"))
+                    if request.get("stream", True):
+                        self._start_stream()
+                        self._send_chunk({"status": "success", "done": True})
+                        self._end_stream()
+                    else:
+                        self._send_json({"status": "success", "done": True})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def _chat(self, request):
+                model = request.get("model")
+                if model not in fake.models:
+                    self._send_json({"error": f"model '{model}' not found"}, status=404)
+                    return
+                time.sleep(fake.latency)
+                interval = 1.0 / fake.token_rate if fake.token_rate > 0 else 0.0
+                created_at = datetime.now(timezone.utc).isoformat()
+                self._start_stream()
+                tokens = fake.response_tokens()
+                if model not in fake.loaded:
+                    fake.loaded.append(model)
+                for i, token in enumerate(tokens):
+                    if fake.fail_after is not None and i >= fake.fail_after:
+                        self.close_connection = True
+                        return
+                    self._send_chunk({"model": model, "created_at": created_at, "done": False,
+                                      "message": {"role": "assistant", "content": token}})
+                    if interval:
+                        time.sleep(interval)
+                self._send_chunk({"model": model, "created_at": created_at, "done": True,
+                                  "done_reason": "stop", "message": {"role": "assistant", "content": ""},
+                                  "eval_count": len(tokens)})
+                self._end_stream()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server for local benchmarking.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per response")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens per second (0 = unthrottled)")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    args = parser.parse_args()
+
+    server = FakeOllama(port=args.port, tokens=args.tokens, token_rate=args.token_rate, latency=args.latency).start()
+    print(f"Fake Ollama listening on {server.url} (set OLLAMA_HOST={server.url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Import-time and first-render profile of app.py.
+
+Imports the app in a fresh interpreter with `python -X importtime`, with the
+database, Redis and Ollama pointed at an unroutable address so any import
+that touches a backend shows up as a stall. Prints total wall time and the
+slowest imports, and exits non-zero when the total exceeds --budget.
+
+With --render-budget it also renders the first page headlessly (Streamlit
+AppTest) in another fresh interpreter against the same unreachable backends,
+and exits non-zero when that run exceeds the budget. Each unreachable backend
+should cost at most one connect timeout there, not a retry cycle.
+
+    python -m benchmarks.import_time --top 25 --budget 1.0
+    python -m benchmarks.import_time --render-budget 15
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UNREACHABLE = "10.255.255.1"
+
+# Each line of -X importtime: "import time: <self us> | <cumulative us> | <indented module>"
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+_PROBE = """
+import time
+start = time.perf_counter()
+import app
+print(f"__total__ {time.perf_counter() - start:.6f}")
+"""
+
+_RENDER_PROBE = """
+import time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=600)
+start = time.perf_counter()
+at.run()
+print(f"__render__ {time.perf_counter() - start:.6f}")
+"""
+
+
+def unreachable_env(module_env=None):
+    env = dict(os.environ)
+    env.update({
+        "DB_HOST": UNREACHABLE,
+        "REDIS_URL": f"redis://{UNREACHABLE}:6379",
+        "OLLAMA_HOST": f"http://{UNREACHABLE}:11434",
+        "LOG_LEVEL": "WARNING",
+    })
+    env.update(module_env or {})
+    return env
+
+
+def profile(module_env=None, python=sys.executable):
+    """Returns (total seconds, [(module, self_us, cumulative_us, depth)])."""
+    result = subprocess.run([python, "-X", "importtime", "-c", _PROBE], cwd=ROOT, env=unreachable_env(module_env),
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing app failed:\n{result.stderr[-4000:]}")
+
+    total = None
+    for line in result.stdout.splitlines():
+        if line.startswith("__total__ "):
+            total = float(line.split()[1])
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return total, modules
+
+
+def first_render(module_env=None, python=sys.executable):
+    """Returns the seconds the first script run of a fresh app takes."""
+    result = subprocess.run([python, "-c", _RENDER_PROBE], cwd=ROOT, env=unreachable_env(module_env),
+                            capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith("__render__ "):
+            return float(line.split()[1])
+    raise RuntimeError(f"Rendering app failed:\n{result.stderr[-4000:]}")
+
+
+def local_modules():
+    return {name[:-3] for name in os.listdir(ROOT) if name.endswith(".py")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=25, help="slowest imports to list")
+    parser.add_argument("--budget", type=float, default=1.0, help="max seconds to import app.py")
+    parser.add_argument("--storage", choices=("postgres", "sqlite"), default="postgres",
+                        help="STORAGE_BACKEND to import with")
+    parser.add_argument("--render-budget", type=float,
+                        help="also time the first render and fail above this many seconds")
+    args = parser.parse_args()
+
+    total, modules = profile({"STORAGE_BACKEND": args.storage})
+    ours = local_modules()
+
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for name, self_us, cumulative_us, depth in sorted(modules, key=lambda m: -m[2])[:args.top]:
+        marker = "*" if name.split(".")[0] in ours else " "
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f} {marker}{'  ' * depth}{name}")
+    print("(* = app module)")
+
+    app_self = sum(self_us for name, self_us, _, _ in modules if name.split(".")[0] in ours)
+    print(f"\nimport app: {total * 1000:.0f} ms total, {app_self / 1000:.1f} ms in app modules' own code")
+    over = total > args.budget
+    if over:
+        print(f"Over budget ({args.budget * 1000:.0f} ms)", file=sys.stderr)
+
+    if args.render_budget is not None:
+        render = first_render({"STORAGE_BACKEND": args.storage})
+        print(f"first render: {render * 1000:.0f} ms")
+        if render > args.render_budget:
+            print(f"Over render budget ({args.render_budget * 1000:.0f} ms)", file=sys.stderr)
+            over = True
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Routing and failover of the Ollama host pool against local fake servers.
+
+Starts --hosts fake Ollama servers (the first --loaded-on have the model
+resident, the rest only installed), sends --requests chats from --sessions
+sessions through the router, and takes one host down halfway through. It
+reports how requests were spread over the hosts, failovers and latency, and
+exits non-zero if any request failed.
+
+    python -m benchmarks.ollama_pool --hosts 3 --requests 300 --concurrency 12
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.chat_turn import percentile
+from benchmarks.fake_ollama import FakeOllama
+
+MODEL = "deepseek-r1:latest"
+
+
+def run(args):
+    from ollama_router import OllamaRouter
+    fakes = [FakeOllama(tokens=args.tokens, token_rate=args.token_rate, latency=args.latency,
+                        loaded=[MODEL] if i < args.loaded_on else []).start()
+             for i in range(args.hosts)]
+    router = OllamaRouter([f.url for f in fakes])
+    router.probe_all()
+
+    stop = threading.Event()
+
+    def probe_loop():
+        while not stop.wait(args.probe_interval):
+            router.probe_all()
+
+    prober = threading.Thread(target=probe_loop, daemon=True)
+    prober.start()
+
+    latencies, errors = [], []
+    done = 0
+    lock = threading.Lock()
+
+    def chat(i):
+        nonlocal done
+        messages = [{"role": "user", "content": f"Question {i}"}]
+        start = time.perf_counter()
+        try:
+            for _ in router.chat(MODEL, messages, session_key=i % args.sessions):
+                pass
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+        with lock:
+            done += 1
+            if done == args.requests // 2 and args.hosts > 1:
+                fakes[args.kill].down = True
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(chat, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+
+    hosts = router.stats()
+    for fake, host in zip(fakes, hosts):
+        host["chat_requests"] = fake.requests.get("/api/chat", 0)
+        host["down"] = fake.down
+        fake.stop()
+    ms = [s * 1000 for s in latencies]
+    return {
+        "requests": args.requests,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "seconds": elapsed,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "hosts": hosts,
+    }
+
+
+def print_result(result, file=sys.stdout):
+    print(f"{result['requests']} requests in {result['seconds']:.2f}s, {result['errors']} errors, "
+          f"p50 {result['p50_ms']:.0f} ms, p95 {result['p95_ms']:.0f} ms", file=file)
+    print(f"{'host':<28}{'chats':>8}{'healthy':>10}  loaded", file=file)
+    for host in result["hosts"]:
+        status = "down" if host["down"] else str(host["healthy"])
+        print(f"{host['host']:<28}{host['chat_requests']:>8}{status:>10}  {', '.join(host['loaded'])}", file=file)
+    for sample in result["error_samples"]:
+        print(f"  error: {sample}", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=3, help="fake Ollama servers in the pool")
+    parser.add_argument("--loaded-on", type=int, default=2, help="hosts that start with the model loaded")
+    parser.add_argument("--kill", type=int, default=0, help="index of the host taken down halfway")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--tokens", type=int, default=50, help="tokens per response")
+    parser.add_argument("--token-rate", type=float, default=500.0, help="tokens per second (0 = unthrottled)")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds before the first token")
+    parser.add_argument("--probe-interval", type=float, default=0.5, help="seconds between health probes")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_result(result)
+    if result["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Consistency of several app replicas sharing Redis and one database.
+
+Starts --replicas processes that each import the app's session cache and
+cluster bus, as a Streamlit replica would, against a shared database (a
+SQLite file by default) and a local Redis. The session list cache TTL is set
+to an hour, so only cross-replica invalidations can keep replicas current.
+The harness then creates, renames and deletes sessions on random replicas.
+After each change it polls every other replica until its session list
+matches, and it checks that each browser's active session, saved on one
+replica, reads back on another. It reports convergence latency and exits
+non-zero if a replica is still stale after --deadline seconds.
+
+    python -m benchmarks.replicas --replicas 4 --operations 200
+    python -m benchmarks.replicas --no-sync --operations 10 --deadline 0.2   # shows stale caches
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+from benchmarks.chat_turn import percentile, reset_schema
+
+
+def replica(conn, ready_timeout, schema):
+    """Serves commands from the harness; runs in a child process."""
+    import const
+    if schema:
+        const.DB_PARAMS["options"] = f"-c search_path={schema}"
+    import cluster
+    import config
+    from session_cache import get_session_names, invalidate_session_list
+
+    cluster.start_cluster_sync()
+    deadline = time.monotonic() + ready_timeout
+    # Changes published before the subscription is active would be missed
+    while cluster.get_cluster_bus().enabled and cluster.CLUSTER_RESYNCS.value() == 0:
+        if time.monotonic() > deadline:
+            conn.send(("error", "could not subscribe to the cluster channel"))
+            return
+        time.sleep(0.01)
+    conn.send(("ready", None))
+
+    while True:
+        command, *args = conn.recv()
+        try:
+            if command == "stop":
+                return
+            if command == "names":
+                result = get_session_names()
+            elif command == "create":
+                result = config.save_session(args[0], "bench-model")
+                invalidate_session_list()
+            elif command == "rename":
+                result = config.rename_session(*args)
+                invalidate_session_list()
+            elif command == "delete":
+                result = config.delete_session(args[0])
+                invalidate_session_list()
+            elif command == "set_active":
+                result = cluster.save_active_session(*args)
+            elif command == "get_active":
+                result = cluster.load_active_session(args[0])
+            else:
+                raise ValueError(f"Unknown command {command}")
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+
+
+class Replica:
+    def __init__(self, ctx, index, ready_timeout, schema=None):
+        self.index = index
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=replica, args=(child, ready_timeout, schema), daemon=True)
+        self.process.start()
+        status, result = self.conn.recv()
+        if status != "ready":
+            raise RuntimeError(f"Replica {index}: {result}")
+
+    def call(self, *command):
+        self.conn.send(command)
+        status, result = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Replica {self.index} {command[0]}: {result}")
+        return result
+
+    def stop(self):
+        self.conn.send(("stop",))
+        self.process.join(5)
+
+
+def setup_environment(args):
+    """Configures the replicas, which inherit this environment."""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["CLUSTER_SYNC"] = "0" if args.no_sync else "1"
+    os.environ["CLUSTER_CHANNEL"] = f"chat:bench:{uuid.uuid4().hex[:8]}"
+    os.environ["CACHE_BACKEND"] = "redis"
+    os.environ["SESSION_LIST_CACHE_TTL"] = "3600"
+    os.environ["STORAGE_BACKEND"] = args.storage
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+    if args.storage == "sqlite":
+        os.environ["SQLITE_PATH"] = args.sqlite_path
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.sqlite_path + suffix):
+                os.remove(args.sqlite_path + suffix)
+    else:
+        reset_schema(args.schema)
+
+
+def next_operation(rng, names, counter):
+    if len(names) < 3 or rng.random() < 0.4:
+        return ("create", f"bench-{counter}")
+    name = rng.choice(sorted(names))
+    if rng.random() < 0.5:
+        return ("rename", name, f"bench-{counter}")
+    return ("delete", name)
+
+
+def run(args):
+    ctx = multiprocessing.get_context("spawn")
+    schema = args.schema if args.storage == "postgres" else None
+    replicas = [Replica(ctx, i, args.ready_timeout, schema) for i in range(args.replicas)]
+    rng = random.Random(args.seed)
+    convergence, stale, active_mismatches = [], [], 0
+    try:
+        for r in replicas:
+            r.call("names")  # prime every replica's cache
+        for i in range(args.operations):
+            source = rng.choice(replicas)
+            operation = next_operation(rng, set(source.call("names")), i)
+            source.call(*operation)
+            # The source invalidated its own cache, so it reads the database
+            expected = source.call("names")
+            start = time.perf_counter()
+            for r in replicas:
+                if r is source:
+                    continue
+                while r.call("names") != expected:
+                    if time.perf_counter() - start > args.deadline:
+                        stale.append({"operation": operation, "replica": r.index})
+                        break
+                    time.sleep(0.001)
+                else:
+                    convergence.append(time.perf_counter() - start)
+
+            token, active = uuid.uuid4().hex, expected[0] if expected else "Default"
+            rng.choice(replicas).call("set_active", token, active)
+            if rng.choice(replicas).call("get_active", token) != active:
+                active_mismatches += 1
+    finally:
+        for r in replicas:
+            r.stop()
+
+    ms = [s * 1000 for s in convergence]
+    return {
+        "replicas": args.replicas,
+        "operations": args.operations,
+        "sync": not args.no_sync,
+        "converged": len(convergence),
+        "stale": len(stale),
+        "stale_samples": stale[:5],
+        "active_session_mismatches": active_mismatches,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "max_ms": max(ms) if ms else float("nan"),
+    }
+
+
+def print_result(result, file=sys.stdout):
+    print(f"{result['replicas']} replicas, {result['operations']} operations, "
+          f"cluster sync {'on' if result['sync'] else 'off'}", file=file)
+    print(f"converged {result['converged']}, stale {result['stale']}, "
+          f"active-session mismatches {result['active_session_mismatches']}", file=file)
+    print(f"convergence p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+          f"max {result['max_ms']:.1f} ms", file=file)
+    for sample in result["stale_samples"]:
+        print(f"  stale: replica {sample['replica']} after {sample['operation']}", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--operations", type=int, default=200, help="session changes to make")
+    parser.add_argument("--deadline", type=float, default=2.0, help="seconds a replica may take to converge")
+    parser.add_argument("--no-sync", action="store_true", help="run without cluster sync, for comparison")
+    parser.add_argument("--redis-url", help="Redis shared by the replicas (default: REDIS_URL)")
+    parser.add_argument("--storage", choices=("sqlite", "postgres"), default="sqlite")
+    parser.add_argument("--schema", default="chat_bench", help="PostgreSQL schema to (re)create")
+    parser.add_argument("--sqlite-path", default=os.path.join(tempfile.gettempdir(), "chat_bench_replicas.db"),
+                        help="SQLite file to (re)create")
+    parser.add_argument("--ready-timeout", type=float, default=10.0, help="seconds to wait for each replica")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    setup_environment(args)
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_result(result)
+    if result["stale"] or result["active_session_mismatches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
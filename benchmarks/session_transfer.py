@@ -0,0 +1,125 @@
+"""Throughput and peak memory of session export and import by data size.
+
+For each --messages size, seeds sessions of --per-session messages, exports
+them to NDJSON, empties the database and imports the file back. Peak Python
+memory should stay flat as the size grows: rows are streamed from a
+server-side cursor and imported in fixed-size batches. Timings include
+tracemalloc's overhead.
+
+    python -m benchmarks.session_transfer --messages 10000,100000 --storage sqlite
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.chat_turn import reset_schema
+
+
+def setup_environment(args):
+    """Points the app at a throwaway database; must run before any app module is imported."""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["STORAGE_BACKEND"] = args.storage
+    if args.storage == "sqlite":
+        os.environ["SQLITE_PATH"] = args.sqlite_path
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.sqlite_path + suffix):
+                os.remove(args.sqlite_path + suffix)
+    else:
+        import const
+        const.DB_PARAMS["options"] = f"-c search_path={args.schema}"
+        reset_schema(args.schema)
+
+
+def clear(storage):
+    with storage.connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM sessions;")
+
+
+def seed(storage, messages, per_session):
+    from message_format import normalize_message
+    start = datetime.utcnow() - timedelta(days=1)
+    content = "lorem ipsum dolor sit amet " * 20
+    for s in range(-(-messages // per_session)):
+        session_id = storage.save_session(f"bench-{s}", "bench-model")
+        rows = []
+        for i in range(min(per_session, messages - s * per_session)):
+            role = "user" if i % 2 == 0 else "assistant"
+            m = normalize_message(role, f"Message {i}: {content}")
+            rows.append((session_id, role, m["content"], start + timedelta(milliseconds=i),
+                         m["reasoning"], m["rendered"], m["tokens"]))
+        storage.save_messages(rows)
+
+
+def measure(fn, *args, **kwargs):
+    """Returns (result, seconds, peak traced KiB) of one call."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+        return result, time.perf_counter() - start, tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run(args):
+    from session_transfer import export_sessions, import_sessions
+    from storage import get_storage
+    storage = get_storage()
+    path = os.path.join(tempfile.gettempdir(), "chat_bench_export.ndjson")
+    results = []
+    for size in args.messages:
+        clear(storage)
+        seed(storage, size, args.per_session)
+        counts, export_s, export_kib = measure(export_sessions, path)
+        clear(storage)
+        with open(path, encoding="utf-8") as f:
+            imported, import_s, import_kib = measure(import_sessions, f)
+        if imported["messages"] != counts["messages"]:
+            raise RuntimeError(f"Imported {imported['messages']} of {counts['messages']} messages")
+        results.append({
+            "messages": size,
+            "file_mib": os.path.getsize(path) / 2 ** 20,
+            "export_rows_per_s": size / export_s,
+            "export_peak_kib": export_kib,
+            "import_rows_per_s": size / import_s,
+            "import_peak_kib": import_kib,
+        })
+    os.remove(path)
+    return results
+
+
+def print_results(results, file=sys.stdout):
+    print(f"{'messages':>10}{'file MiB':>10}{'export rows/s':>15}{'peak KiB':>10}"
+          f"{'import rows/s':>15}{'peak KiB':>10}", file=file)
+    for r in results:
+        print(f"{r['messages']:>10}{r['file_mib']:>10.1f}{r['export_rows_per_s']:>15.0f}{r['export_peak_kib']:>10.0f}"
+              f"{r['import_rows_per_s']:>15.0f}{r['import_peak_kib']:>10.0f}", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=lambda v: [int(x) for x in v.split(",")], default=[10000, 100000],
+                        help="comma-separated total message counts (default: 10000,100000)")
+    parser.add_argument("--per-session", type=int, default=200, help="messages per seeded session")
+    parser.add_argument("--storage", choices=("postgres", "sqlite"), default="postgres")
+    parser.add_argument("--schema", default="chat_bench", help="PostgreSQL schema to (re)create")
+    parser.add_argument("--sqlite-path", default=os.path.join(tempfile.gettempdir(), "chat_bench_transfer.db"),
+                        help="SQLite file to (re)create")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    setup_environment(args)
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Per-operation latency of the storage backends, side by side.
+
+Runs every Storage operation against each selected backend. PostgreSQL uses
+a throwaway schema on a local server (e.g. the docker-compose one); SQLite
+uses a throwaway file.
+
+    python -m benchmarks.storage_ops --backends postgres,sqlite --iterations 200
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.chat_turn import percentile, reset_schema
+
+OPERATIONS = (
+    "save_session", "get_session", "session_exists", "list_sessions", "rename_session",
+    "save_message", "save_messages", "get_chat_history_page", "get_chat_history_page_before",
+    "get_chat_history", "delete_session",
+)
+
+
+def open_postgres(args):
+    import psycopg2
+    from const import DB_PARAMS
+    from postgres_storage import PostgresStorage
+    reset_schema(args.schema)
+    params = {k: v for k, v in DB_PARAMS.items() if k != "options"}
+    return PostgresStorage(connect=lambda: psycopg2.connect(**params, options=f"-c search_path={args.schema}"))
+
+
+def open_sqlite(args):
+    from sqlite_storage import SqliteStorage
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.sqlite_path + suffix):
+            os.remove(args.sqlite_path + suffix)
+    return SqliteStorage(args.sqlite_path)
+
+
+BACKENDS = {"postgres": open_postgres, "sqlite": open_sqlite}
+
+
+def timed(samples, op, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    samples.setdefault(op, []).append(time.perf_counter() - start)
+    return result
+
+
+def run_backend(storage, args):
+    """Times each operation `iterations` times; returns {op: [seconds]}."""
+    samples = {}
+    n = args.iterations
+    start = datetime.utcnow() - timedelta(days=1)
+    content = "lorem ipsum dolor sit amet " * 20
+
+    # A session with a long history for the read paths
+    history_id = storage.save_session("bench-history", "bench-model")
+    rows = [(history_id, "user" if i % 2 == 0 else "assistant", f"Message {i}: {content}",
+             start + timedelta(milliseconds=i), None, None, None) for i in range(args.history)]
+    for offset in range(0, len(rows), 1000):
+        storage.save_messages(rows[offset:offset + 1000])
+    middle = (rows[len(rows) // 2][3], None) if rows else (start, None)
+
+    names = [f"bench-{i}" for i in range(n)]
+    ids = [timed(samples, "save_session", storage.save_session, name, "bench-model") for name in names]
+    for name in names:
+        timed(samples, "get_session", storage.get_session, name)
+        timed(samples, "session_exists", storage.session_exists, name)
+    for _ in range(n):
+        timed(samples, "list_sessions", storage.list_sessions)
+    for session_id in ids:
+        timed(samples, "save_message", storage.save_message, session_id, "user", content)
+    for i in range(n):
+        batch = [(ids[i], "assistant", content, start + timedelta(seconds=i, microseconds=j), None, None, None)
+                 for j in range(args.batch)]
+        timed(samples, "save_messages", storage.save_messages, batch)
+    for _ in range(n):
+        timed(samples, "get_chat_history_page", storage.get_chat_history_page, history_id, args.window)
+        timed(samples, "get_chat_history_page_before", storage.get_chat_history_page,
+              history_id, args.window, middle)
+        timed(samples, "get_chat_history", storage.get_chat_history, history_id)
+    for name in names:
+        timed(samples, "rename_session", storage.rename_session, name, f"{name}-renamed")
+    for name in names:
+        timed(samples, "delete_session", storage.delete_session, f"{name}-renamed")
+    return samples
+
+
+def summarize(seconds):
+    us = [s * 1_000_000 for s in seconds]
+    return {"n": len(us), "p50_us": percentile(us, 50), "p95_us": percentile(us, 95),
+            "p99_us": percentile(us, 99)}
+
+
+def print_results(results, file=sys.stdout):
+    backends = list(results)
+    header = f"{'operation':<30}" + "".join(f"{b + ' p50':>16}{b + ' p95':>16}" for b in backends)
+    print(header + "  (µs)", file=file)
+    for op in OPERATIONS:
+        line = f"{op:<30}"
+        for backend in backends:
+            s = results[backend].get(op)
+            line += f"{s['p50_us']:>16.0f}{s['p95_us']:>16.0f}" if s else f"{'-':>16}{'-':>16}"
+        print(line, file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", type=lambda v: v.split(","), default=["postgres", "sqlite"],
+                        help="comma-separated backends (default: postgres,sqlite)")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per operation")
+    parser.add_argument("--history", type=int, default=5000, help="messages in the session read back")
+    parser.add_argument("--window", type=int, default=50, help="page size of history reads")
+    parser.add_argument("--batch", type=int, default=20, help="rows per save_messages call")
+    parser.add_argument("--schema", default="chat_bench", help="PostgreSQL schema to (re)create")
+    parser.add_argument("--sqlite-path", default=os.path.join(tempfile.gettempdir(), "chat_bench_ops.db"),
+                        help="SQLite file to (re)create")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for backend in args.backends:
+        storage = BACKENDS[backend](args)
+        try:
+            samples = run_backend(storage, args)
+        finally:
+            storage.close()
+        results[backend] = {op: summarize(seconds) for op, seconds in samples.items()}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
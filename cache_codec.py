@@ -0,0 +1,148 @@
+import json
+import logging
+import threading
+import zlib
+from const import (CACHE_CODEC_SERIALIZER, CACHE_CODEC_COMPRESSION, CACHE_COMPRESS_MIN_BYTES,
+                   CACHE_COMPRESS_LEVEL)
+from metrics import counter
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Every encoded value starts with a 5-byte header: magic, format version,
+# serializer id and compression id. Decoding reads the ids from the header,
+# so values written under another configuration remain readable.
+MAGIC = b"CC"
+VERSION = 1
+HEADER_SIZE = len(MAGIC) + 3
+
+SERIALIZERS = {"json": 0, "msgpack": 1}
+COMPRESSIONS = {"none": 0, "zlib": 1, "zstd": 2}
+
+CACHE_CODEC_BYTES = counter(
+    "chat_cache_codec_bytes_total",
+    "Cache value bytes after serialization (packed) and after compression and header (encoded).",
+    labels=("codec", "form"))
+
+
+class CodecError(ValueError):
+    """Raised for values that were not written by a compatible codec."""
+
+
+_zstd = threading.local()  # zstandard (de)compressors are not thread-safe
+
+
+def _zstd_compressor(level):
+    compressor = getattr(_zstd, "compressor", None)
+    if compressor is None:
+        compressor = _zstd.compressor = zstandard.ZstdCompressor(level=level)
+    return compressor
+
+
+def _zstd_decompressor():
+    decompressor = getattr(_zstd, "decompressor", None)
+    if decompressor is None:
+        decompressor = _zstd.decompressor = zstandard.ZstdDecompressor()
+    return decompressor
+
+
+class CacheCodec:
+    """Serializes cache values to compact, self-describing bytes.
+
+    Values are packed with msgpack (or JSON), and compressed with zstd (or
+    zlib) once the packed size reaches `min_compress_bytes` and compression
+    actually saves space. Missing optional libraries fall back to JSON and
+    zlib.
+    """
+
+    def __init__(self, name, serializer=CACHE_CODEC_SERIALIZER, compression=CACHE_CODEC_COMPRESSION,
+                 min_compress_bytes=CACHE_COMPRESS_MIN_BYTES, level=CACHE_COMPRESS_LEVEL):
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"Unknown cache serializer: {serializer!r}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown cache compression: {compression!r}")
+        if serializer == "msgpack" and msgpack is None:
+            logger.warning("msgpack is not installed; caching with JSON. Install it using: pip install msgpack")
+            serializer = "json"
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed; compressing with zlib. Install it using: pip install zstandard")
+            compression = "zlib"
+        self.name = name
+        self.serializer = serializer
+        self.compression = compression
+        self.min_compress_bytes = min_compress_bytes
+        self.level = level
+
+    # Serialization
+
+    def _pack(self, value):
+        if self.serializer == "msgpack":
+            return msgpack.packb(value, use_bin_type=True)
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def _unpack(serializer_id, payload):
+        if serializer_id == SERIALIZERS["msgpack"]:
+            if msgpack is None:
+                raise CodecError("Value was written with msgpack, which is not installed")
+            return msgpack.unpackb(payload, raw=False)
+        if serializer_id == SERIALIZERS["json"]:
+            return json.loads(payload)
+        raise CodecError(f"Unknown serializer id {serializer_id}")
+
+    # Compression
+
+    def _compress(self, payload):
+        if self.compression == "zstd":
+            return _zstd_compressor(self.level if self.level is not None else 3).compress(payload)
+        return zlib.compress(payload, self.level if self.level is not None else 6)
+
+    @staticmethod
+    def _decompress(compression_id, payload):
+        if compression_id == COMPRESSIONS["none"]:
+            return payload
+        if compression_id == COMPRESSIONS["zlib"]:
+            return zlib.decompress(payload)
+        if compression_id == COMPRESSIONS["zstd"]:
+            if zstandard is None:
+                raise CodecError("Value was compressed with zstd, which is not installed")
+            return _zstd_decompressor().decompress(payload)
+        raise CodecError(f"Unknown compression id {compression_id}")
+
+    # Public API
+
+    def encode(self, value):
+        payload = self._pack(value)
+        CACHE_CODEC_BYTES.inc(len(payload), codec=self.name, form="packed")
+        compression = "none"
+        if self.compression != "none" and len(payload) >= self.min_compress_bytes:
+            compressed = self._compress(payload)
+            if len(compressed) < len(payload):
+                payload, compression = compressed, self.compression
+        header = MAGIC + bytes((VERSION, SERIALIZERS[self.serializer], COMPRESSIONS[compression]))
+        CACHE_CODEC_BYTES.inc(len(payload) + HEADER_SIZE, codec=self.name, form="encoded")
+        return header + payload
+
+    def decode(self, data):
+        if not isinstance(data, (bytes, bytearray, memoryview)) or data[:len(MAGIC)] != MAGIC:
+            raise CodecError("Missing cache codec header")
+        if len(data) < HEADER_SIZE:
+            raise CodecError("Truncated cache codec header")
+        version, serializer_id, compression_id = data[len(MAGIC):HEADER_SIZE]
+        if version != VERSION:
+            raise CodecError(f"Unsupported cache codec version {version}")
+        try:
+            return self._unpack(serializer_id, self._decompress(compression_id, bytes(data[HEADER_SIZE:])))
+        except CodecError:
+            raise
+        except Exception as e:
+            raise CodecError(f"Corrupted cache value: {e}") from e
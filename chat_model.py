@@ -1,37 +1,286 @@
 import streamlit as st
-from ollama import chat, list, pull
 import logging
-from const import DEFAULT_MODEL
+import threading
+import time
+from collections import OrderedDict, deque
+from const import (DEFAULT_MODEL, RESPONSE_CACHE_ENABLED, MODEL_CONCURRENCY, DEFAULT_MODEL_CONCURRENCY,
+                   CHAT_QUEUE_SIZE, CHAT_QUEUE_TIMEOUT)
+from model_registry import get_model_registry
+from model_lifecycle import get_model_lifecycle
+from ollama_router import get_ollama_router, normalize_model_name
+from metrics import span, counter, histogram, gauge
+from response_cache import get_cached_response, replay_response, caching_stream
 
 logger = logging.getLogger(__name__)
 
+CHAT_QUEUE_WAIT_SECONDS = histogram("chat_queue_wait_seconds", "Time a chat request waited for a model slot.",
+                                    labels=("model",))
+CHAT_REQUESTS_SHED = counter("chat_requests_shed_total",
+                             "Chat requests rejected because the model's queue was full or their deadline passed.",
+                             labels=("model", "reason"))
+
+
+class ModelBusyError(Exception):
+    """Raised when a chat request is shed by the scheduler."""
+
+
+class _Ticket:
+    __slots__ = ("model", "session_key", "start", "on_queue", "on_shed", "queued_at", "deadline", "position")
+
+    def __init__(self, model, session_key, start, on_queue, on_shed, queued_at, deadline):
+        self.model = model
+        self.session_key = session_key
+        self.start = start
+        self.on_queue = on_queue
+        self.on_shed = on_shed
+        self.queued_at = queued_at
+        self.deadline = deadline
+        self.position = None
+
+
+class _ModelQueue:
+    """Running count and per-session FIFO queues of one model, served round-robin."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = 0
+        self.size = 0
+        self.waiting = OrderedDict()  # session key -> deque of tickets, in serving order
+
+    def push(self, ticket):
+        self.waiting.setdefault(ticket.session_key, deque()).append(ticket)
+        self.size += 1
+
+    def remove(self, ticket):
+        tickets = self.waiting[ticket.session_key]
+        tickets.remove(ticket)
+        self.size -= 1
+        if not tickets:
+            del self.waiting[ticket.session_key]
+
+    def tickets(self):
+        return [ticket for tickets in self.waiting.values() for ticket in tickets]
+
+    def admit(self):
+        """Admits the head of the next session in turn while slots are free; returns the admitted tickets."""
+        admitted = []
+        while self.running < self.limit and self.size:
+            session_key, tickets = next(iter(self.waiting.items()))
+            ticket = tickets.popleft()
+            self.size -= 1
+            if tickets:
+                self.waiting.move_to_end(session_key)
+            else:
+                del self.waiting[session_key]
+            admitted.append(ticket)
+            self.running += 1
+        return admitted
+
+    def position(self, ticket):
+        """1-based place in the round-robin order: each round serves one request per session."""
+        tickets = self.waiting[ticket.session_key]
+        rank = tickets.index(ticket)
+        position = 1
+        before = True
+        for session_key, queued in self.waiting.items():
+            if session_key == ticket.session_key:
+                position += rank
+                before = False
+            else:
+                position += min(len(queued), rank) + (1 if before and len(queued) > rank else 0)
+        return position
+
+
+class ChatScheduler:
+    """Admission control in front of the model.
+
+    Each model runs at most its concurrency limit of requests at once. Further
+    requests wait in a bounded per-model queue that is served round-robin
+    across sessions, so one busy session cannot starve the others. Requests
+    are shed with ModelBusyError when the queue is full or when they have
+    waited longer than `queue_timeout` seconds. Waiting requests hold no
+    thread: each is started by whoever frees its slot.
+    """
+
+    def __init__(self, limits=MODEL_CONCURRENCY, default_limit=DEFAULT_MODEL_CONCURRENCY,
+                 queue_size=CHAT_QUEUE_SIZE, queue_timeout=CHAT_QUEUE_TIMEOUT):
+        self.limits = {normalize_model_name(name): limit for name, limit in limits.items()}
+        self.default_limit = default_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._queues = {}
+        self._cond = threading.Condition()
+        self._reaper = None
+
+    def _queue(self, model):
+        queue = self._queues.get(model)
+        if queue is None:
+            queue = self._queues[model] = _ModelQueue(max(1, self.limits.get(model, self.default_limit)))
+        return queue
+
+    def submit(self, model_name, session_key, start, on_queue=None, on_shed=None):
+        """Calls `start()` once the request may run, without blocking.
+
+        With a free slot `start` runs right away, otherwise on the thread whose
+        release() frees one. While queued, `on_queue(position)` reports the
+        request's place in the queue, and `on_queue(None)` its admission. A full
+        queue raises ModelBusyError; a request that waits past its deadline is
+        passed to `on_shed(error)` instead. The slot is held until release().
+        """
+        model = normalize_model_name(model_name)
+        now = time.monotonic()
+        ticket = _Ticket(model, session_key, start, on_queue, on_shed, now, now + self.queue_timeout)
+        with self._cond:
+            queue = self._queue(model)
+            if queue.running < queue.limit and not queue.size:
+                queue.running += 1
+                admitted = [ticket]
+            else:
+                if queue.size >= self.queue_size:
+                    CHAT_REQUESTS_SHED.inc(model=model, reason="full")
+                    raise ModelBusyError(f"{model} is busy and its queue is full. Please try again shortly.")
+                queue.push(ticket)
+                self._report_positions(queue)
+                self._start_reaper()
+                self._cond.notify_all()
+                admitted = []
+        self._start(admitted)
+
+    def release(self, model_name):
+        with self._cond:
+            queue = self._queue(normalize_model_name(model_name))
+            queue.running -= 1
+            admitted = queue.admit()
+            self._report_positions(queue)
+        self._start(admitted)
+
+    def _start(self, tickets):
+        for ticket in tickets:
+            CHAT_QUEUE_WAIT_SECONDS.observe(time.monotonic() - ticket.queued_at, model=ticket.model)
+            if ticket.on_queue is not None:
+                ticket.on_queue(None)
+            try:
+                ticket.start()
+            except Exception as e:
+                self.release(ticket.model)
+                if ticket.on_shed is None:
+                    raise
+                logger.error(f"Failed to start a request for {ticket.model}", exc_info=True)
+                ticket.on_shed(e)
+
+    @staticmethod
+    def _report_positions(queue):
+        for ticket in queue.tickets():
+            position = queue.position(ticket)
+            if position != ticket.position:
+                ticket.position = position
+                if ticket.on_queue is not None:
+                    ticket.on_queue(position)
+
+    def _start_reaper(self):
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._shed_expired, name="chat-queue-deadlines", daemon=True)
+            self._reaper.start()
+
+    def _shed_expired(self):
+        """Sheds queued requests whose deadline passed; runs on one background thread."""
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                expired = []
+                for queue in self._queues.values():
+                    late = [ticket for ticket in queue.tickets() if ticket.deadline <= now]
+                    for ticket in late:
+                        queue.remove(ticket)
+                    if late:
+                        self._report_positions(queue)
+                    expired += late
+                if not expired:
+                    deadlines = [ticket.deadline for queue in self._queues.values() for ticket in queue.tickets()]
+                    self._cond.wait(min(deadlines) - now if deadlines else None)
+                    continue
+            for ticket in expired:
+                CHAT_REQUESTS_SHED.inc(model=ticket.model, reason="deadline")
+                if ticket.on_shed is not None:
+                    ticket.on_shed(ModelBusyError(f"{ticket.model} is busy: the request waited "
+                                                  f"{self.queue_timeout:g}s without a free slot. "
+                                                  "Please try again shortly."))
+
+    def depth(self):
+        """Returns the number of requests waiting across all models."""
+        with self._cond:
+            return sum(queue.size for queue in self._queues.values())
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_chat_scheduler():
+    """Returns the process-wide chat scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = ChatScheduler()
+    return _scheduler
+
+
+gauge("chat_queue_depth", "Chat requests waiting for a model slot.",
+      lambda: _scheduler.depth() if _scheduler else None)
+
+
 def ensure_model_available(model_name):
-    """Ensures the model is available, returns True if available, False otherwise."""
+    """Ensures the model is available, returns True if available, False otherwise.
+
+    Reads the registry's cached inventory; a missing model is pulled on a
+    background thread and reported as unavailable until the pull finishes.
+    """
     try:
-        available_models = [model.model for model in list().models]
-        if model_name in available_models:
+        registry = get_model_registry()
+        with span("model.ensure_available"):
+            available = registry.is_available(model_name)
+        if available:
             return True
-            
-        # Model not found, attempt to pull it
-        logger.info(f"Model {model_name} not found, attempting to pull...")
-        st.info(f"⌛ Pulling model {model_name}... This may take a few minutes.")
-        pull(model_name)
-        
-        # Verify model was pulled successfully
-        available_models = [model.model for model in list().models]
-        return model_name in available_models
-        
+        if not registry.reachable:
+            return False
+
+        # Model not found, pull it without blocking the script
+        job = registry.start_pull(model_name)
+        return job.status == "success"
+
     except Exception as e:
         logger.error(f"Error checking/pulling model {model_name}", exc_info=True)
         return False
 
-def get_chat_model(model_name=DEFAULT_MODEL):
-    """Returns a cached instance of the chat model based on the selected model."""
+def render_pull_progress(job):
+    """Shows the progress of a background model pull, or its error with a retry button."""
+    if job.status == "failed":
+        st.error(f"⚠️ Pulling model '{job.model_name}' failed: {job.error}")
+        st.code(f"ollama pull {job.model_name}", language="bash")
+        st.button("🔁 Retry pull", key=f"pull_retry_{job.model_name}",
+                  on_click=get_model_registry().start_pull, args=(job.model_name,), kwargs={"retry": True})
+        return
+    st.info(f"⌛ Pulling model {job.model_name}... This may take a few minutes.")
+    st.progress(job.progress(), text=f"{job.progress():.0%}")
+    st.button("🔄 Check again", key=f"pull_refresh_{job.model_name}")
+
+def get_chat_model(model_name=DEFAULT_MODEL, session_key=None):
+    """Returns a cached instance of the chat model based on the selected model.
+
+    Requests are routed across the Ollama host pool; `session_key` keeps a
+    session on the same host while that host is not overloaded.
+    """
     try:
         # Check if model is available
         if not ensure_model_available(model_name):
+            registry = get_model_registry()
+            job = registry.get_pull(model_name)
+            if job is not None:
+                render_pull_progress(job)
+                st.stop()
             st.error(f"⚠️ Model '{model_name}' could not be loaded.")
-            available_models = [model.model for model in list().models]
+            available_models = sorted(registry.models())
             if available_models:
                 st.info(f"💡 Available models: {', '.join(available_models)}")
                 st.code(f"ollama pull {model_name}", language="bash")
@@ -39,10 +288,34 @@ def get_chat_model(model_name=DEFAULT_MODEL):
                 st.warning("⚠️ No models available. Please ensure Ollama is running and try again.")
             st.stop()
             
-        # Create chat function with error handling
-        def chat_with_error_handling(messages):
+        # Create chat function with error handling; requests to the model go through the scheduler
+        def chat_with_error_handling(messages, start, on_queue=None, on_shed=None):
+            """Calls `start(stream)` with the model's response once the scheduler admits the request,
+            or `start(stream, live=False)` with a cached response."""
             try:
-                return chat(model=model_name, messages=messages, stream=True)
+                if RESPONSE_CACHE_ENABLED:
+                    cached = get_cached_response(model_name, messages)
+                    if cached is not None:
+                        logger.info(f"Response cache hit for {model_name}")
+                        return start(replay_response(cached), live=False)
+
+                scheduler = get_chat_scheduler()
+
+                def generate():
+                    # Holds the model slot until the stream ends
+                    try:
+                        yield from get_ollama_router().chat(model_name, messages, session_key=session_key,
+                                                            keep_alive=get_model_lifecycle().keep_alive(model_name))
+                    finally:
+                        scheduler.release(model_name)
+
+                def admitted():
+                    stream = generate()
+                    start(caching_stream(model_name, messages, stream) if RESPONSE_CACHE_ENABLED else stream)
+
+                scheduler.submit(model_name, session_key, admitted, on_queue, on_shed)
+            except ModelBusyError:
+                raise
             except Exception as e:
                 logger.error(f"Error in chat model response", exc_info=True)
                 raise Exception(f"Failed to get response from model: {str(e)}")
@@ -0,0 +1,190 @@
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from config import get_cache, get_redis_connection
+from const import CLUSTER_SYNC, CLUSTER_CHANNEL, CLIENT_STATE_TTL, CACHE_BACKEND
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_MESSAGES = counter(
+    "chat_cluster_messages_total",
+    "Cache invalidations exchanged with other replicas, by event and direction (sent, received, send_error).",
+    labels=("event", "direction"))
+CLUSTER_RESYNCS = counter(
+    "chat_cluster_resyncs_total", "Local caches dropped after (re)subscribing to the cluster channel.")
+
+RECONNECT_DELAY = 1  # seconds
+HEALTH_CHECK_INTERVAL = 10  # seconds between pings of an idle subscription
+
+# event -> handlers that drop this process's copy of the data
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def subscribe(event, handler):
+    """Registers handler(**payload) to run on every replica when `event` is published."""
+    with _handlers_lock:
+        _handlers.setdefault(event, []).append(handler)
+
+
+def _dispatch(event, payload):
+    with _handlers_lock:
+        handlers = list(_handlers.get(event, ()))
+    for handler in handlers:
+        try:
+            handler(**payload)
+        except Exception:
+            logger.error(f"Failed to apply cluster event {event}", exc_info=True)
+
+
+class ClusterBus:
+    """Applies cache invalidations on every replica over Redis pub/sub.
+
+    Replicas keep process-local caches (the session list, the model
+    inventory). A change is applied to this process first, then published;
+    a listener thread on every other replica applies it there. Pub/sub
+    delivers at most once, so after each (re)subscription every handler runs
+    without a payload, as if all events had been missed. While Redis is
+    unreachable, cache TTLs still bound how stale a replica can get.
+    """
+
+    def __init__(self, channel=CLUSTER_CHANNEL, enabled=CLUSTER_SYNC, connect=None):
+        self.node_id = uuid.uuid4().hex[:12]
+        self.channel = channel
+        self.enabled = enabled
+        self._connect = connect or (lambda: get_redis_connection(health_check_interval=HEALTH_CHECK_INTERVAL))
+        self._redis = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, event, **payload):
+        """Applies an event here and sends it to the other replicas."""
+        _dispatch(event, payload)
+        if not self.enabled:
+            return
+        try:
+            if self._redis is None:
+                self._redis = self._connect()
+            self._redis.publish(self.channel, json.dumps({"node": self.node_id, "event": event, "payload": payload}))
+            CLUSTER_MESSAGES.inc(event=event, direction="sent")
+        except Exception:
+            CLUSTER_MESSAGES.inc(event=event, direction="send_error")
+            logger.error(f"Failed to publish {event} to other replicas", exc_info=True)
+
+    def start(self):
+        """Starts the listener thread, once per process."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._listen, name="cluster-listener", daemon=True)
+            self._thread.start()
+        if CACHE_BACKEND == "local":
+            logger.warning("CLUSTER_SYNC is on with CACHE_BACKEND=local: each replica caches chat histories "
+                           "and client state separately; use Redis")
+        logger.info(f"Cluster sync on {self.channel} as replica {self.node_id}")
+
+    def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._connect().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self._resync()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._receive(message["data"])
+            except Exception as e:
+                logger.warning(f"Lost the cluster channel, reconnecting: {e}")
+                time.sleep(RECONNECT_DELAY)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _resync(self):
+        CLUSTER_RESYNCS.inc()
+        with _handlers_lock:
+            events = list(_handlers)
+        for event in events:
+            _dispatch(event, {})
+
+    def _receive(self, data):
+        try:
+            message = json.loads(data)
+            event = message["event"]
+        except (ValueError, TypeError, KeyError):
+            logger.warning(f"Ignoring malformed cluster message: {data!r}")
+            return
+        if message.get("node") == self.node_id:
+            return
+        CLUSTER_MESSAGES.inc(event=event, direction="received")
+        _dispatch(event, message.get("payload") or {})
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_cluster_bus():
+    """Returns the process-wide cluster bus."""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = ClusterBus()
+    return _bus
+
+
+def publish(event, **payload):
+    """Applies an event on this and, with CLUSTER_SYNC, every other replica."""
+    get_cluster_bus().publish(event, **payload)
+
+
+def start_cluster_sync():
+    """Starts listening for other replicas' invalidations; safe to call on every rerun."""
+    try:
+        get_cluster_bus().start()
+    except Exception:
+        logger.error("Failed to start cluster sync", exc_info=True)
+
+
+# Per-browser state shared by all replicas, keyed by a random token the
+# browser keeps in its URL
+_CLIENT_TOKEN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_client_token():
+    return uuid.uuid4().hex
+
+
+def valid_client_token(token):
+    return bool(token) and _CLIENT_TOKEN.match(token) is not None
+
+
+def _active_session_key(token):
+    return f"client:{token}:active_session"
+
+
+def save_active_session(token, session_name):
+    try:
+        get_cache().set(_active_session_key(token), session_name, ex=CLIENT_STATE_TTL)
+    except Exception:
+        logger.error("Failed to save the active session", exc_info=True)
+
+
+def load_active_session(token):
+    """Returns the session this browser last had open on any replica, or None."""
+    try:
+        return get_cache().get(_active_session_key(token))
+    except Exception:
+        logger.error("Failed to load the active session", exc_info=True)
+        return None
@@ -1,22 +1,22 @@
 from utils import logger
-import redis
 import time
-from const import DB_PARAMS, REDIS_URL
-
-try:
-    import psycopg2
-except ImportError as e:
-    logger.error("Failed to import psycopg2. Please install it using: pip install psycopg2", exc_info=True)
-    raise
+import threading
+from const import (REDIS_URL, REDIS_CONNECT_TIMEOUT, REDIS_SOCKET_TIMEOUT, CACHE_BACKEND, LOCAL_CACHE_MAX_KEYS,
+                   OLLAMA_HOST, OLLAMA_CONNECT_TIMEOUT)
+from metrics import timed_query, gauge
+from storage import get_storage, current_storage
 
 MAX_RETRIES = 3
 RETRY_DELAY = 1  # seconds
 
 # Redis Connection with retries
-def get_redis_connection():
+def get_redis_connection(decode_responses=True, **kwargs):
+    import redis
     for attempt in range(MAX_RETRIES):
         try:
-            return redis.Redis.from_url(REDIS_URL, decode_responses=True)
+            return redis.Redis.from_url(REDIS_URL, decode_responses=decode_responses,
+                                        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                                        socket_timeout=REDIS_SOCKET_TIMEOUT, **kwargs)
         except Exception as e:
             if attempt == MAX_RETRIES - 1:
                 logger.error(f"Failed to connect to Redis after {MAX_RETRIES} attempts", exc_info=True)
@@ -24,84 +24,201 @@ def get_redis_connection():
             logger.warning(f"Redis connection attempt {attempt + 1} failed, retrying...")
             time.sleep(RETRY_DELAY)
 
-# Initialize Redis client
-try:
-    redis_client = get_redis_connection()
-except Exception as e:
-    logger.error("Failed to initialize Redis client", exc_info=True)
-    raise
+_cache_clients = {}
+_cache_lock = threading.Lock()
 
-def get_db_connection():
-    last_error = None
-    for attempt in range(MAX_RETRIES):
-        try:
-            conn = psycopg2.connect(**DB_PARAMS)
-            # Test the connection
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1")
-            return conn
-        except Exception as e:
-            last_error = e
-            if attempt == MAX_RETRIES - 1:
-                logger.error(f"Failed to connect to PostgreSQL database after {MAX_RETRIES} attempts", exc_info=True)
-                logger.error(f"Database parameters: host={DB_PARAMS['host']}, port={DB_PARAMS['port']}, dbname={DB_PARAMS['dbname']}, user={DB_PARAMS['user']}")
-                raise
-            logger.warning(f"Database connection attempt {attempt + 1} failed, retrying...")
-            time.sleep(RETRY_DELAY)
+def get_cache(binary=False):
+    """Returns a process-wide cache client: Redis, or the in-process LRU cache
+    when CACHE_BACKEND=local (the default with SQLite storage).
 
-# Save session details
+    The default client decodes replies to str; the binary one returns raw
+    bytes, for values written by a cache codec.
+    """
+    client = _cache_clients.get(binary)
+    if client is None:
+        with _cache_lock:
+            client = _cache_clients.get(binary)
+            if client is None:
+                if CACHE_BACKEND == "local":
+                    from local_cache import LocalCache
+                    client = LocalCache(max_keys=LOCAL_CACHE_MAX_KEYS, decode_responses=not binary)
+                else:
+                    try:
+                        client = get_redis_connection(decode_responses=not binary)
+                    except Exception as e:
+                        logger.error("Failed to initialize Redis client", exc_info=True)
+                        raise
+                _cache_clients[binary] = client
+    return client
+
+_ollama_clients = {}
+_ollama_lock = threading.Lock()
+
+def get_ollama_client(host=OLLAMA_HOST):
+    """Returns the process-wide Ollama client for a host; the ollama package is imported on first use."""
+    client = _ollama_clients.get(host)
+    if client is None:
+        with _ollama_lock:
+            client = _ollama_clients.get(host)
+            if client is None:
+                import httpx
+                import ollama
+                client = ollama.Client(host=host, timeout=httpx.Timeout(None, connect=OLLAMA_CONNECT_TIMEOUT))
+                _ollama_clients[host] = client
+    return client
+
+def _pool_stat(name):
+    storage = current_storage()
+    return storage.stats().get(name) if storage else None
+
+gauge("chat_db_pool_in_use", "Database connections currently checked out.", lambda: _pool_stat("in_use"))
+gauge("chat_db_pool_size", "Database connections currently open.", lambda: _pool_stat("size"))
+gauge("chat_db_pool_wait_ms_max", "Longest wait for a pooled connection, in milliseconds.", lambda: _pool_stat("wait_ms_max"))
+
+# Save session details; returns the new id, or None if the name is taken
+@timed_query("save_session")
 def save_session(name, model):
     try:
-        with get_db_connection() as conn, conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO sessions (name, model) VALUES (%s, %s) ON CONFLICT (name) DO NOTHING RETURNING id;",
-                (name, model)
-            )
-            session_id = cur.fetchone()
-            conn.commit()
-            return session_id
+        return get_storage().save_session(name, model)
     except Exception as e:
         logger.error(f"Failed to save session. name={name}, model={model}", exc_info=True)
         raise
 
-# Fetch session by name
+# Fetch session (id, model) by name
+@timed_query("get_session")
 def get_session(name):
     try:
-        with get_db_connection() as conn, conn.cursor() as cur:
-            cur.execute("SELECT id, model FROM sessions WHERE name = %s;", (name,))
-            return cur.fetchone()
+        return get_storage().get_session(name)
     except Exception as e:
         logger.error(f"Failed to get session. name={name}", exc_info=True)
         raise
 
-# Fetch all session names
+# Fetch (name, model) of all sessions, newest first
+@timed_query("list_sessions")
+def list_sessions():
+    try:
+        return get_storage().list_sessions()
+    except Exception as e:
+        logger.error("Failed to list sessions", exc_info=True)
+        raise
+
+# Fetch all session names, newest first
 def get_all_sessions():
+    return [name for name, _ in list_sessions()]
+
+# Check whether a session name is taken
+@timed_query("session_exists")
+def session_exists(name):
+    try:
+        return get_storage().session_exists(name)
+    except Exception as e:
+        logger.error(f"Failed to check session. name={name}", exc_info=True)
+        raise
+
+# Rename a session
+@timed_query("rename_session")
+def rename_session(old_name, new_name):
     try:
-        with get_db_connection() as conn, conn.cursor() as cur:
-            cur.execute("SELECT name FROM sessions;")
-            return [row[0] for row in cur.fetchall()]
+        return get_storage().rename_session(old_name, new_name)
     except Exception as e:
-        logger.error("Failed to get all sessions", exc_info=True)
+        logger.error(f"Failed to rename session. old_name={old_name}, new_name={new_name}", exc_info=True)
+        raise
+
+# Delete a session and its messages; returns its id, or None
+@timed_query("delete_session")
+def delete_session(name):
+    try:
+        return get_storage().delete_session(name)
+    except Exception as e:
+        logger.error(f"Failed to delete session. name={name}", exc_info=True)
         raise
 
 # Save message
-def save_message(session_id, role, content):
+@timed_query("save_message")
+def save_message(session_id, role, content, reasoning=None, rendered=None, tokens=None):
     try:
-        with get_db_connection() as conn, conn.cursor() as cur:
-            cur.execute("INSERT INTO messages (session_id, role, content) VALUES (%s, %s, %s);",
-                        (session_id, role, content))
-            conn.commit()
+        return get_storage().save_message(session_id, role, content, reasoning, rendered, tokens)
     except Exception as e:
         logger.error(f"Failed to save message. session_id={session_id}, role={role}", exc_info=True)
         raise
 
+# Save a batch of messages in one transaction
+@timed_query("save_messages")
+def save_messages(rows):
+    """Inserts (session_id, role, content, created_at, reasoning, rendered, tokens) rows in order, in one transaction.
+
+    Rows whose session has been deleted in the meantime are skipped.
+    """
+    try:
+        get_storage().save_messages(rows)
+    except Exception as e:
+        logger.error(f"Failed to save {len(rows)} messages", exc_info=True)
+        raise
+
+def is_transient_db_error(error):
+    """Whether a failed database call may succeed when retried."""
+    return get_storage().is_transient_error(error)
+
 # Fetch chat history from database
+@timed_query("get_chat_history")
 def get_chat_history(session_id):
     try:
-        with get_db_connection() as conn, conn.cursor() as cur:
-            cur.execute(
-                "SELECT role, content FROM messages WHERE session_id = %s ORDER BY created_at ASC;", (session_id,))
-            return cur.fetchall()
+        return get_storage().get_chat_history(session_id)
     except Exception as e:
         logger.error(f"Failed to get chat history. session_id={session_id}", exc_info=True)
         raise
+
+# Fetch one page of chat history using keyset pagination
+@timed_query("get_chat_history_page")
+def get_chat_history_page(session_id, limit, before=None, after=None):
+    """Returns up to `limit` of the newest messages older than `before` and newer
+    than `after` (both (created_at, id) cursors), ordered oldest first."""
+    try:
+        return get_storage().get_chat_history_page(session_id, limit, before=before, after=after)
+    except Exception as e:
+        logger.error(f"Failed to get chat history page. session_id={session_id}, before={before}, after={after}", exc_info=True)
+        raise
+
+# Full-text search over all messages, best matches first
+@timed_query("search_messages")
+def search_messages(query, limit, offset=0):
+    try:
+        return get_storage().search_messages(query, limit, offset)
+    except Exception as e:
+        logger.error(f"Failed to search messages. query={query!r}, offset={offset}", exc_info=True)
+        raise
+
+# Messages stored before they were normalized on write
+@timed_query("get_unnormalized_messages")
+def get_unnormalized_messages(limit, after=0):
+    try:
+        return get_storage().get_unnormalized_messages(limit, after)
+    except Exception as e:
+        logger.error(f"Failed to load unnormalized messages. after={after}", exc_info=True)
+        raise
+
+@timed_query("save_normalized_messages")
+def save_normalized_messages(rows):
+    try:
+        get_storage().save_normalized_messages(rows)
+    except Exception as e:
+        logger.error(f"Failed to save {len(rows)} normalized messages", exc_info=True)
+        raise
+
+# Stream every session and its messages, resuming after a cursor
+def iter_export_rows(after=None):
+    """Yields export rows (see Storage.iter_export_rows) from a server-side cursor."""
+    try:
+        yield from get_storage().iter_export_rows(after)
+    except Exception as e:
+        logger.error(f"Failed to export sessions. after={after}", exc_info=True)
+        raise
+
+# Import sessions and messages in one transaction
+@timed_query("import_rows")
+def import_rows(records):
+    try:
+        return get_storage().import_rows(records)
+    except Exception as e:
+        logger.error("Failed to import sessions", exc_info=True)
+        raise
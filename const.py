@@ -15,17 +15,165 @@ AVAILABLE_MODELS = [
     "deepseek-coder"
 ]
 
+# Prompt token budget per model, leaving the rest of the context window for the reply
+MODEL_CONTEXT_BUDGETS = {
+    "deepseek-r1:latest": 6144,
+    "deepseek-v3": 6144,
+    "deepseek-coder": 12288
+}
+DEFAULT_CONTEXT_BUDGET = 4096
+
 # Load environment variables from the .env file
 load_dotenv()
 
+# Models whose chat template opens the <think> block in the prompt, by name without
+# the tag, so their output may only contain the closing tag
+REASONING_MODELS = [name.strip() for name in os.getenv("REASONING_MODELS", "deepseek-r1").split(",") if name.strip()]
+
+# Ollama model inventory: cache lifetime, background refresh period, and how long a
+# failed refresh is cached before chat turns trigger another one, in seconds
+MODEL_INVENTORY_TTL = float(os.getenv("MODEL_INVENTORY_TTL", "60"))
+MODEL_INVENTORY_REFRESH_INTERVAL = float(os.getenv("MODEL_INVENTORY_REFRESH_INTERVAL", "30"))
+MODEL_INVENTORY_FAILURE_TTL = float(os.getenv("MODEL_INVENTORY_FAILURE_TTL", "10"))
+
+# System prompt sent ahead of every conversation (set SYSTEM_PROMPT= to disable)
+SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT", DEFAULT_MESSAGE["Default"][0]["content"])
+
+# Streaming renderer: max repaints per second and pending characters forcing a repaint
+STREAM_RENDER_FPS = float(os.getenv("STREAM_RENDER_FPS", "15"))
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "2048"))
+
+# Logging: level, queue depth of the background writer and per-category sampling.
+# A rule keeps one record in `every` and at most `per_second` per second;
+# categories are set with extra={"category": ...} or default to the logger name.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLING = {
+    "stream.chunk": {"every": 100, "per_second": 5},
+    "model.request": {"per_second": 10},
+    "httpx": {"per_second": 2},
+}
+
+# Metrics: Prometheus endpoint port (0 disables it) and the sidebar admin panel
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+SHOW_METRICS_PANEL = os.getenv("SHOW_METRICS_PANEL", "0") == "1"
+
+# Storage backend: "postgres", or "sqlite" for an embedded single-file database
+# that needs no containers (SQLITE_PATH is created on first start)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/chat.db")
+
+# Multiple replicas behind a load balancer: share cache invalidations over Redis
+# pub/sub on CLUSTER_CHANNEL, and keep each browser's active session in Redis for
+# CLIENT_STATE_TTL seconds so any replica can serve it (no sticky sessions needed)
+CLUSTER_SYNC = os.getenv("CLUSTER_SYNC", "0") == "1"
+CLUSTER_CHANNEL = os.getenv("CLUSTER_CHANNEL", "chat:invalidations")
+CLIENT_STATE_TTL = int(os.getenv("CLIENT_STATE_TTL", str(30 * 24 * 3600)))
+
+# Cache backend: "redis", or "local" for an in-process LRU cache bounded to
+# LOCAL_CACHE_MAX_KEYS keys (the default with SQLite storage on a single node)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local" if STORAGE_BACKEND == "sqlite" and not CLUSTER_SYNC
+                          else "redis").lower()
+LOCAL_CACHE_MAX_KEYS = int(os.getenv("LOCAL_CACHE_MAX_KEYS", "10000"))
+
 # PostgreSQL Connection
 DB_PARAMS = {
     "dbname": os.getenv("DB_NAME"),
     "user": os.getenv("DB_USER"),
     "password": os.getenv("DB_PASSWORD"),
     "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT")
+    "port": os.getenv("DB_PORT"),
+    # Bounds how long an unreachable database can stall a page render
+    "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
 }
 
 # Redis Connection
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))  # seconds
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))  # seconds per command
+
+# Ollama server (None uses the client default, http://localhost:11434) and
+# seconds allowed to establish a connection; streamed replies have no read timeout
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+
+# Ollama host pool: comma-separated base URLs (defaults to OLLAMA_HOST). Hosts are
+# probed every MODEL_INVENTORY_REFRESH_INTERVAL. Requests beyond OLLAMA_HOST_PARALLEL
+# per host spill over to hosts without the model loaded; a session stays on its last
+# host while it has at most OLLAMA_AFFINITY_SLACK more requests in flight than the best one
+OLLAMA_HOSTS = [h.strip() for h in os.getenv("OLLAMA_HOSTS", OLLAMA_HOST or "http://localhost:11434").split(",")
+                if h.strip()]
+OLLAMA_HOST_PARALLEL = int(os.getenv("OLLAMA_HOST_PARALLEL", "4"))
+OLLAMA_AFFINITY_SLACK = int(os.getenv("OLLAMA_AFFINITY_SLACK", "1"))
+
+# Chat scheduler: concurrent requests per model (MODEL_CONCURRENCY="name=limit,...",
+# others default to the pool's capacity), queued requests per model, and seconds a
+# request may wait for a slot before it is shed
+MODEL_CONCURRENCY = {name.strip(): int(limit) for name, limit in
+                     (item.split("=", 1) for item in os.getenv("MODEL_CONCURRENCY", "").split(",") if "=" in item)}
+DEFAULT_MODEL_CONCURRENCY = int(os.getenv("DEFAULT_MODEL_CONCURRENCY", str(OLLAMA_HOST_PARALLEL * len(OLLAMA_HOSTS))))
+CHAT_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", "32"))
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "120"))
+
+# Model lifecycle: models loaded at start-up (MODEL_PRELOAD= to disable), and how long
+# Ollama keeps a model in memory after its last request, as an Ollama duration such as
+# "30m" or seconds ("-1" keeps it loaded), per model (MODEL_KEEP_ALIVE="name=30m,...")
+MODEL_PRELOAD = [name.strip() for name in os.getenv("MODEL_PRELOAD", DEFAULT_MODEL).split(",") if name.strip()]
+MODEL_KEEP_ALIVE = {name.strip(): value.strip() for name, value in
+                    (item.split("=", 1) for item in os.getenv("MODEL_KEEP_ALIVE", "").split(",") if "=" in item)}
+DEFAULT_KEEP_ALIVE = os.getenv("DEFAULT_KEEP_ALIVE", "30m")
+
+# PostgreSQL connection pool
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))  # seconds to wait for a free connection
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30"))  # idle seconds before probing
+DB_POOL_LEAK_THRESHOLD = float(os.getenv("DB_POOL_LEAK_THRESHOLD", "30"))  # seconds a checkout may be held
+DB_POOL_TRACK_STACKS = os.getenv("DB_POOL_TRACK_STACKS", "0") == "1"
+DB_POOL_CONNECT_BACKOFF = float(os.getenv("DB_POOL_CONNECT_BACKOFF", "5"))  # seconds to fail fast after a failed connect
+
+# Redis history cache
+HISTORY_CACHE_TTL = int(os.getenv("HISTORY_CACHE_TTL", "3600"))  # sliding expiry in seconds
+
+# Cache codec for history entries: serializer ("msgpack" or "json"), compression
+# ("zstd", "zlib" or "none"), packed size in bytes from which values are
+# compressed, and compression level (empty for the library default)
+CACHE_CODEC_SERIALIZER = os.getenv("CACHE_CODEC_SERIALIZER", "msgpack").lower()
+CACHE_CODEC_COMPRESSION = os.getenv("CACHE_CODEC_COMPRESSION", "zstd").lower()
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024"))
+CACHE_COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL")) if os.getenv("CACHE_COMPRESS_LEVEL") else None
+
+# Background generation: worker threads, and seconds a finished job is kept for re-attaching.
+# Only requests admitted by the chat scheduler take a worker, so keep this at or above
+# the models' combined concurrency limits
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "64"))
+GENERATION_JOB_RETENTION = float(os.getenv("GENERATION_JOB_RETENTION", "600"))
+
+# Write-behind message persistence: max rows per INSERT, max seconds a message
+# waits before its batch is committed, and queue bound for backpressure
+MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", "100"))
+MESSAGE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_FLUSH_INTERVAL", "0.05"))
+MESSAGE_QUEUE_SIZE = int(os.getenv("MESSAGE_QUEUE_SIZE", "10000"))
+
+# Exact-match response cache (opt-in): entries expire after the TTL and the
+# least recently used ones are evicted beyond the size limit
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0") == "1"
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+# Sidebar session list: process cache lifetime (seconds) and sessions per page
+SESSION_LIST_CACHE_TTL = float(os.getenv("SESSION_LIST_CACHE_TTL", "30"))
+SESSION_PAGE_SIZE = int(os.getenv("SESSION_PAGE_SIZE", "20"))
+
+# Full-text message search: results per page in the sidebar
+MESSAGE_SEARCH_PAGE_SIZE = int(os.getenv("MESSAGE_SEARCH_PAGE_SIZE", "10"))
+
+# Session export/import: directory of exports started from the sidebar, rows per round
+# trip of the server-side export cursor, and messages per COPY/INSERT batch on import
+EXPORT_DIR = os.getenv("EXPORT_DIR", "data/exports")
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "2000"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+
+# Chat history window: messages cached and rendered per rerun, and page size for "load older"
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "50"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
@@ -0,0 +1,86 @@
+import logging
+import re
+from const import MODEL_CONTEXT_BUDGETS, DEFAULT_CONTEXT_BUDGET, SYSTEM_PROMPT
+
+logger = logging.getLogger(__name__)
+
+# Per-message chat template overhead (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Older turns are truncated rather than dropped if at least this much budget is left
+MIN_COMPRESSED_TOKENS = 64
+
+_WORD_PATTERN = re.compile(r"\w+")
+_SYMBOL_PATTERN = re.compile(r"[^\w\s]")
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """Approximates the BPE token count of a text without a tokenizer.
+
+    Words average ~1.3 tokens in DeepSeek's vocabulary; punctuation and
+    symbols are usually one token each.
+    """
+    words = len(_WORD_PATTERN.findall(text))
+    symbols = len(_SYMBOL_PATTERN.findall(text))
+    return int(words * 1.3) + symbols
+
+
+def count_message_tokens(message):
+    """Returns the token count of a message, as stored with it when it was written."""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+    return tokens
+
+
+def get_context_budget(model_name):
+    """Returns the prompt token budget configured for a model."""
+    return MODEL_CONTEXT_BUDGETS.get(model_name, DEFAULT_CONTEXT_BUDGET)
+
+
+def _truncate_to_tokens(content, max_tokens):
+    """Keeps the tail of a message that fits in roughly `max_tokens` tokens."""
+    matches = list(_TOKEN_PATTERN.finditer(content))
+    keep = int(max_tokens / 1.3)
+    if keep <= 0 or not matches:
+        return ""
+    if keep >= len(matches):
+        return content
+    return "…" + content[matches[-keep].start():]
+
+
+def build_context(history, user_input, model_name):
+    """Assembles the messages sent to the model within its token budget.
+
+    The system prompt and the new user input are always kept. Earlier turns
+    are added newest first until the budget runs out; the turn that crosses
+    the budget is truncated when enough room is left, and older ones dropped.
+    """
+    budget = get_context_budget(model_name)
+    system = [{"role": "system", "content": SYSTEM_PROMPT}] if SYSTEM_PROMPT else []
+    user_message = {"role": "user", "content": user_input}
+
+    used = sum(count_message_tokens(m) for m in system) + count_message_tokens(user_message)
+    if used > budget:
+        logger.warning(f"Prompt alone exceeds the {budget} token budget of {model_name} ({used} tokens)")
+
+    selected = []
+    for message in reversed(history):
+        tokens = count_message_tokens(message)
+        if used + tokens <= budget:
+            selected.append({"role": message["role"], "content": message["content"]})
+            used += tokens
+            continue
+        remaining = budget - used - MESSAGE_OVERHEAD_TOKENS
+        if remaining >= MIN_COMPRESSED_TOKENS:
+            content = _truncate_to_tokens(message["content"], remaining)
+            if content:
+                selected.append({"role": message["role"], "content": content})
+                used += estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        break
+
+    if len(selected) < len(history):
+        logger.debug(f"Context for {model_name}: kept {len(selected)} of {len(history)} messages, ~{used}/{budget} tokens")
+
+    selected.reverse()
+    return system + selected + [user_message]
@@ -0,0 +1,281 @@
+import logging
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class DatabaseUnavailable(Exception):
+    """Raised without connecting while the pool backs off after a failed connect."""
+
+
+class ConnectionPool:
+    """Thread-safe, process-wide pool of database connections.
+
+    Connections are opened lazily up to ``maxconn`` and reused LIFO so the
+    hottest connection stays warm. A ``SELECT 1`` probe only runs for
+    connections that sat idle longer than ``health_check_interval``. After a
+    failed connect, checkouts that need a new connection fail fast for
+    ``connect_backoff`` seconds instead of waiting on the database again.
+    """
+
+    def __init__(self, connect, minconn=1, maxconn=10, timeout=5.0,
+                 health_check_interval=30.0, leak_threshold=30.0,
+                 track_stacks=False, connect_backoff=5.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: minconn={minconn}, maxconn={maxconn}")
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.leak_threshold = leak_threshold
+        self.track_stacks = track_stacks
+        self.connect_backoff = connect_backoff
+
+        self._cond = threading.Condition()
+        self._idle = []        # [(conn, last_used)]
+        self._in_use = {}      # id(conn) -> (conn, checked_out_at, stack)
+        self._size = 0
+        self._closed = False
+        self._prefilled = False
+        self._down_until = 0.0  # monotonic time until which connects fail fast
+
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "timeouts": 0,
+            "opened": 0,
+            "connect_errors": 0,
+            "fast_failures": 0,
+            "discarded": 0,
+            "health_checks": 0,
+            "leaks": 0,
+        }
+
+    # Connection lifecycle
+
+    def _open(self):
+        with self._cond:
+            backoff = self._down_until - time.monotonic()
+            if backoff > 0:
+                self._stats["fast_failures"] += 1
+                raise DatabaseUnavailable(f"The database is unreachable; retrying in {backoff:.0f}s")
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._stats["connect_errors"] += 1
+                self._down_until = time.monotonic() + self.connect_backoff
+            raise
+        with self._cond:
+            self._stats["opened"] += 1
+            self._down_until = 0.0
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with self._cond:
+                self._stats["health_checks"] += 1
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            logger.warning("Discarding pooled connection that failed its health check")
+            return False
+
+    def _start_prefill(self):
+        """Opens ``minconn`` connections in the background on first use."""
+        with self._cond:
+            if self._prefilled:
+                return
+            self._prefilled = True
+        threading.Thread(target=self._prefill, name="db-pool-prefill", daemon=True).start()
+
+    def _prefill(self):
+        """Fills the pool up to ``minconn``; failures are not fatal."""
+        while True:
+            with self._cond:
+                if self._size >= self.minconn:
+                    return
+                self._size += 1
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                logger.warning("Failed to prefill connection pool", exc_info=True)
+                return
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    # Checkout / return
+
+    def getconn(self):
+        """Checks out a connection, blocking up to ``timeout`` seconds."""
+        if not self._prefilled:
+            self._start_prefill()
+
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        while True:
+            conn = None
+            last_used = None
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        self._report_leaks_locked()
+                        raise PoolTimeout(
+                            f"Timed out after {self.timeout}s waiting for a database connection "
+                            f"(size={self._size}, in_use={len(self._in_use)})")
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, last_used):
+                self._discard(conn)
+                continue
+
+            stack = traceback.extract_stack(limit=8)[:-2] if self.track_stacks else None
+            now = time.monotonic()
+            wait_ms = (now - start) * 1000
+            with self._cond:
+                self._in_use[id(conn)] = (conn, now, stack)
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                self._stats["wait_ms_total"] += wait_ms
+                self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Returns a connection to the pool, rolling back any open transaction."""
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            logger.warning("Closing a returned connection that does not belong to the pool")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+
+        held = time.monotonic() - entry[1]
+        if held > self.leak_threshold:
+            self._log_leak(held, entry[2])
+
+        if not discard and not conn.closed:
+            try:
+                # No-op on the client side when no transaction is open
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that commits on success and rolls back on error."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            # BaseException so Streamlit's rerun/stop signals also roll back
+            broken = conn.closed
+            if not broken:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    # Diagnostics
+
+    def _log_leak(self, held, stack):
+        with self._cond:
+            self._stats["leaks"] += 1
+        where = "".join(traceback.format_list(stack)) if stack else "(set DB_POOL_TRACK_STACKS=1 for checkout stack)"
+        logger.warning(f"Database connection held for {held:.1f}s (threshold {self.leak_threshold}s)\n{where}")
+
+    def _report_leaks_locked(self):
+        now = time.monotonic()
+        for _, checked_out_at, stack in self._in_use.values():
+            held = now - checked_out_at
+            if held > self.leak_threshold:
+                where = "\n" + "".join(traceback.format_list(stack)) if stack else ""
+                logger.warning(f"Possible connection leak: checked out {held:.1f}s ago{where}")
+
+    def stats(self):
+        """Returns a snapshot of pool size and checkout wait statistics."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=len(self._in_use),
+                minconn=self.minconn,
+                maxconn=self.maxconn,
+            )
+        checkouts = snapshot["checkouts"]
+        snapshot["wait_ms_avg"] = snapshot["wait_ms_total"] / checkouts if checkouts else 0.0
+        return snapshot
+
+    def closeall(self):
+        """Closes idle connections and refuses further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
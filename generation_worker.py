@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from const import GENERATION_WORKERS, GENERATION_JOB_RETENTION
+from metrics import TTFT_SECONDS, TOKENS_PER_SECOND, SPAN_SECONDS
+from utils import extract_chunk_content
+
+logger = logging.getLogger(__name__)
+
+# How long an attached reader waits for new tokens before re-checking; keeps
+# the script thread responsive to Streamlit's rerun/stop requests.
+POLL_INTERVAL = 0.1
+
+
+class GenerationJob:
+    """Token buffer of one in-flight generation, readable by any number of reruns."""
+
+    def __init__(self, session_id, model_name, prompt=None):
+        self.session_id = session_id
+        self.model_name = model_name
+        self.prompt = prompt  # user turn, shown while the request waits for a slot
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.result = None  # message saved by on_complete
+        self.stats = None  # timings of a live generation, see stream_stats
+        self.queue_position = None  # place in the model's queue while waiting for a slot
+        self.admitted = False
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    def write(self, text):
+        with self._cond:
+            self.chunks.append(text)
+            self._cond.notify_all()
+
+    def set_queue_position(self, position):
+        """Called by the scheduler while the request waits, and with None once it runs."""
+        with self._cond:
+            self.queue_position = position
+            self.admitted = position is None
+            self._cond.notify_all()
+
+    @property
+    def waiting(self):
+        """True until the request has been admitted by the scheduler, streamed or finished."""
+        return not (self.admitted or self.done or self.chunks)
+
+    def wait_for_admission(self, timeout):
+        """Waits up to `timeout` seconds for a change while waiting; returns the queue position."""
+        with self._cond:
+            if self.waiting:
+                self._cond.wait(timeout)
+            return self.queue_position if self.waiting else None
+
+    def finish(self, error=None):
+        with self._cond:
+            self.error = error
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._cond.notify_all()
+
+    def text(self):
+        with self._cond:
+            return "".join(self.chunks)
+
+    def stream(self, start=0):
+        """Yields buffered chunks from `start`, then new ones until the job finishes."""
+        position = start
+        while True:
+            with self._cond:
+                if position >= len(self.chunks) and not self.done:
+                    self._cond.wait(POLL_INTERVAL)
+                pending = self.chunks[position:]
+                done = self.done
+            for chunk in pending:
+                yield chunk
+            position += len(pending)
+            if done and position >= len(self.chunks):
+                return
+
+
+def stream_stats(started_at, first_token_at, tokens, finished_at):
+    """Returns time-to-first-token (s), tokens, tokens per second and duration of a stream."""
+    ttft = first_token_at - started_at if first_token_at else None
+    generation = finished_at - first_token_at if first_token_at else 0.0
+    # Ollama streams one token per chunk
+    tokens_per_sec = (tokens - 1) / generation if generation > 0 and tokens > 1 else 0.0
+    return {"ttft": ttft, "tokens": tokens, "tokens_per_sec": tokens_per_sec,
+            "duration": finished_at - started_at}
+
+
+def record_stream_stats(stats):
+    TTFT_SECONDS.observe(stats["ttft"])
+    TOKENS_PER_SECOND.observe(stats["tokens_per_sec"])
+    SPAN_SECONDS.observe(stats["duration"], span="stream.total")
+    logger.info(f"Stream finished: ttft={stats['ttft']:.3f}s, tokens={stats['tokens']}, "
+                f"tokens/sec={stats['tokens_per_sec']:.1f}, duration={stats['duration']:.2f}s")
+
+
+class GenerationWorker:
+    """Runs model generations on a thread pool so they outlive Streamlit reruns.
+
+    Each session has at most one tracked job. A rerun re-attaches to it with
+    `get_job`, and releases it once the finished answer has been rendered.
+    """
+
+    def __init__(self, max_workers=GENERATION_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session_id, model_name, chat_fn, messages, on_complete, on_admit=None, prompt=None):
+        """Starts a generation; `on_complete(text)` persists the answer on the worker thread.
+
+        `on_admit()` runs once the request is admitted, before it streams, so a
+        request that is shed or rejected as busy leaves nothing behind.
+
+        `chat_fn(messages, start, on_queue, on_shed)` calls `start(stream)` once
+        the chat scheduler admits the request, so a queued request holds no
+        worker thread, or `start(stream, live=False)` to replay a cached
+        response. It reports the queue position through `on_queue` and a shed
+        request's error through `on_shed`. Streaming metrics are only recorded
+        for live generations, on the thread that consumes the model's stream.
+        """
+        job = GenerationJob(session_id, model_name, prompt)
+        with self._lock:
+            self._prune()
+            self._jobs[session_id] = job
+
+        def start(stream, live=True):
+            if on_admit is not None:
+                on_admit()
+            self._executor.submit(self._run, job, stream, on_complete, live)
+
+        try:
+            chat_fn(messages, start, on_queue=job.set_queue_position, on_shed=job.finish)
+        except Exception as e:
+            logger.error(f"Generation failed for session {session_id}", exc_info=True)
+            job.finish(e)
+        return job
+
+    def _run(self, job, stream, on_complete, live):
+        error = None
+        started_at = time.perf_counter()
+        first_token_at = None
+        tokens = 0
+        try:
+            for chunk in stream:
+                content = extract_chunk_content(chunk) if chunk else None
+                if content:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    tokens += 1
+                    job.write(content)
+            text = job.text()
+            if text:
+                if live:
+                    job.stats = stream_stats(started_at, first_token_at, tokens, time.perf_counter())
+                    record_stream_stats(job.stats)
+                job.result = on_complete(text)
+        except Exception as e:
+            logger.error(f"Generation failed for session {job.session_id}", exc_info=True)
+            error = e
+        finally:
+            job.finish(error)
+
+    def get_job(self, session_id):
+        with self._lock:
+            return self._jobs.get(session_id)
+
+    def release(self, session_id, job):
+        """Forgets a finished job once its answer has been shown."""
+        with self._lock:
+            if self._jobs.get(session_id) is job and job.done:
+                del self._jobs[session_id]
+
+    def _prune(self):
+        now = time.monotonic()
+        for session_id, job in list(self._jobs.items()):
+            if job.done and now - job.finished_at > GENERATION_JOB_RETENTION:
+                del self._jobs[session_id]
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_generation_worker():
+    """Returns the process-wide generation worker."""
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = GenerationWorker()
+    return _worker
@@ -0,0 +1,169 @@
+import logging
+from cache_codec import CacheCodec
+from config import get_cache, get_chat_history_page
+from const import HISTORY_CACHE_TTL, HISTORY_WINDOW
+from message_format import normalize_message
+from message_writer import get_message_writer
+from metrics import record_cache_lookup, span
+
+logger = logging.getLogger(__name__)
+
+# Every cached history is a Redis list whose first element is this header,
+# followed by the newest HISTORY_WINDOW messages, each encoded separately by
+# the cache codec. Appends use RPUSHX, so they only land on a list that was
+# primed from the database and never recreate a partial history after the key
+# expired. Lists written with an older header are discarded and re-primed.
+# Every append also bumps a per-session version, so priming from a database
+# read that raced with an append is detected and undone.
+_HEADER = b"__history_v3__"
+
+_codec = CacheCodec("history")
+
+
+def _key(session_id):
+    return f"history:{session_id}"
+
+
+def _version_key(session_id):
+    return f"history:{session_id}:version"
+
+
+def _row_to_message(row):
+    message_id, role, content, created_at, reasoning, rendered, tokens = row
+    message = {"id": message_id, "role": role, "content": content, "reasoning": reasoning,
+               "rendered": rendered, "tokens": tokens,
+               "created_at": created_at.isoformat() if created_at else None}
+    if tokens is None:
+        # Stored before messages were normalized on write and not backfilled yet
+        # (python -m session_transfer normalize); redone on every load until then
+        message.update(normalize_message(role, content, reasoning))
+    return message
+
+
+def message_cursor(message):
+    """Returns the (created_at, id) keyset cursor of a message."""
+    return message.get("created_at"), message.get("id")
+
+
+def prime_history(session_id, messages, version=None):
+    """Replaces the cached history of a session with the given messages.
+
+    `version` is the session's history version read before loading the
+    messages. If an append has bumped it since, the messages may lack that
+    append, so the cache is dropped again and the next read re-primes it.
+    """
+    key = _key(session_id)
+    cache = get_cache(binary=True)
+    pipe = cache.pipeline(transaction=True)
+    pipe.delete(key)
+    pipe.rpush(key, _HEADER, *[_codec.encode(m) for m in messages[-HISTORY_WINDOW:]])
+    pipe.expire(key, HISTORY_CACHE_TTL)
+    pipe.get(_version_key(session_id))
+    current = pipe.execute()[-1]
+    if current != version:
+        logger.info(f"History of session {session_id} changed while priming its cache; dropping it")
+        cache.delete(key)
+
+
+def load_history(session_id):
+    """Returns the newest HISTORY_WINDOW messages of a session, oldest first.
+
+    Messages are {"id", "role", "content", "reasoning", "rendered", "tokens",
+    "created_at"} dicts, normalized when written, so reruns use them as they
+    are. They are served from Redis when primed, otherwise loaded from
+    PostgreSQL once and primed so later reruns never hit the database for them
+    again.
+    """
+    key = _key(session_id)
+    version = None
+    try:
+        with span("history.cache_read"):
+            pipe = get_cache(binary=True).pipeline(transaction=False)
+            pipe.lrange(key, 0, -1)
+            pipe.expire(key, HISTORY_CACHE_TTL)
+            pipe.get(_version_key(session_id))
+            entries, _, version = pipe.execute()
+            if entries and entries[0] == _HEADER:
+                messages = [_codec.decode(entry) for entry in entries[1:]]
+                record_cache_lookup("history", hit=True)
+                return messages
+        if entries:
+            logger.warning(f"Discarding malformed history cache for session {session_id}")
+    except (ValueError, TypeError):
+        logger.error(f"Corrupted history cache for session {session_id}", exc_info=True)
+    except Exception:
+        logger.error(f"Failed to read history cache for session {session_id}", exc_info=True)
+
+    record_cache_lookup("history", hit=False)
+    _flush_pending_writes()
+    messages = [_row_to_message(row) for row in get_chat_history_page(session_id, HISTORY_WINDOW)]
+    try:
+        prime_history(session_id, messages, version)
+    except Exception:
+        logger.error(f"Failed to prime history cache for session {session_id}", exc_info=True)
+    return messages
+
+
+def load_older_messages(session_id, before, limit, after=None):
+    """Loads a page of messages older than the `before` cursor from PostgreSQL."""
+    _flush_pending_writes()
+    rows = get_chat_history_page(session_id, limit, before=before, after=after)
+    return [_row_to_message(row) for row in rows]
+
+
+def append_message(session_id, message):
+    """Appends a message to the cached window if the session is primed."""
+    key = _key(session_id)
+    try:
+        pipe = get_cache(binary=True).pipeline(transaction=True)
+        pipe.rpushx(key, _codec.encode(message))
+        # Keep the header plus the newest HISTORY_WINDOW messages: when the
+        # trim cuts into the messages, the oldest survivor becomes the header.
+        pipe.ltrim(key, -(HISTORY_WINDOW + 1), -1)
+        pipe.lset(key, 0, _HEADER)
+        pipe.expire(key, HISTORY_CACHE_TTL)
+        # Bumped even when the key is not primed, so a concurrent prime notices
+        pipe.incr(_version_key(session_id))
+        pipe.expire(_version_key(session_id), HISTORY_CACHE_TTL)
+        results = pipe.execute(raise_on_error=False)
+        # On an unprimed key RPUSHX is a no-op and LSET fails; both are expected
+        if results[0]:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+    except Exception:
+        # A stale cache would serve wrong history, so drop it instead
+        logger.error(f"Failed to append to history cache for session {session_id}", exc_info=True)
+        invalidate_history(session_id)
+
+
+def record_message(session_id, role, content, reasoning=None, model=None):
+    """Normalizes a message, queues it for PostgreSQL and writes it through to the cache.
+
+    An assistant's raw response from `model` is split into reasoning and
+    answer here. The database write is batched by the message writer, so the
+    returned message has no id yet; its created_at is final and unique per
+    process.
+    """
+    normalized = normalize_message(role, content, reasoning, model)
+    created_at = get_message_writer().enqueue(session_id, role, normalized["content"], normalized["reasoning"],
+                                              normalized["rendered"], normalized["tokens"])
+    message = _row_to_message((None, role, normalized["content"], created_at, normalized["reasoning"],
+                               normalized["rendered"], normalized["tokens"]))
+    append_message(session_id, message)
+    return message
+
+
+def _flush_pending_writes():
+    # Database reads must see messages still waiting in the write-behind queue
+    writer = get_message_writer()
+    if writer.pending and not writer.flush():
+        logger.warning("Reading chat history while messages are still queued for writing")
+
+
+def invalidate_history(session_id):
+    """Drops the cached history of a session."""
+    try:
+        get_cache(binary=True).delete(_key(session_id))
+    except Exception:
+        logger.error(f"Failed to invalidate history cache for session {session_id}", exc_info=True)
@@ -1,13 +1,49 @@
 import streamlit as st
-import json
 import logging
-from config import get_session, save_message, get_chat_history, redis_client
-from chat_model import get_chat_model
-from utils import process_stream, display_assistant_message, display_message
+from config import get_session
+from history_cache import load_history, load_older_messages, record_message, message_cursor
+from chat_model import get_chat_model, ModelBusyError
+from context_builder import build_context
+from const import HISTORY_WINDOW, HISTORY_PAGE_SIZE
+from generation_worker import get_generation_worker, POLL_INTERVAL
+from metrics import span
+from utils import process_stream, display_message, display_chat_history
 
 logger = logging.getLogger(__name__)
 
 
+def get_older_history(session_id, chat_history):
+    """Returns the older messages the user paged in above the cached window.
+
+    Only touches the database when "load older" is clicked, or when new
+    messages pushed the window past older pages that were already loaded.
+    """
+    all_older = st.session_state.setdefault("older_history", {})
+    older = all_older.setdefault(session_id, {"messages": [], "until": None, "exhausted": False})
+    window_start = message_cursor(chat_history[0]) if chat_history else None
+
+    # Close the gap between loaded pages and a window that has moved forward
+    if older["messages"] and window_start and older["until"] != window_start:
+        gap = load_older_messages(session_id, before=window_start, limit=HISTORY_PAGE_SIZE,
+                                  after=message_cursor(older["messages"][-1]))
+        if len(gap) < HISTORY_PAGE_SIZE:
+            older["messages"].extend(gap)
+            older["until"] = window_start
+        else:
+            older.update(messages=[], until=None, exhausted=False)
+
+    # The window is only full when the session may have older messages
+    if len(chat_history) >= HISTORY_WINDOW and not older["exhausted"]:
+        if st.button("⬆️ Load older messages", key=f"load_older_{session_id}", use_container_width=True):
+            oldest = older["messages"][0] if older["messages"] else chat_history[0]
+            page = load_older_messages(session_id, before=message_cursor(oldest), limit=HISTORY_PAGE_SIZE)
+            older["messages"][:0] = page
+            older["until"] = window_start
+            older["exhausted"] = len(page) < HISTORY_PAGE_SIZE
+
+    return older["messages"]
+
+
 def handle_user_input():
     """Handles user input and generates the assistant's response."""
 
@@ -18,7 +54,6 @@ def handle_user_input():
     session_id = None
     selected_model = None
     chat_history = []
-    cache_key = None
 
     try:
         # Ensure session exists in DB, else create it
@@ -32,86 +67,75 @@ def handle_user_input():
             st.info("💡 Click 'Create' in the sidebar to create a new session.")
             return
 
-        # Fetch chat history (cache first, then fallback to database)
-        cache_key = f"session:{session_id}"
-        cached_history = redis_client.get(cache_key)
-
-        if cached_history:
-            chat_history = json.loads(cached_history)
-        else:
-            chat_history = get_chat_history(session_id)
-            redis_client.set(cache_key, json.dumps(chat_history),
-                         ex=300)  # Cache for 5 minutes
+        # Fetch the newest messages (Redis cache, primed from the database on a miss)
+        chat_history = load_history(session_id)
+        older_history = get_older_history(session_id, chat_history)
 
     except Exception as e:
         st.error("⚠️ Error loading session or chat history. Please try again.")
         st.info("💡 If the problem persists, try creating a new session.")
         return
 
-    # 🛠 Ensure messages are properly formatted before sending to chat model
-    formatted_chat_history = []
-    for msg in chat_history:
-        content = msg[1]
-        # Clean up any <think> tags from previous responses
-        if msg[0] == "assistant":
-            content = content.replace('<think>', '').replace('</think>', '')
-        formatted_chat_history.append({"role": msg[0], "content": content})
-
-    # Display chat history
-    for msg in formatted_chat_history:
-        display_message(msg)
-
-    # Get user input
-    user_input = st.chat_input("💬 Type your message here...")
+    # Display chat history: pages loaded on demand, then the cached window
+    with span("history.render"):
+        display_chat_history(older_history)
+        display_chat_history(chat_history)
+
+    # Re-attach to a generation that outlived the previous rerun
+    worker = get_generation_worker()
+    job = worker.get_job(session_id)
+    if job is not None and job.result is not None and job.result["created_at"] in {m.get("created_at") for m in chat_history}:
+        # Already part of the history loaded above
+        worker.release(session_id, job)
+        job = None
+    if job is not None:
+        if job.waiting and job.prompt:
+            # Not saved until the request is admitted
+            display_message({"role": "user", "content": job.prompt})
+        with st.chat_message("assistant"):
+            render_generation(worker, job)
+
+    # Get user input (one generation at a time per session)
+    user_input = st.chat_input("💬 Type your message here...", disabled=job is not None and not job.done)
+
+    # A prompt sent while its model was being pulled waits here, unsaved, until the model is ready
+    pending = st.session_state.setdefault("pending_prompts", {})
+    if user_input:
+        pending[session_id] = user_input
+    user_input = pending.get(session_id)
 
     if user_input:
         try:
-            # Save user input
             display_message({"role": "user", "content": user_input})
-            save_message(session_id, "user", user_input)
-
-            # Invalidate cache (only once, after saving)
-            if cache_key:
-                redis_client.delete(cache_key)
 
             # Generate response
             with st.chat_message("assistant"):
                 try:
-                    # Get chat model with error handling
-                    chat_model = get_chat_model(model_name=selected_model)
-                    
-                    # Prepare messages with system context
-                    messages = formatted_chat_history + [{"role": "user", "content": user_input}]
-                    
-                    # Log the messages being sent
-                    logger.info(f"Sending messages to model: {messages}")
+                    # Get chat model with error handling; stops the script while the model is pulled
+                    chat_model = get_chat_model(model_name=selected_model, session_key=session_id)
+
+                    del pending[session_id]
+
+                    # Prepare messages with system context within the model's token budget
+                    with span("context.build"):
+                        messages = build_context(chat_history, user_input, selected_model)
                     
-                    try:
-                        # Get streaming response
-                        stream = chat_model(messages)
-                        
-                        # Process stream with status indicator
-                        response_content = process_stream(stream, "💡 Responding...")
-                        
-                        if not response_content:
-                            logger.error("Empty response from model")
-                            st.error("⚠️ No response received from the model.")
-                            st.info("💡 Please try again or select a different model.")
-                            return
-                            
-                        # Display & save assistant response
-                        display_assistant_message(response_content)
-                        save_message(session_id, "assistant", response_content)
-                        
-                        # Refresh cache
-                        if cache_key:
-                            redis_client.delete(cache_key)
-                            
-                    except Exception as e:
-                        logger.error("Error in model response", exc_info=True)
-                        st.error(f"⚠️ Error getting model response: {str(e)}")
-                        st.info("💡 Please check if Ollama is running and the model is available.")
-                        return
+                    # Log the request; the full message list only at DEBUG
+                    logger.info(f"Sending {len(messages)} messages to {selected_model}", extra={"category": "model.request"})
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"Sending messages to model: {messages}", extra={"category": "model.request"})
+
+                    # Generate on a worker thread; the answer is saved there even if this rerun is interrupted
+                    def save_response(text):
+                        return record_message(session_id, "assistant", text, model=selected_model)
+
+                    # Save user input once the scheduler admits the request; a shed request leaves no orphan turn
+                    def save_prompt():
+                        record_message(session_id, "user", user_input)
+
+                    job = worker.submit(session_id, selected_model, chat_model, messages, save_response,
+                                        on_admit=save_prompt, prompt=user_input)
+                    render_generation(worker, job)
 
                 except Exception as e:
                     logger.error("Error in chat session", exc_info=True)
@@ -122,3 +146,38 @@ def handle_user_input():
         except Exception as e:
             st.error("⚠️ Error processing your message. Please try again.")
             return
+
+
+def render_queue_position(job):
+    """Shows the request's place in its model's queue until it gets a slot."""
+    placeholder = st.empty()
+    while job.waiting:
+        position = job.wait_for_admission(POLL_INTERVAL)
+        if position is not None:
+            placeholder.info(f"⏳ {job.model_name} is busy. You are number {position} in the queue...")
+    placeholder.empty()
+
+
+def render_generation(worker, job):
+    """Streams a background generation into the current chat message."""
+    render_queue_position(job)
+    if isinstance(job.error, ModelBusyError):
+        st.warning(f"⏳ {job.error}")
+        worker.release(job.session_id, job)
+        return
+
+    response_content = process_stream(job.stream(), "💡 Responding...", model=job.model_name)
+
+    if response_content and job.stats:
+        st.caption(f"⏱️ First token in {job.stats['ttft']:.2f}s · {job.stats['tokens_per_sec']:.1f} tokens/s")
+
+    if job.error is not None:
+        st.error(f"⚠️ Error getting model response: {str(job.error)}")
+        st.info("💡 Please check if Ollama is running and the model is available.")
+    elif not response_content:
+        logger.error("Empty response from model")
+        st.error("⚠️ No response received from the model.")
+        st.info("💡 Please try again or select a different model.")
+
+    if job.done:
+        worker.release(job.session_id, job)
@@ -0,0 +1,265 @@
+import fnmatch
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseError(Exception):
+    """Mirrors redis.exceptions.ResponseError for commands that fail server-side."""
+
+
+class LocalCache:
+    """In-process, Redis-compatible cache for the subset of redis-py the app uses.
+
+    Replaces Redis on single-node deployments and in benchmarks. Like
+    redis-py, values are str with decode_responses=True and bytes otherwise
+    (list and string values; hashes and sorted sets always use str). Beyond `max_keys` keys the
+    least recently used one is evicted (like Redis' allkeys-lru policy).
+    Every command, and every pipeline execute, counts as one round trip in
+    `round_trips`.
+    """
+
+    def __init__(self, max_keys=None, decode_responses=True):
+        self.max_keys = max_keys
+        self._value_type = str if decode_responses else bytes
+        self._data = OrderedDict()
+        self._expires = {}
+        self._lock = threading.RLock()
+        self.round_trips = 0
+        self.commands = 0
+
+    # Internals
+
+    def _alive(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        if key not in self._data:
+            return False
+        self._data.move_to_end(key)
+        return True
+
+    def _get(self, key, kind, default=None):
+        if not self._alive(key):
+            return default
+        value = self._data[key]
+        if not isinstance(value, kind):
+            raise ResponseError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _encode(self, value):
+        if isinstance(value, self._value_type):
+            return value
+        if isinstance(value, bytes):
+            return value.decode("utf-8")
+        value = str(value)
+        return value if self._value_type is str else value.encode("utf-8")
+
+    def _call(self, name, *args, **kwargs):
+        with self._lock:
+            self.commands += 1
+            result = getattr(self, f"_cmd_{name}")(*args, **kwargs)
+            if self.max_keys is not None:
+                while len(self._data) > self.max_keys:
+                    key, _ = self._data.popitem(last=False)
+                    self._expires.pop(key, None)
+            return result
+
+    def __getattr__(self, name):
+        if name.startswith("_") or not hasattr(type(self), f"_cmd_{name}"):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            with self._lock:
+                self.round_trips += 1
+            return self._call(name, *args, **kwargs)
+        return command
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def ping(self):
+        return True
+
+    # Strings
+
+    def _cmd_get(self, key):
+        return self._get(key, self._value_type)
+
+    def _cmd_set(self, key, value, ex=None, nx=False):
+        if nx and self._alive(key):
+            return None
+        self._data[key] = self._encode(value)
+        self._data.move_to_end(key)
+        self._expires.pop(key, None)
+        if ex is not None:
+            self._expires[key] = time.monotonic() + ex
+        return True
+
+    def _cmd_incr(self, key, amount=1):
+        value = int(self._get(key, self._value_type, "0")) + amount
+        self._data[key] = self._encode(value)
+        return value
+
+    # Keys
+
+    def _cmd_delete(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                del self._data[key]
+                self._expires.pop(key, None)
+                removed += 1
+        return removed
+
+    def _cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def _cmd_expire(self, key, seconds):
+        if not self._alive(key):
+            return False
+        self._expires[key] = time.monotonic() + seconds
+        return True
+
+    def _cmd_keys(self, pattern="*"):
+        return [key for key in list(self._data) if self._alive(key) and fnmatch.fnmatchcase(key, pattern)]
+
+    # Lists
+
+    def _cmd_rpush(self, key, *values):
+        items = self._get(key, list)
+        if items is None:
+            items = self._data[key] = []
+        items.extend(self._encode(v) for v in values)
+        return len(items)
+
+    def _cmd_rpushx(self, key, *values):
+        if self._get(key, list) is None:
+            return 0
+        return self._cmd_rpush(key, *values)
+
+    def _cmd_lrange(self, key, start, end):
+        items = self._get(key, list, [])
+        size = len(items)
+        start = max(size + start, 0) if start < 0 else start
+        end = size + end if end < 0 else end
+        if start > end or start >= size:
+            return []
+        return items[start:end + 1]
+
+    def _cmd_ltrim(self, key, start, end):
+        items = self._get(key, list)
+        if items is None:
+            return True
+        kept = self._cmd_lrange(key, start, end)
+        if kept:
+            self._data[key] = list(kept)
+        else:
+            self._cmd_delete(key)
+        return True
+
+    def _cmd_lset(self, key, index, value):
+        items = self._get(key, list)
+        if items is None:
+            raise ResponseError("ERR no such key")
+        try:
+            items[index] = self._encode(value)
+        except IndexError:
+            raise ResponseError("ERR index out of range")
+        return True
+
+    def _cmd_llen(self, key):
+        return len(self._get(key, list, []))
+
+    # Hashes
+
+    def _cmd_hincrby(self, key, field, amount=1):
+        fields = self._get(key, dict)
+        if fields is None:
+            fields = self._data[key] = {}
+        fields[field] = str(int(fields.get(field, "0")) + amount)
+        return int(fields[field])
+
+    def _cmd_hgetall(self, key):
+        return dict(self._get(key, dict, {}))
+
+    # Sorted sets
+
+    def _cmd_zadd(self, key, mapping):
+        scores = self._get(key, _ZSet)
+        if scores is None:
+            scores = self._data[key] = _ZSet()
+        added = sum(1 for member in mapping if member not in scores)
+        scores.update({member: float(score) for member, score in mapping.items()})
+        return added
+
+    def _cmd_zcard(self, key):
+        return len(self._get(key, _ZSet, {}))
+
+    def _cmd_zpopmin(self, key, count=1):
+        scores = self._get(key, _ZSet)
+        if not scores:
+            return []
+        popped = sorted(scores.items(), key=lambda item: (item[1], item[0]))[:count]
+        for member, _ in popped:
+            del scores[member]
+        return popped
+
+    def _cmd_zremrangebyscore(self, key, minimum, maximum):
+        scores = self._get(key, _ZSet)
+        if not scores:
+            return 0
+        low, high = float(minimum), float(maximum)
+        doomed = [member for member, score in scores.items() if low <= score <= high]
+        for member in doomed:
+            del scores[member]
+        return len(doomed)
+
+
+class _ZSet(dict):
+    pass
+
+
+class _Pipeline:
+    """Buffers commands and runs them atomically as one round trip."""
+
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._commands.clear()
+
+    def execute(self, raise_on_error=True):
+        results = []
+        with self._client._lock:
+            self._client.round_trips += 1
+            for name, args, kwargs in self._commands:
+                try:
+                    results.append(self._client._call(name, *args, **kwargs))
+                except ResponseError as e:
+                    results.append(e)
+        self._commands.clear()
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
@@ -0,0 +1,42 @@
+import re
+from context_builder import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+from reasoning import is_reasoning_model, split_reasoning
+
+# Code is left untouched when rewriting math delimiters
+_CODE = re.compile(r"(```.*?```|`[^`\n]*`)", re.S)
+_DISPLAY_MATH = re.compile(r"\\\[(.+?)\\\]", re.S)
+_INLINE_MATH = re.compile(r"\\\((.+?)\\\)", re.S)
+
+
+def render_markdown(content):
+    """Returns the markdown Streamlit should render for a message.
+
+    DeepSeek writes LaTeX between \\[ \\] and \\( \\), which Streamlit only
+    renders between $$ and $.
+    """
+    if "\\[" not in content and "\\(" not in content:
+        return content
+    parts = _CODE.split(content)
+    for i in range(0, len(parts), 2):
+        text = _DISPLAY_MATH.sub(lambda m: f"$$\n{m.group(1).strip()}\n$$", parts[i])
+        parts[i] = _INLINE_MATH.sub(lambda m: f"${m.group(1).strip()}$", text)
+    return "".join(parts)
+
+
+def normalize_message(role, content, reasoning=None, model=None):
+    """Computes the stored form of a message once, when it is written.
+
+    Returns {"content", "reasoning", "rendered", "tokens"}: the prompt-ready
+    content, with the reasoning of an assistant's `model` split off; the
+    markdown to display, or None when it is the content itself; and the
+    content's prompt token count.
+    """
+    if role == "assistant" and reasoning is None:
+        reasoning, content = split_reasoning(content, is_reasoning_model(model))
+    rendered = render_markdown(content)
+    return {
+        "content": content,
+        "reasoning": reasoning or None,
+        "rendered": rendered if rendered != content else None,
+        "tokens": estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS,
+    }
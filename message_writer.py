@@ -0,0 +1,161 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from config import save_messages, is_transient_db_error
+from const import MESSAGE_BATCH_SIZE, MESSAGE_FLUSH_INTERVAL, MESSAGE_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+MAX_RETRY_DELAY = 5.0  # seconds between attempts while the database is unavailable
+SHUTDOWN_TIMEOUT = 10.0
+
+
+class MessageWriter:
+    """Write-behind queue that group-commits messages from a background thread.
+
+    Messages are timestamped when queued and written in queue order by a
+    single thread, so per-session ordering is preserved across batches. A
+    batch is flushed once it holds `batch_size` messages or its oldest
+    message has waited `flush_interval` seconds. A batch that fails with a
+    transient error (the database is unreachable) is retried until it
+    succeeds, so later messages never overtake it. A batch that fails
+    otherwise is written row by row, and rows that still fail are logged and
+    dropped instead of blocking every later write.
+    """
+
+    def __init__(self, write_batch=save_messages, batch_size=MESSAGE_BATCH_SIZE,
+                 flush_interval=MESSAGE_FLUSH_INTERVAL, max_queued=MESSAGE_QUEUE_SIZE,
+                 is_transient=is_transient_db_error):
+        self._write_batch = write_batch
+        self._is_transient = is_transient
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._last_timestamp = None
+        self._stopping = False
+        self.stats = {"messages": 0, "batches": 0, "retries": 0, "dropped": 0}
+        self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+        self._thread.start()
+
+    def _next_timestamp(self):
+        # Strictly increasing, so messages queued in the same microsecond keep their order.
+        # Naive UTC, like the database's own CURRENT_TIMESTAMP defaults (connections run in UTC)
+        with self._cond:
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            if self._last_timestamp is not None and now <= self._last_timestamp:
+                now = self._last_timestamp + timedelta(microseconds=1)
+            self._last_timestamp = now
+            self._pending += 1
+            return now
+
+    def enqueue(self, session_id, role, content, reasoning=None, rendered=None, tokens=None):
+        """Queues a message; blocks only if the queue is full. Returns its timestamp."""
+        created_at = self._next_timestamp()
+        self._queue.put((session_id, role, content, created_at, reasoning, rendered, tokens))
+        return created_at
+
+    @property
+    def pending(self):
+        with self._cond:
+            return self._pending
+
+    def flush(self, timeout=SHUTDOWN_TIMEOUT):
+        """Waits until every queued message is written; returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self._write_with_retry(batch)
+        except Exception:
+            if len(batch) == 1:
+                self._drop(batch[0])
+            else:
+                logger.warning(f"Failed to write a batch of {len(batch)} messages, writing them one by one",
+                               exc_info=True)
+                for row in batch:
+                    try:
+                        self._write_with_retry([row])
+                    except Exception:
+                        self._drop(row)
+        self.stats["messages"] += len(batch)
+        self.stats["batches"] += 1
+        with self._cond:
+            self._pending -= len(batch)
+            self._cond.notify_all()
+
+    def _write_with_retry(self, rows):
+        """Writes rows, retrying transient errors; raises a permanent one."""
+        delay = 0.1
+        while True:
+            try:
+                self._write_batch(rows)
+                return
+            except Exception as e:
+                if not self._is_transient(e):
+                    raise
+                self.stats["retries"] += 1
+                if self._stopping:
+                    logger.error(f"Dropping {len(rows)} unsaved messages during shutdown")
+                    self.stats["dropped"] += len(rows)
+                    return
+                logger.warning(f"Failed to write {len(rows)} messages, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def _drop(self, row):
+        session_id, role, _, created_at = row[:4]
+        logger.error(f"Dropping a {role} message of session {session_id} created at {created_at} "
+                     "that cannot be written", exc_info=True)
+        self.stats["dropped"] += 1
+
+    def close(self, timeout=SHUTDOWN_TIMEOUT):
+        """Flushes queued messages and stops the writer thread."""
+        if not self.flush(timeout):
+            logger.error(f"Timed out flushing {self.pending} queued messages on shutdown")
+        self._stopping = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_message_writer():
+    """Returns the process-wide message writer, flushed on interpreter exit."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = MessageWriter()
+                atexit.register(_writer.close)
+    return _writer
@@ -0,0 +1,298 @@
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 200, 400)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+class Gauge:
+    """Value read from a callback at scrape time.
+
+    With labels, the callback returns a {label values tuple: value} dict.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, read, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._read = read
+
+    def samples(self):
+        try:
+            value = self._read()
+        except Exception:
+            logger.debug(f"Failed to read gauge {self.name}", exc_info=True)
+            return
+        if value is None:
+            return
+        if not self.labels:
+            yield f"{self.name} {value}"
+            return
+        for key, item in sorted(value.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {item}"
+
+
+class Histogram:
+    """Fixed-bucket histogram, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _snapshot(self, key):
+        with self._lock:
+            series = self._series.get(key)
+            return list(series) if series else None
+
+    def count(self, **labels):
+        series = self._snapshot(tuple(labels.get(name, "") for name in self.labels))
+        return sum(series[:-1]) if series else 0
+
+    def quantile(self, q, **labels):
+        """Estimates a quantile by linear interpolation within buckets."""
+        series = self._snapshot(tuple(labels.get(name, "") for name in self.labels))
+        if not series:
+            return None
+        counts = series[:-1]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def label_sets(self):
+        with self._lock:
+            return [dict(zip(self.labels, key)) for key in sorted(self._series)]
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(value) for key, value in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, ('le', bound))} {cumulative}"
+            cumulative += values[len(self.buckets)]
+            yield f"{self.name}_bucket{_format_labels(self.labels, key, ('le', '+Inf'))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {values[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        """Renders all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, labels=()):
+    return REGISTRY.register(Counter(name, help_text, labels))
+
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS, labels=()):
+    return REGISTRY.register(Histogram(name, help_text, buckets, labels))
+
+
+def gauge(name, help_text, read, labels=()):
+    return REGISTRY.register(Gauge(name, help_text, read, labels))
+
+
+# Hot-path metrics
+SPAN_SECONDS = histogram("chat_span_seconds", "Duration of instrumented steps of a chat turn.", labels=("span",))
+DB_QUERY_SECONDS = histogram("chat_db_query_seconds", "Duration of database calls.", labels=("query",))
+CACHE_LOOKUPS = counter("chat_cache_lookups_total", "Cache lookups by cache and result.", labels=("cache", "result"))
+TTFT_SECONDS = histogram("chat_time_to_first_token_seconds", "Time from request to first streamed token.")
+TOKENS_PER_SECOND = histogram("chat_tokens_per_second", "Streaming generation speed.", buckets=RATE_BUCKETS)
+RERUN_SECONDS = histogram("chat_rerun_seconds", "Duration of a full Streamlit script run.")
+RERUN_DB_QUERIES = histogram("chat_rerun_db_queries", "Database calls made by one script run.", buckets=COUNT_BUCKETS)
+
+_rerun = threading.local()
+
+
+@contextmanager
+def span(name):
+    """Times a step of the chat hot path."""
+    with SPAN_SECONDS.time(span=name):
+        yield
+
+
+def timed_query(name):
+    """Decorator recording a database call's duration and counting it for the current rerun."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_rerun, "active", False):
+                _rerun.db_queries += 1
+            with DB_QUERY_SECONDS.time(query=name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def rerun_scope():
+    """Measures one Streamlit script run and the database calls it makes."""
+    _rerun.active = True
+    _rerun.db_queries = 0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        RERUN_SECONDS.observe(time.perf_counter() - start)
+        RERUN_DB_QUERIES.observe(_rerun.db_queries)
+        _rerun.active = False
+
+
+def cache_hit_rate(cache):
+    hits = CACHE_LOOKUPS.value(cache=cache, result="hit")
+    misses = CACHE_LOOKUPS.value(cache=cache, result="miss")
+    return hits / (hits + misses) if hits + misses else None
+
+
+# Prometheus endpoint
+
+def _metrics_handler():
+    # http.server is only imported when the endpoint is enabled
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return MetricsHandler
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serves /metrics on a background thread; safe to call on every rerun."""
+    global _server
+    if not port or _server is not None:
+        return
+    with _server_lock:
+        if _server is not None:
+            return
+        from http.server import ThreadingHTTPServer
+        try:
+            _server = ThreadingHTTPServer((host, port), _metrics_handler())
+        except OSError:
+            # Another process (e.g. a second replica) already serves this port
+            logger.warning(f"Could not start metrics endpoint on port {port}", exc_info=True)
+            _server = False
+            return
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from const import MODEL_PRELOAD, MODEL_KEEP_ALIVE, DEFAULT_KEEP_ALIVE
+from metrics import counter, histogram, gauge
+from ollama_router import get_ollama_router, normalize_model_name
+
+logger = logging.getLogger(__name__)
+
+MODEL_WARMUPS = counter(
+    "chat_model_warmups_total",
+    "Model warm-ups by reason (preload, switch) and result (loaded, already_loaded, error).",
+    labels=("model", "reason", "result"))
+MODEL_WARMUP_SECONDS = histogram(
+    "chat_model_warmup_seconds", "Time Ollama took to load a model on warm-up.", labels=("model",))
+
+
+def _parse_keep_alive(value):
+    """Ollama takes a duration string ("30m") or a number of seconds (-1 = forever)."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class ModelLifecycle:
+    """Keeps models loaded in Ollama ahead of the requests that need them.
+
+    Configured models are preloaded at start-up, and the model of a session
+    the user switches to is warmed in the background, so the first chat of
+    the session does not wait for a cold load. Every request also sends the
+    model's keep-alive, which is how long Ollama keeps it in memory after that
+    request.
+    """
+
+    def __init__(self, router=None, preload=MODEL_PRELOAD, keep_alive=MODEL_KEEP_ALIVE,
+                 default_keep_alive=DEFAULT_KEEP_ALIVE):
+        self._router = router
+        self.preload_models = list(preload)
+        self._keep_alive = {normalize_model_name(name): _parse_keep_alive(value) for name, value in keep_alive.items()}
+        self.default_keep_alive = _parse_keep_alive(default_keep_alive)
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="model-warmup")
+        self._warming = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+    @property
+    def router(self):
+        return self._router or get_ollama_router()
+
+    def keep_alive(self, model_name):
+        return self._keep_alive.get(normalize_model_name(model_name), self.default_keep_alive)
+
+    def start(self):
+        """Preloads the configured models in the background, once per process."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for model in self.preload_models:
+            self.warm(model, reason="preload")
+
+    def warm(self, model_name, session_key=None, reason="switch"):
+        """Loads a model in the background unless a warm-up for it is already running."""
+        model = normalize_model_name(model_name)
+        with self._lock:
+            if model in self._warming:
+                return
+            self._warming.add(model)
+        self._executor.submit(self._warm, model, session_key, reason)
+
+    def _warm(self, model, session_key, reason):
+        start = time.perf_counter()
+        try:
+            host = self.router.warm(model, session_key, keep_alive=self.keep_alive(model))
+            if host is None:
+                MODEL_WARMUPS.inc(model=model, reason=reason, result="already_loaded")
+                return
+            elapsed = time.perf_counter() - start
+            MODEL_WARMUP_SECONDS.observe(elapsed, model=model)
+            MODEL_WARMUPS.inc(model=model, reason=reason, result="loaded")
+            logger.info(f"Warmed {model} on {host} in {elapsed:.1f}s ({reason})")
+        except Exception as e:
+            MODEL_WARMUPS.inc(model=model, reason=reason, result="error")
+            logger.warning(f"Failed to warm {model} ({reason}): {e}")
+        finally:
+            with self._lock:
+                self._warming.discard(model)
+
+
+_lifecycle = None
+_lifecycle_lock = threading.Lock()
+
+
+def get_model_lifecycle():
+    """Returns the process-wide model lifecycle manager."""
+    global _lifecycle
+    if _lifecycle is None:
+        with _lifecycle_lock:
+            if _lifecycle is None:
+                _lifecycle = ModelLifecycle()
+    return _lifecycle
+
+
+def start_model_lifecycle():
+    """Preloads the configured models; safe to call on every rerun."""
+    try:
+        get_model_lifecycle().start()
+    except Exception:
+        logger.error("Failed to start model preloading", exc_info=True)
+
+
+gauge("chat_model_loaded", "1 if a model is loaded in a host's memory, 0 if only installed.",
+      lambda: get_ollama_router().loaded_models(), labels=("host", "model"))
@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from cluster import publish, subscribe
+from const import MODEL_INVENTORY_TTL, MODEL_INVENTORY_REFRESH_INTERVAL, MODEL_INVENTORY_FAILURE_TTL
+from ollama_router import get_ollama_router, normalize_model_name
+
+logger = logging.getLogger(__name__)
+
+
+class PullJob:
+    """Tracks a model pull running on a background thread."""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.status = "pending"
+        self.completed = 0
+        self.total = 0
+        self.error = None
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ("success", "failed")
+
+    def progress(self):
+        """Returns download progress in [0, 1]."""
+        if self.status == "success":
+            return 1.0
+        return min(self.completed / self.total, 1.0) if self.total else 0.0
+
+
+class ModelRegistry:
+    """TTL-cached inventory of Ollama models with background refresh and pulls.
+
+    The inventory is refreshed on a daemon thread, so the per-turn hot path
+    only reads an in-memory set and never waits on Ollama. Each refresh also
+    probes the health of every host in the router's pool. A failed refresh is
+    not retried from the hot path for `failure_ttl` seconds.
+    """
+
+    def __init__(self, list_models=None, pull_model=None, ttl=MODEL_INVENTORY_TTL,
+                 refresh_interval=MODEL_INVENTORY_REFRESH_INTERVAL, failure_ttl=MODEL_INVENTORY_FAILURE_TTL):
+        self._list_models = list_models or (lambda: get_ollama_router().list_models())
+        self._pull_model = pull_model or (lambda name: get_ollama_router().pull(name))
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.failure_ttl = failure_ttl
+        self._models = None
+        self._fetched_at = 0.0
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._pulls = {}
+        self._thread = None
+
+    def start(self):
+        """Starts the background refresh thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._refresh_loop, name="model-registry", daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            self.refresh()
+            time.sleep(self.refresh_interval)
+
+    def refresh(self, wait=False):
+        """Fetches the model list from Ollama.
+
+        Concurrent callers skip instead of piling up unless `wait` is set.
+        """
+        if not self._refreshing.acquire(blocking=wait):
+            return
+        try:
+            models = {normalize_model_name(name) for name in self._list_models()}
+            with self._lock:
+                self._models = models
+                self._fetched_at = time.monotonic()
+                self._failed_at = None
+        except Exception:
+            with self._lock:
+                self._failed_at = time.monotonic()
+            logger.warning("Failed to refresh Ollama model inventory", exc_info=True)
+        finally:
+            self._refreshing.release()
+
+    def models(self):
+        """Returns the cached inventory, loading it synchronously only on first use.
+
+        While Ollama is unreachable, the last known inventory (or an empty one)
+        is returned without waiting, and a refresh is retried in the background
+        once `failure_ttl` has passed.
+        """
+        with self._lock:
+            models, fetched_at, failed_at = self._models, self._fetched_at, self._failed_at
+        if models is None and failed_at is None:
+            self.refresh(wait=True)
+            with self._lock:
+                return set(self._models or ())
+        now = time.monotonic()
+        stale = models is None or now - fetched_at > self.ttl
+        backing_off = failed_at is not None and now - failed_at < self.failure_ttl
+        if stale and not backing_off and not self._refreshing.locked():
+            threading.Thread(target=self.refresh, daemon=True).start()
+        return set(models or ())
+
+    @property
+    def reachable(self):
+        """False until the inventory has been fetched from Ollama at least once."""
+        return self._models is not None
+
+    def is_available(self, model_name):
+        return normalize_model_name(model_name) in self.models()
+
+    def get_pull(self, model_name):
+        with self._lock:
+            return self._pulls.get(normalize_model_name(model_name))
+
+    def start_pull(self, model_name, retry=False):
+        """Starts pulling a model in the background, or returns the existing job.
+
+        A failed pull is kept, so its error can be shown, until `retry` restarts
+        it. A successful one is forgotten once the inventory lists the model, so
+        a model removed from Ollama later is pulled again.
+        """
+        name = normalize_model_name(model_name)
+        with self._lock:
+            job = self._pulls.get(name)
+            if job is not None and (not job.done or (job.status == "failed" and not retry)):
+                return job
+            job = PullJob(name)
+            self._pulls[name] = job
+        threading.Thread(target=self._run_pull, args=(job,), name=f"pull-{name}", daemon=True).start()
+        return job
+
+    def _run_pull(self, job):
+        logger.info(f"Pulling model {job.model_name}...")
+        job.status = "pulling"
+        try:
+            for update in self._pull_model(job.model_name):
+                total = getattr(update, "total", None)
+                completed = getattr(update, "completed", None)
+                if total:
+                    job.total = total
+                    job.completed = completed or 0
+            self.refresh(wait=True)
+            job.status = "success" if job.model_name in self.models() else "failed"
+            if job.status == "failed":
+                job.error = "Model not listed after pull"
+            else:
+                with self._lock:
+                    if self._pulls.get(job.model_name) is job:
+                        del self._pulls[job.model_name]
+                publish("models")
+        except Exception as e:
+            logger.error(f"Error pulling model {job.model_name}", exc_info=True)
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.monotonic()
+            logger.info(f"Pull of {job.model_name} finished: {job.status}")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """Returns the process-wide model registry, starting its refresh thread on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+                _registry.start()
+    return _registry
+
+
+def _refresh_inventory():
+    # A model was pulled, maybe by another replica: pick it up before the next scheduled refresh
+    if _registry is not None:
+        threading.Thread(target=_registry.refresh, daemon=True).start()
+
+
+subscribe("models", _refresh_inventory)
@@ -0,0 +1,285 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import get_ollama_client
+from const import OLLAMA_HOSTS, OLLAMA_AFFINITY_SLACK, OLLAMA_HOST_PARALLEL
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_REQUESTS = counter(
+    "chat_ollama_requests_total",
+    "Chat requests sent to each Ollama host, by outcome (ok, error, failover).",
+    labels=("host", "result"))
+OLLAMA_PROBES = counter(
+    "chat_ollama_probes_total",
+    "Health and inventory probes of each Ollama host, by outcome.",
+    labels=("host", "result"))
+MODEL_COLD_STARTS = counter(
+    "chat_model_cold_starts_total",
+    "Chat requests sent to a host that did not have the model loaded.",
+    labels=("model",))
+MODEL_LOAD_EVENTS = counter(
+    "chat_model_load_events_total",
+    "Models seen loaded into or unloaded from a host's memory between probes.",
+    labels=("host", "model", "event"))
+
+MAX_AFFINITY_ENTRIES = 10000
+
+
+def normalize_model_name(name):
+    """Ollama lists untagged models as `name:latest`."""
+    return name if ":" in name else f"{name}:latest"
+
+
+class NoHealthyHostError(ConnectionError):
+    """Raised when no Ollama host can serve a model."""
+
+
+class OllamaHost:
+    """State of one Ollama endpoint, as seen by the last probe and our own requests.
+
+    `healthy` is None until the first probe, and such hosts are still tried.
+    """
+
+    def __init__(self, url, client=None):
+        self.url = url
+        self._client = client
+        self.healthy = None
+        self.models = None  # installed models, None until probed
+        self.loaded = set()  # models resident in memory
+        self.in_flight = 0
+        self.latency = 0.0  # seconds taken by the last probe
+        self.last_error = None
+        self.probed_at = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_ollama_client(self.url)
+        return self._client
+
+    def can_serve(self, model):
+        return self.healthy is not False and (self.models is None or model in self.models)
+
+    def load(self, model, parallel):
+        """Sort key: hosts with the model loaded and a free slot first, then fewest requests, then fastest."""
+        return (model not in self.loaded or self.in_flight >= parallel, self.in_flight, self.latency)
+
+    def snapshot(self):
+        return {"host": self.url, "healthy": self.healthy, "in_flight": self.in_flight,
+                "models": sorted(self.models or ()), "loaded": sorted(self.loaded),
+                "latency_ms": self.latency * 1000, "last_error": self.last_error}
+
+
+class OllamaRouter:
+    """Routes chat requests across a pool of Ollama hosts.
+
+    Each request goes to the least-loaded healthy host that already has the
+    model loaded, or failing that one that has it installed. Once every such
+    host runs `parallel` requests, new ones spill over to idle hosts that
+    still have to load it. A session sticks to its last host while that host
+    is within `affinity_slack` requests of the best one, so Ollama can reuse
+    its prompt cache. A host that fails before streaming the first token is
+    marked down and the request moves on to the next host; probes bring it
+    back once it answers again.
+    """
+
+    def __init__(self, hosts=OLLAMA_HOSTS, parallel=OLLAMA_HOST_PARALLEL, affinity_slack=OLLAMA_AFFINITY_SLACK,
+                 client_factory=None):
+        if not hosts:
+            raise ValueError("At least one Ollama host is required")
+        self.hosts = [OllamaHost(url, client_factory(url) if client_factory else None) for url in hosts]
+        self.parallel = parallel
+        self.affinity_slack = affinity_slack
+        self._affinity = OrderedDict()  # session key -> host url
+        self._lock = threading.Lock()
+        self._probe_pool = ThreadPoolExecutor(max_workers=len(self.hosts), thread_name_prefix="ollama-probe")
+
+    # Probes
+
+    def probe(self, host):
+        """Refreshes a host's installed and loaded models; marks it down if it does not answer."""
+        start = time.perf_counter()
+        try:
+            models = {normalize_model_name(m.model) for m in host.client.list().models}
+            loaded = {normalize_model_name(m.model) for m in host.client.ps().models}
+        except Exception as e:
+            OLLAMA_PROBES.inc(host=host.url, result="error")
+            with self._lock:
+                was_healthy = host.healthy
+                host.healthy = False
+                host.last_error = str(e)
+                host.probed_at = time.monotonic()
+            if was_healthy is not False:
+                logger.warning(f"Ollama host {host.url} is down: {e}")
+            return
+        OLLAMA_PROBES.inc(host=host.url, result="ok")
+        with self._lock:
+            if host.healthy is False:
+                logger.info(f"Ollama host {host.url} is back up")
+            if host.probed_at is not None:
+                for model in loaded - host.loaded:
+                    MODEL_LOAD_EVENTS.inc(host=host.url, model=model, event="load")
+                for model in host.loaded - loaded:
+                    MODEL_LOAD_EVENTS.inc(host=host.url, model=model, event="unload")
+            host.healthy = True
+            host.models = models
+            host.loaded = loaded
+            host.latency = time.perf_counter() - start
+            host.last_error = None
+            host.probed_at = time.monotonic()
+
+    def probe_all(self):
+        """Probes every host concurrently and waits for all of them."""
+        list(self._probe_pool.map(self.probe, self.hosts))
+
+    def list_models(self):
+        """Probes the pool and returns the models installed on any healthy host."""
+        self.probe_all()
+        with self._lock:
+            healthy = [h for h in self.hosts if h.healthy]
+            if not healthy:
+                raise NoHealthyHostError(f"No Ollama host reachable: {', '.join(h.url for h in self.hosts)}")
+            return set().union(*(h.models for h in healthy))
+
+    # Routing
+
+    def select(self, model, session_key=None, exclude=()):
+        """Returns the host to send `model` requests to, or None if no host can serve it."""
+        model = normalize_model_name(model)
+        with self._lock:
+            candidates = [h for h in self.hosts if h.url not in exclude and h.can_serve(model)]
+            if not candidates:
+                return None
+            best = min(candidates, key=lambda h: h.load(model, self.parallel))
+            sticky = self._affinity.get(session_key) if session_key is not None else None
+            for host in candidates:
+                if (host.url == sticky and host is not best
+                        and (model in host.loaded or model not in best.loaded)
+                        and host.in_flight <= best.in_flight + self.affinity_slack):
+                    return host
+            return best
+
+    def _begin(self, host, model):
+        with self._lock:
+            host.in_flight += 1
+            cold = model not in host.loaded
+        if cold:
+            MODEL_COLD_STARTS.inc(model=model)
+
+    def _end(self, host, model, session_key, error=None):
+        with self._lock:
+            host.in_flight -= 1
+            if error is None:
+                host.loaded.add(model)
+                if session_key is not None:
+                    self._affinity[session_key] = host.url
+                    self._affinity.move_to_end(session_key)
+                    while len(self._affinity) > MAX_AFFINITY_ENTRIES:
+                        self._affinity.popitem(last=False)
+                return
+            host.last_error = str(error)
+            status = getattr(error, "status_code", None)
+            if status is not None and status < 500:
+                # The host answered; it just cannot serve this model
+                if status == 404 and host.models is not None:
+                    host.models.discard(model)
+                host.loaded.discard(model)
+            else:
+                host.healthy = False
+
+    def chat(self, model, messages, session_key=None, **kwargs):
+        """Streams a chat response from the best host, failing over to the next
+        one while no token has been streamed yet.
+
+        A failure after the first token is raised: the partial reply cannot be
+        resumed elsewhere, but the host is marked down so the session's next
+        request goes to another host.
+        """
+        model = normalize_model_name(model)
+        tried = set()
+        last_error = None
+        while True:
+            host = self.select(model, session_key, exclude=tried)
+            if host is None:
+                if last_error is not None:
+                    raise last_error
+                raise NoHealthyHostError(f"No healthy Ollama host has model {model}")
+            tried.add(host.url)
+            self._begin(host, model)
+            streamed = False
+            try:
+                for chunk in host.client.chat(model=model, messages=messages, stream=True, **kwargs):
+                    streamed = True
+                    yield chunk
+            except GeneratorExit:
+                self._end(host, model, None)
+                raise
+            except Exception as e:
+                self._end(host, model, session_key, error=e)
+                if streamed:
+                    OLLAMA_REQUESTS.inc(host=host.url, result="error")
+                    logger.error(f"Ollama host {host.url} failed mid-stream", exc_info=True)
+                    raise
+                OLLAMA_REQUESTS.inc(host=host.url, result="failover")
+                logger.warning(f"Ollama host {host.url} failed before streaming, failing over: {e}")
+                last_error = e
+                continue
+            self._end(host, model, session_key)
+            OLLAMA_REQUESTS.inc(host=host.url, result="ok")
+            return
+
+    def warm(self, model, session_key=None, **kwargs):
+        """Loads a model on the host that would serve the session's next request.
+
+        Returns that host's url, or None when the model was already loaded there.
+        """
+        model = normalize_model_name(model)
+        host = self.select(model, session_key)
+        if host is None:
+            raise NoHealthyHostError(f"No healthy Ollama host has model {model}")
+        with self._lock:
+            if model in host.loaded:
+                return None
+        # A generate request without a prompt only loads the model
+        host.client.generate(model=model, prompt="", **kwargs)
+        with self._lock:
+            host.loaded.add(model)
+        return host.url
+
+    def loaded_models(self):
+        """Returns {(host, model): 1 if loaded else 0} for every model installed on a healthy host."""
+        with self._lock:
+            return {(h.url, model): int(model in h.loaded)
+                    for h in self.hosts if h.healthy for model in (h.models or h.loaded)}
+
+    def pull(self, model):
+        """Pulls a model on the least-busy healthy host; returns Ollama's progress stream."""
+        with self._lock:
+            candidates = [h for h in self.hosts if h.healthy is not False]
+            if not candidates:
+                raise NoHealthyHostError("No healthy Ollama host to pull to")
+            host = min(candidates, key=lambda h: (h.in_flight, h.latency))
+        logger.info(f"Pulling {model} on {host.url}")
+        return host.client.pull(model, stream=True)
+
+    def stats(self):
+        with self._lock:
+            return [h.snapshot() for h in self.hosts]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_ollama_router():
+    """Returns the process-wide router over OLLAMA_HOSTS."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = OllamaRouter()
+    return _router
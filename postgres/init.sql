@@ -12,5 +12,15 @@ CREATE TABLE IF NOT EXISTS messages (
     session_id INT REFERENCES sessions(id) ON DELETE CASCADE,
     role TEXT NOT NULL, -- "user" or "assistant"
     content TEXT NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    reasoning TEXT, -- the model's <think> block, kept out of prompts
+    rendered TEXT, -- markdown to display, when it differs from content
+    tokens INT, -- prompt token count of content
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED
 );
+
+-- Keyset pagination over a session's history (newest N, then "load older")
+CREATE INDEX IF NOT EXISTS idx_messages_session_created_at ON messages (session_id, created_at, id);
+
+-- Full-text search over message content
+CREATE INDEX IF NOT EXISTS idx_messages_content_tsv ON messages USING GIN (content_tsv);
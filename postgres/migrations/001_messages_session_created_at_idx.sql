@@ -0,0 +1,3 @@
+-- Adds the history pagination index to databases created before it was part of init.sql.
+-- Run with: docker exec -i my_postgres psql -U postgres -d chat_db < postgres/migrations/001_messages_session_created_at_idx.sql
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_session_created_at ON messages (session_id, created_at, id);
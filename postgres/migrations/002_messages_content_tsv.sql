@@ -0,0 +1,7 @@
+-- Adds full-text search to databases created before it was part of init.sql.
+-- Adding the generated column rewrites the messages table under an exclusive lock,
+-- computing the tsvector of every existing message; run it during a quiet period.
+-- Run with: docker exec -i my_postgres psql -U postgres -d chat_db < postgres/migrations/002_messages_content_tsv.sql
+ALTER TABLE messages
+    ADD COLUMN IF NOT EXISTS content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_content_tsv ON messages USING GIN (content_tsv);
@@ -0,0 +1,4 @@
+-- Stores the reasoning of DeepSeek-R1 answers apart from their content.
+-- Adding a nullable column without a default only updates the catalog.
+-- Run with: docker exec -i my_postgres psql -U postgres -d chat_db < postgres/migrations/003_messages_reasoning.sql
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS reasoning TEXT;
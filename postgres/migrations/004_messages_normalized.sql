@@ -0,0 +1,7 @@
+-- Stores the display markdown and prompt token count computed when a message is written.
+-- Older messages keep NULLs, and are normalized again on every history load, until
+-- backfilled with: python -m session_transfer normalize
+-- Run with: docker exec -i my_postgres psql -U postgres -d chat_db < postgres/migrations/004_messages_normalized.sql
+ALTER TABLE messages
+    ADD COLUMN IF NOT EXISTS rendered TEXT,
+    ADD COLUMN IF NOT EXISTS tokens INT;
@@ -0,0 +1,298 @@
+import io
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from const import (DB_PARAMS, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT,
+                   DB_POOL_HEALTH_CHECK_INTERVAL, DB_POOL_LEAK_THRESHOLD, DB_POOL_TRACK_STACKS,
+                   DB_POOL_CONNECT_BACKOFF, EXPORT_FETCH_SIZE, IMPORT_BATCH_SIZE)
+from db_pool import ConnectionPool
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psycopg2
+    from psycopg2.extras import execute_values
+except ImportError as e:
+    logger.error("Failed to import psycopg2. Please install it using: pip install psycopg2", exc_info=True)
+    raise
+
+# ts_headline settings for search snippets
+HEADLINE_OPTIONS = 'StartSel=**, StopSel=**, MaxWords=30, MinWords=12, MaxFragments=2, FragmentDelimiter=" … "'
+
+MAX_RETRIES = 3
+RETRY_DELAY = 1  # seconds
+
+
+def _connect(attempts=MAX_RETRIES):
+    """Opens a new PostgreSQL connection, retrying transient failures.
+
+    Sessions run in UTC, so CURRENT_TIMESTAMP defaults match the naive UTC
+    timestamps the app writes for messages whatever the server's time zone.
+    """
+    params = dict(DB_PARAMS, options=f"{DB_PARAMS.get('options', '')} -c timezone=UTC".strip())
+    for attempt in range(attempts):
+        try:
+            return psycopg2.connect(**params)
+        except Exception as e:
+            if attempt == attempts - 1:
+                logger.error(f"Failed to connect to PostgreSQL database after {attempts} attempts", exc_info=True)
+                logger.error(f"Database parameters: host={DB_PARAMS['host']}, port={DB_PARAMS['port']}, dbname={DB_PARAMS['dbname']}, user={DB_PARAMS['user']}")
+                raise
+            logger.warning(f"Database connection attempt {attempt + 1} failed, retrying...")
+            time.sleep(RETRY_DELAY)
+
+
+def _cursor_clause(op, cursor):
+    """Builds a keyset predicate for a (created_at, id) cursor; id may be unknown."""
+    created_at, message_id = cursor
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    if message_id is None:
+        return f"created_at {op} %s", [created_at]
+    return f"(created_at, id) {op} (%s, %s)", [created_at, message_id]
+
+
+# COPY text format: backslash escapes for the row and field delimiters, \N for NULL
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _copy_messages(cur, buffer):
+    """Loads the buffered message rows with one COPY."""
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY messages (session_id, role, content, created_at, reasoning, rendered, tokens) FROM STDIN;", buffer)
+
+
+class PostgresStorage(Storage):
+    """Storage on PostgreSQL through a process-wide connection pool."""
+
+    name = "postgres"
+
+    def __init__(self, connect=None):
+        self._connect = connect or _connect
+        # Pooled connects serve page renders: one attempt, then the pool backs off
+        self.pool = ConnectionPool(
+            connect or (lambda: _connect(attempts=1)),
+            minconn=DB_POOL_MIN,
+            maxconn=DB_POOL_MAX,
+            timeout=DB_POOL_TIMEOUT,
+            health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
+            leak_threshold=DB_POOL_LEAK_THRESHOLD,
+            track_stacks=DB_POOL_TRACK_STACKS,
+            connect_backoff=DB_POOL_CONNECT_BACKOFF,
+        )
+
+    @contextmanager
+    def connection(self):
+        """Checks out a pooled connection; commits on success and rolls back on error."""
+        with self.pool.connection() as conn:
+            yield conn
+
+    @contextmanager
+    def bulk_connection(self):
+        """Opens a connection outside the pool for a long-running export or import,
+        so it neither holds a pool slot nor trips the pool's leak detection."""
+        conn = self._connect()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    # Sessions
+
+    def save_session(self, name, model):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO sessions (name, model) VALUES (%s, %s) ON CONFLICT (name) DO NOTHING RETURNING id;",
+                (name, model)
+            )
+            row = cur.fetchone()
+            return row[0] if row else None
+
+    def get_session(self, name):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id, model FROM sessions WHERE name = %s;", (name,))
+            return cur.fetchone()
+
+    def list_sessions(self):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT name, model FROM sessions ORDER BY created_at DESC, id DESC;")
+            return cur.fetchall()
+
+    def session_exists(self, name):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM sessions WHERE name = %s;", (name,))
+            return cur.fetchone() is not None
+
+    def rename_session(self, old_name, new_name):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("UPDATE sessions SET name = %s WHERE name = %s;", (new_name, old_name))
+            return cur.rowcount > 0
+
+    def delete_session(self, name):
+        with self.connection() as conn, conn.cursor() as cur:
+            # Messages are removed by ON DELETE CASCADE
+            cur.execute("DELETE FROM sessions WHERE name = %s RETURNING id;", (name,))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+    # Messages
+
+    def save_message(self, session_id, role, content, reasoning=None, rendered=None, tokens=None):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("INSERT INTO messages (session_id, role, content, reasoning, rendered, tokens) "
+                        "VALUES (%s, %s, %s, %s, %s, %s) RETURNING id, created_at;",
+                        (session_id, role, content, reasoning, rendered, tokens))
+            return cur.fetchone()
+
+    def save_messages(self, rows):
+        with self.connection() as conn, conn.cursor() as cur:
+            execute_values(
+                cur,
+                "INSERT INTO messages (session_id, role, content, created_at, reasoning, rendered, tokens) "
+                "SELECT v.session_id, v.role, v.content, v.created_at, v.reasoning, v.rendered, v.tokens "
+                "FROM (VALUES %s) AS v(session_id, role, content, created_at, reasoning, rendered, tokens) "
+                "WHERE EXISTS (SELECT 1 FROM sessions s WHERE s.id = v.session_id);",
+                rows,
+                template="(%s::int, %s, %s, %s::timestamp, %s::text, %s::text, %s::int)",
+                page_size=len(rows))
+
+    def get_unnormalized_messages(self, limit, after=0):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT id, role, content, reasoning FROM messages WHERE tokens IS NULL AND id > %s "
+                "ORDER BY id LIMIT %s;", (after, limit))
+            return cur.fetchall()
+
+    def save_normalized_messages(self, rows):
+        with self.connection() as conn, conn.cursor() as cur:
+            execute_values(
+                cur,
+                "UPDATE messages AS m SET content = v.content, reasoning = v.reasoning, "
+                "rendered = v.rendered, tokens = v.tokens "
+                "FROM (VALUES %s) AS v(id, content, reasoning, rendered, tokens) WHERE m.id = v.id;",
+                rows,
+                template="(%s::int, %s, %s::text, %s::text, %s::int)",
+                page_size=len(rows))
+
+    def get_chat_history(self, session_id):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT role, content FROM messages WHERE session_id = %s ORDER BY created_at ASC, id ASC;",
+                (session_id,))
+            return cur.fetchall()
+
+    def get_chat_history_page(self, session_id, limit, before=None, after=None):
+        clauses = ["session_id = %s"]
+        params = [session_id]
+        for op, cursor in (("<", before), (">", after)):
+            if cursor is not None:
+                clause, values = _cursor_clause(op, cursor)
+                clauses.append(clause)
+                params.extend(values)
+        params.append(limit)
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT id, role, content, created_at, reasoning, rendered, tokens "
+                f"FROM messages WHERE {' AND '.join(clauses)} "
+                "ORDER BY created_at DESC, id DESC LIMIT %s;", params)
+            rows = cur.fetchall()
+        rows.reverse()
+        return rows
+
+    # Export and import
+
+    def iter_export_rows(self, after=None, fetch_size=EXPORT_FETCH_SIZE):
+        where, params = "", []
+        if after is not None:
+            session_id, created_at, message_id = after
+            if message_id is None:
+                where = "WHERE s.id > %s OR (s.id = %s AND m.id IS NOT NULL)"
+                params = [session_id, session_id]
+            else:
+                if isinstance(created_at, str):
+                    created_at = datetime.fromisoformat(created_at)
+                where = "WHERE s.id > %s OR (s.id = %s AND (m.created_at, m.id) > (%s, %s))"
+                params = [session_id, session_id, created_at, message_id]
+        with self.bulk_connection() as conn:
+            # A named cursor keeps the result on the server; rows arrive fetch_size at a time
+            with conn.cursor(name="session_export") as cur:
+                cur.itersize = fetch_size
+                cur.execute(
+                    "SELECT s.id, s.name, s.model, s.created_at, m.id, m.role, m.content, m.created_at, "
+                    "m.reasoning, m.rendered, m.tokens "
+                    f"FROM sessions s LEFT JOIN messages m ON m.session_id = s.id {where} "
+                    "ORDER BY s.id, m.created_at, m.id;", params)
+                yield from cur
+
+    def import_rows(self, records, batch_size=IMPORT_BATCH_SIZE):
+        counts = {"sessions": 0, "skipped": 0, "messages": 0}
+        session_id = None
+        buffer, pending = io.StringIO(), 0
+        with self.bulk_connection() as conn, conn.cursor() as cur:
+            for record in records:
+                if record[0] == "session":
+                    _, name, model, created_at = record
+                    cur.execute(
+                        "INSERT INTO sessions (name, model, created_at) "
+                        "VALUES (%s, %s, COALESCE(%s::timestamp, CURRENT_TIMESTAMP)) "
+                        "ON CONFLICT (name) DO NOTHING RETURNING id;", (name, model, created_at))
+                    row = cur.fetchone()
+                    session_id = row[0] if row else None
+                    counts["sessions" if row else "skipped"] += 1
+                elif session_id is not None:
+                    buffer.write("\t".join(_copy_value(v) for v in (session_id, *record[1:])) + "\n")
+                    pending += 1
+                    counts["messages"] += 1
+                    if pending >= batch_size:
+                        _copy_messages(cur, buffer)
+                        buffer, pending = io.StringIO(), 0
+            if pending:
+                _copy_messages(cur, buffer)
+        return counts
+
+    # Search
+
+    def search_messages(self, query, limit, offset=0):
+        # Rank every match using the GIN index, but only build snippets for the page
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT s.name, m.session_id, m.id, m.role, "
+                "ts_headline('english', m.content, m.query, %s), m.created_at "
+                "FROM ("
+                "    SELECT id, session_id, role, content, created_at, query, "
+                "           ts_rank_cd(content_tsv, query) AS rank "
+                "    FROM messages, websearch_to_tsquery('english', %s) AS query "
+                "    WHERE content_tsv @@ query "
+                "    ORDER BY rank DESC, id DESC LIMIT %s OFFSET %s"
+                ") m JOIN sessions s ON s.id = m.session_id "
+                "ORDER BY m.rank DESC, m.id DESC;",
+                (HEADLINE_OPTIONS, query, limit, offset))
+            return cur.fetchall()
+
+    # Lifecycle
+
+    def is_transient_error(self, error):
+        # Data, integrity and programming errors fail the same way on every attempt
+        return super().is_transient_error(error) or isinstance(
+            error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+    def stats(self):
+        return self.pool.stats()
+
+    def close(self):
+        self.pool.closeall()
@@ -0,0 +1,106 @@
+from const import REASONING_MODELS
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+# Parser states
+_START = "start"  # only whitespace so far: a reasoning block may still open
+_UNSURE = "unsure"  # leading text of a reasoning model: a bare </think> turns it into reasoning
+_REASONING = "reasoning"
+_ANSWER = "answer"  # after the reasoning block or any answer text, tags are ordinary text
+
+
+def is_reasoning_model(model_name):
+    """Whether a model's chat template may open the <think> block in the prompt."""
+    return bool(model_name) and model_name.split(":", 1)[0] in REASONING_MODELS
+
+
+class ThinkParser:
+    """Incrementally splits streamed model output into reasoning and answer.
+
+    DeepSeek-R1 wraps its chain of thought in one leading <think>...</think>
+    block; some chat templates open the block in the prompt, so the output only
+    contains the closing tag. With `implicit_open`, for such models, a bare
+    </think> turns the text before it into reasoning, unless a <think> came
+    first. Tags anywhere else, such as after answer text, are ordinary text.
+    Chunks may end in the middle of a tag: a suffix that could start one is
+    held back until the next chunk decides it.
+    """
+
+    def __init__(self, implicit_open=False):
+        self._implicit_open = implicit_open
+        self._state = _START
+        self._pending = ""
+        self._reasoning = []
+        self._answer = []
+
+    def _tags(self):
+        if self._state == _START:
+            return (THINK_OPEN, THINK_CLOSE) if self._implicit_open else (THINK_OPEN,)
+        if self._state == _UNSURE:
+            return (THINK_OPEN, THINK_CLOSE)
+        if self._state == _REASONING:
+            return (THINK_CLOSE,)
+        return ()
+
+    def _emit(self, text):
+        if not text:
+            return
+        if self._state == _REASONING:
+            self._reasoning.append(text)
+            return
+        self._answer.append(text)
+        if self._state == _START and not text.isspace():
+            self._state = _UNSURE if self._implicit_open else _ANSWER
+
+    def feed(self, text):
+        data = self._pending + text
+        self._pending = ""
+        while data:
+            tags = self._tags()
+            matches = [(data.find(tag), tag) for tag in tags if tag in data]
+            if matches:
+                index, tag = min(matches)
+                self._emit(data[:index])
+                data = data[index:]
+                if tag not in self._tags():
+                    continue  # the text before the tag made it ordinary text
+                data = data[len(tag):]
+                if tag == THINK_OPEN and self._state == _UNSURE:
+                    # An opening tag after text: the output did not start inside a reasoning block
+                    self._answer.append(tag)
+                    self._state = _ANSWER
+                elif tag == THINK_OPEN:
+                    self._state = _REASONING
+                elif self._state == _REASONING:
+                    self._state = _ANSWER
+                else:
+                    # Closing tag without an opening one: everything so far was reasoning
+                    self._reasoning, self._answer = self._answer, []
+                    self._state = _ANSWER
+                continue
+            keep = max((k for tag in tags for k in range(1, len(tag)) if data.endswith(tag[:k])), default=0)
+            self._emit(data[:len(data) - keep])
+            self._pending = data[len(data) - keep:]
+            break
+
+    def close(self):
+        """Flushes a held-back partial tag as text."""
+        pending, self._pending = self._pending, ""
+        self._emit(pending)
+
+    @property
+    def reasoning(self):
+        return "".join(self._reasoning).strip()
+
+    @property
+    def answer(self):
+        return "".join(self._answer).strip()
+
+
+def split_reasoning(text, implicit_open=False):
+    """Returns (reasoning, answer) of a complete model response."""
+    parser = ThinkParser(implicit_open)
+    parser.feed(text)
+    parser.close()
+    return parser.reasoning, parser.answer
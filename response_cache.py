@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+import re
+import time
+from config import get_cache
+from const import RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES
+from utils import extract_chunk_content
+from metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = "response:"
+# Sorted set of cached keys scored by last access, used for LRU eviction
+_LRU_KEY = "response-cache:lru"
+_STATS_KEY = "response-cache:stats"
+# Characters per replayed chunk, so cached answers stream like live ones
+REPLAY_CHUNK_CHARS = 16
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def response_cache_key(model_name, messages):
+    """Keys a response by model and a hash of the whitespace-normalized messages."""
+    normalized = [[m["role"], _WHITESPACE.sub(" ", m["content"]).strip()] for m in messages]
+    digest = hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"{_KEY_PREFIX}{model_name}:{digest}"
+
+
+def get_cached_response(model_name, messages):
+    """Returns the cached response text for these messages, or None."""
+    key = response_cache_key(model_name, messages)
+    try:
+        cache = get_cache()
+        response = cache.get(key)
+        record_cache_lookup("response", hit=response is not None)
+        pipe = cache.pipeline(transaction=False)
+        if response is not None:
+            pipe.zadd(_LRU_KEY, {key: time.time()})
+            pipe.expire(key, RESPONSE_CACHE_TTL)
+        pipe.hincrby(_STATS_KEY, "hits" if response is not None else "misses", 1)
+        pipe.execute()
+        return response
+    except Exception:
+        logger.warning("Response cache lookup failed", exc_info=True)
+        return None
+
+
+def store_response(model_name, messages, response):
+    """Caches a response and evicts the least recently used entries over the limit."""
+    key = response_cache_key(model_name, messages)
+    try:
+        cache = get_cache()
+        pipe = cache.pipeline(transaction=False)
+        pipe.set(key, response, ex=RESPONSE_CACHE_TTL)
+        pipe.zadd(_LRU_KEY, {key: time.time()})
+        # Forget LRU entries whose keys already expired
+        pipe.zremrangebyscore(_LRU_KEY, "-inf", time.time() - RESPONSE_CACHE_TTL)
+        pipe.zcard(_LRU_KEY)
+        size = pipe.execute()[-1]
+
+        excess = size - RESPONSE_CACHE_MAX_ENTRIES
+        if excess > 0:
+            evicted = [member for member, _ in cache.zpopmin(_LRU_KEY, excess)]
+            if evicted:
+                cache.delete(*evicted)
+                cache.hincrby(_STATS_KEY, "evictions", len(evicted))
+    except Exception:
+        logger.warning("Failed to store response in cache", exc_info=True)
+
+
+def replay_response(response):
+    """Yields a cached response in small chunks, shaped like Ollama stream chunks."""
+    for start in range(0, len(response), REPLAY_CHUNK_CHARS):
+        yield {"content": response[start:start + REPLAY_CHUNK_CHARS]}
+
+
+def caching_stream(model_name, messages, stream):
+    """Passes a live stream through and caches the full response once it completes."""
+    parts = []
+    for chunk in stream:
+        content = extract_chunk_content(chunk) if chunk else None
+        if content:
+            parts.append(content)
+        yield chunk
+    if parts:
+        store_response(model_name, messages, "".join(parts))
+
+
+def get_response_cache_stats():
+    """Returns hit/miss/eviction counters and the number of cached responses."""
+    try:
+        cache = get_cache()
+        stats = {k: int(v) for k, v in cache.hgetall(_STATS_KEY).items()}
+        stats["entries"] = cache.zcard(_LRU_KEY)
+        lookups = stats.get("hits", 0) + stats.get("misses", 0)
+        stats["hit_rate"] = stats.get("hits", 0) / lookups if lookups else 0.0
+        return stats
+    except Exception:
+        logger.warning("Failed to read response cache stats", exc_info=True)
+        return {}
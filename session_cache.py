@@ -0,0 +1,55 @@
+import logging
+import threading
+import time
+from cluster import publish, subscribe
+from config import get_all_sessions
+from const import SESSION_LIST_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Process-wide cache of session names, newest first. It is invalidated
+# explicitly by create/rename/delete, on every replica through the cluster
+# bus; the TTL only bounds staleness when an invalidation is lost.
+_session_names = None
+_fetched_at = 0.0
+_generation = 0  # bumped by every invalidation
+_lock = threading.Lock()
+
+
+def get_session_names():
+    """Returns all session names, newest first, from the process cache."""
+    global _session_names, _fetched_at
+    with _lock:
+        if _session_names is not None and time.monotonic() - _fetched_at < SESSION_LIST_CACHE_TTL:
+            return _session_names
+        generation = _generation
+    names = get_all_sessions()
+    with _lock:
+        # An invalidation during the query may mean the names are already stale
+        if generation == _generation:
+            _session_names = names
+            _fetched_at = time.monotonic()
+    return names
+
+
+def _drop_session_list():
+    global _session_names, _generation
+    with _lock:
+        _session_names = None
+        _generation += 1
+
+
+def invalidate_session_list():
+    """Drops the cached session list on every replica so the next read goes to the database."""
+    publish("sessions")
+
+
+subscribe("sessions", _drop_session_list)
+
+
+def filter_sessions(names, query):
+    """Case-insensitive substring filter over session names."""
+    query = query.strip().lower()
+    if not query:
+        return names
+    return [name for name in names if query in name.lower()]
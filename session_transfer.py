@@ -0,0 +1,239 @@
+"""Streaming NDJSON export and import of sessions and their messages.
+
+An export is one JSON object per line: a header, then each session followed
+by its messages, then an end marker. Rows are streamed from a server-side
+cursor and imports are loaded in batches, so memory stays flat however much
+is stored. An interrupted export is resumed from its last complete line.
+
+`normalize` backfills the display markdown and token count of messages
+stored before they were computed on write; run it once after migration 004.
+
+    python -m session_transfer export backup.ndjson [--resume]
+    python -m session_transfer import backup.ndjson
+    python -m session_transfer normalize
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from config import iter_export_rows, import_rows, get_unnormalized_messages, save_normalized_messages
+from const import EXPORT_DIR, IMPORT_BATCH_SIZE
+from message_format import normalize_message
+from session_cache import invalidate_session_list
+
+FORMAT = "chat-deepseek-ui/sessions"
+FORMAT_VERSION = 1
+PROGRESS_EVERY = 1000  # messages between progress callbacks
+
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=datetime.isoformat) + "\n"
+
+
+def _tail(path, block_size=65536):
+    """Returns (last complete line, byte length up to the end of that line) of a file."""
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b""
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+            end = data.rfind(b"\n")
+            if end == -1:
+                continue
+            start = data.rfind(b"\n", 0, end)
+            if start != -1 or pos == 0:
+                return data[start + 1:end], pos + end + 1
+    return None, 0
+
+
+def _resume_point(path):
+    """Returns (cursor, complete) to continue an export file from.
+
+    A partly written last line is cut off first. The cursor is None when only
+    the header (or nothing) was written.
+    """
+    line, length = _tail(path)
+    if length != os.path.getsize(path):
+        with open(path, "rb+") as f:
+            f.truncate(length)
+    record = json.loads(line) if line else {"type": None}
+    if record["type"] == "end":
+        return None, True
+    if record["type"] == "session":
+        return (record["id"], None, None), False
+    if record["type"] == "message":
+        return (record["session_id"], record["created_at"], record["id"]), False
+    return None, False
+
+
+def export_sessions(path, resume=False, on_progress=None):
+    """Writes every session and its messages to an NDJSON file.
+
+    With `resume`, an existing file is continued after its last complete line
+    (a finished one is left as is). Returns the sessions and messages written
+    by this call, and whether it resumed an earlier export.
+    """
+    counts = {"sessions": 0, "messages": 0, "resumed": False}
+    after = None
+    if resume and os.path.exists(path) and os.path.getsize(path):
+        after, complete = _resume_point(path)
+        counts["resumed"] = True
+        if complete:
+            return counts
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a" if resume else "w", encoding="utf-8", newline="\n") as f:
+        if f.tell() == 0:
+            f.write(_dumps({"type": "header", "format": FORMAT, "version": FORMAT_VERSION,
+                            "exported_at": datetime.utcnow()}))
+        current = after[0] if after else None
+        for (session_id, name, model, session_created_at, message_id, role, content, created_at,
+             reasoning, rendered, tokens) in iter_export_rows(after):
+            if session_id != current:
+                f.write(_dumps({"type": "session", "id": session_id, "name": name, "model": model,
+                                "created_at": session_created_at}))
+                current = session_id
+                counts["sessions"] += 1
+            if message_id is None:
+                continue
+            f.write(_dumps({"type": "message", "session_id": session_id, "id": message_id, "role": role,
+                            "content": content, "created_at": created_at, "reasoning": reasoning,
+                            "rendered": rendered, "tokens": tokens}))
+            counts["messages"] += 1
+            if on_progress and counts["messages"] % PROGRESS_EVERY == 0:
+                on_progress(counts["sessions"], counts["messages"])
+        f.write(_dumps({"type": "end"}))
+        f.flush()
+        os.fsync(f.fileno())
+    return counts
+
+
+def read_records(lines, on_progress=None):
+    """Parses the lines of an export into the records Storage.import_rows takes.
+
+    Raises ValueError for a file that is not an export, that has a message
+    without a timestamp or that ends before its end marker, which rolls back
+    the import.
+    """
+    header = complete = False
+    sessions = messages = 0
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {e}")
+        kind = record.get("type")
+        if not header:
+            if kind != "header" or record.get("format") != FORMAT:
+                raise ValueError("Not a session export: the first line is not an export header")
+            if record.get("version", 0) > FORMAT_VERSION:
+                raise ValueError(f"Export format version {record['version']} is newer than this app supports")
+            header = True
+        elif kind == "session":
+            sessions += 1
+            yield "session", record["name"], record["model"], record.get("created_at")
+        elif kind == "message":
+            if not record.get("created_at"):
+                # COPY would store NULL, which has no place in the (created_at, id) message order
+                raise ValueError(f"Line {number}: message has no created_at")
+            messages += 1
+            yield ("message", record["role"], record["content"], record["created_at"],
+                   record.get("reasoning"), record.get("rendered"), record.get("tokens"))
+            if on_progress and messages % PROGRESS_EVERY == 0:
+                on_progress(sessions, messages)
+        elif kind == "end":
+            complete = True
+            break
+    if not complete:
+        raise ValueError("The export is incomplete; resume it before importing")
+
+
+def import_sessions(lines, on_progress=None):
+    """Imports an export in one transaction; sessions whose name is taken are skipped.
+
+    Returns {"sessions", "skipped", "messages"} counts.
+    """
+    counts = import_rows(read_records(lines, on_progress))
+    invalidate_session_list()
+    return counts
+
+
+def normalize_messages(batch_size=IMPORT_BATCH_SIZE, on_progress=None):
+    """Stores the normalized form of every message written before normalization.
+
+    Otherwise such messages are normalized again on every history load.
+    Returns the number of messages updated; safe to interrupt and re-run.
+    """
+    updated = after = 0
+    while True:
+        rows = get_unnormalized_messages(batch_size, after)
+        if not rows:
+            return updated
+        normalized = []
+        for message_id, role, content, reasoning in rows:
+            m = normalize_message(role, content, reasoning)
+            normalized.append((message_id, m["content"], m["reasoning"], m["rendered"], m["tokens"]))
+        save_normalized_messages(normalized)
+        after = rows[-1][0]
+        updated += len(rows)
+        if on_progress:
+            on_progress(updated)
+
+
+def new_export_path(directory=EXPORT_DIR):
+    return os.path.join(directory, f"sessions-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson")
+
+
+def incomplete_export(directory=EXPORT_DIR):
+    """Returns the newest export in `directory` if it was interrupted, else None."""
+    try:
+        names = sorted(n for n in os.listdir(directory) if n.startswith("sessions-") and n.endswith(".ndjson"))
+    except FileNotFoundError:
+        return None
+    if not names:
+        return None
+    path = os.path.join(directory, names[-1])
+    line, _ = _tail(path)
+    return None if line and json.loads(line).get("type") == "end" else path
+
+
+def _print_progress(sessions, messages):
+    print(f"\r{sessions} sessions, {messages} messages", end="", file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write all sessions to an NDJSON file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--resume", action="store_true", help="continue an interrupted export of PATH")
+    import_parser = commands.add_parser("import", help="load sessions from an NDJSON export")
+    import_parser.add_argument("path")
+    commands.add_parser("normalize", help="backfill the normalized form of messages stored before migration 004")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            counts = export_sessions(args.path, resume=args.resume, on_progress=_print_progress)
+            print(f"\r{'Resumed' if counts['resumed'] else 'Wrote'} {args.path}: "
+                  f"{counts['sessions']} sessions, {counts['messages']} messages", file=sys.stderr)
+        elif args.command == "normalize":
+            updated = normalize_messages(
+                on_progress=lambda n: print(f"\r{n} messages", end="", file=sys.stderr, flush=True))
+            print(f"\rNormalized {updated} messages", file=sys.stderr)
+        else:
+            with open(args.path, encoding="utf-8") as f:
+                counts = import_sessions(f, on_progress=_print_progress)
+            print(f"\rImported {counts['sessions']} sessions and {counts['messages']} messages; "
+                  f"skipped {counts['skipped']} existing sessions", file=sys.stderr)
+    except ValueError as e:
+        parser.exit(1, f"\nerror: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,42 @@
 import streamlit as st
-import json
-from config import save_session, get_db_connection, redis_client
-from const import AVAILABLE_MODELS, DEFAULT_MODEL
-from utils import logger
+from config import (save_session, get_session, list_sessions, session_exists,
+                    rename_session as rename_stored_session, delete_session as delete_stored_session)
+from history_cache import load_history, invalidate_history
+from session_cache import invalidate_session_list
+from model_lifecycle import get_model_lifecycle
+from cluster import new_client_token, valid_client_token, save_active_session, load_active_session
+from const import AVAILABLE_MODELS, DEFAULT_MODEL, CLUSTER_SYNC
+
+
+def _client_token():
+    """Identifies this browser to every replica by a random token in the page URL."""
+    token = st.query_params.get("client")
+    if not valid_client_token(token):
+        token = new_client_token()
+        st.query_params["client"] = token
+    return token
+
+
+def set_active_session(session_name):
+    """Makes a session active for this browser, on whichever replica serves it next."""
+    st.session_state["active_session"] = session_name
+    if CLUSTER_SYNC:
+        save_active_session(_client_token(), session_name)
+
+
+def restore_active_session():
+    """Restores the active session on the first run of a browser session.
+
+    Without sticky sessions, a reload or reconnect may land on another replica
+    with empty session state; the active session is then read back from Redis.
+    """
+    if not CLUSTER_SYNC or "active_session" in st.session_state:
+        return
+    st.session_state["active_session"] = load_active_session(_client_token()) or "Default"
 
 
 def initialize_session():
-    """Initializes session state and loads chat history from PostgreSQL & Redis."""
+    """Initializes session state and loads chat history from storage and the cache."""
     try:
         # Ensure session state variables exist
         if "messages" not in st.session_state:
@@ -15,9 +45,9 @@ def initialize_session():
         if "sessions" not in st.session_state:
             st.session_state["sessions"] = {}
 
-        # Get PostgreSQL and Redis connections
+        # Load sessions from storage
         try:
-            db_conn = get_db_connection()
+            sessions = list_sessions()
         except Exception as e:
             st.error("⚠️ Failed to connect to database. Please check your connection.")
             st.info("💡 Using default session settings.")
@@ -25,70 +55,34 @@ def initialize_session():
             st.session_state["active_session"] = "Default"
             return
 
-        try:
-            with db_conn.cursor() as cursor:
-                # Load sessions from database
-                cursor.execute(
-                    "SELECT name, model FROM sessions ORDER BY created_at DESC;")
-                sessions = cursor.fetchall()
+        st.session_state["sessions"] = {
+            name: model for name, model in sessions}
 
+        # Ensure at least one session exists
+        if not st.session_state["sessions"]:
+            default_session_name = "Default"
+            default_model = DEFAULT_MODEL
+            try:
+                save_session(default_session_name, default_model)
+                invalidate_session_list()
                 st.session_state["sessions"] = {
-                    name: model for name, model in sessions}
-
-                # Ensure at least one session exists
-                if not st.session_state["sessions"]:
-                    default_session_name = "Default"
-                    default_model = DEFAULT_MODEL
-                    try:
-                        cursor.execute("INSERT INTO sessions (name, model) VALUES (%s, %s) RETURNING id;",
-                                   (default_session_name, default_model))
-                        db_conn.commit()
-                        st.session_state["sessions"] = {
-                            default_session_name: default_model}
-                    except Exception as e:
-                        st.error("⚠️ Failed to create default session.")
-                        return
-
-                # Load active session
-                if "active_session" not in st.session_state:
-                    st.session_state["active_session"] = list(st.session_state["sessions"].keys())[0]
-
-                active_session = st.session_state["active_session"]
-
-                # Try Redis cache first
-                try:
-                    cached_messages = redis_client.get(f"chat:{active_session}")
-                    if cached_messages:
-                        try:
-                            st.session_state["messages"] = {active_session: json.loads(cached_messages)}
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Corrupted cache for session {active_session}", exc_info=True)
-                            # If cache is corrupted, fall back to database
-                            redis_client.delete(f"chat:{active_session}")
-                            st.warning("💡 Cache corrupted, falling back to database.")
-                            raise Exception("Cache corrupted")
-                except Exception:
-                    # If Redis fails or cache is corrupted, load from PostgreSQL
-                    cursor.execute(
-                        "SELECT role, content FROM messages WHERE session_id = (SELECT id FROM sessions WHERE name = %s) ORDER BY created_at;",
-                        (active_session,))
-                    messages = cursor.fetchall()
-
-                    st.session_state["messages"] = {active_session: [
-                        {"role": role, "content": content} for role, content in messages]}
-
-                    # Try to update Redis cache
-                    try:
-                        # Ensure messages can be serialized to JSON
-                        messages_json = json.dumps(st.session_state["messages"][active_session])
-                        redis_client.set(f"chat:{active_session}", messages_json, ex=3600)
-                    except (TypeError, json.JSONEncodeError) as e:
-                        logger.error(f"Failed to serialize messages for session {active_session}", exc_info=True)
-                    except Exception as e:
-                        logger.error(f"Failed to update Redis cache for session {active_session}", exc_info=True)
-
-        finally:
-            db_conn.close()
+                    default_session_name: default_model}
+            except Exception as e:
+                st.error("⚠️ Failed to create default session.")
+                return
+
+        # Load active session
+        if "active_session" not in st.session_state:
+            st.session_state["active_session"] = list(st.session_state["sessions"].keys())[0]
+
+        active_session = st.session_state["active_session"]
+
+        row = get_session(active_session)
+        active_session_id = row[0] if row else None
+
+        # Load messages through the shared history cache
+        messages = load_history(active_session_id) if active_session_id is not None else []
+        st.session_state["messages"] = {active_session: messages}
 
     except Exception as e:
         st.error("⚠️ Error initializing session. Using default settings.")
@@ -112,16 +106,15 @@ def create_new_session():
             
             try:
                 # Check if session name already exists
-                with get_db_connection() as conn, conn.cursor() as cur:
-                    cur.execute("SELECT name FROM sessions WHERE name = %s", (session_name.strip(),))
-                    if cur.fetchone():
-                        st.error("⚠️ A session with this name already exists.")
-                        return
+                if session_exists(session_name.strip()):
+                    st.error("⚠️ A session with this name already exists.")
+                    return
 
                 # Save session with selected model
                 save_session(session_name.strip(), selected_model)
+                invalidate_session_list()
                 # Set new session as active
-                st.session_state["active_session"] = session_name.strip()
+                set_active_session(session_name.strip())
                 st.success("✅ Session created successfully!")
                 st.rerun()  # Refresh UI to reflect changes
             except Exception as e:
@@ -146,19 +139,18 @@ def rename_session(old_name):
                 return
 
             try:
-                with get_db_connection() as conn, conn.cursor() as cur:
-                    # Check if new name already exists
-                    cur.execute("SELECT name FROM sessions WHERE name = %s", (new_name.strip(),))
-                    if cur.fetchone():
-                        st.error("⚠️ A session with this name already exists.")
-                        return
-
-                    # Perform rename
-                    cur.execute(
-                        "UPDATE sessions SET name = %s WHERE name = %s;", (new_name.strip(), old_name))
-                    conn.commit()
-                    st.success("✅ Session renamed successfully!")
-                    st.rerun()
+                # Check if new name already exists
+                if session_exists(new_name.strip()):
+                    st.error("⚠️ A session with this name already exists.")
+                    return
+
+                # Perform rename
+                rename_stored_session(old_name, new_name.strip())
+                invalidate_session_list()
+                if st.session_state.get("active_session") == old_name:
+                    set_active_session(new_name.strip())
+                st.success("✅ Session renamed successfully!")
+                st.rerun()
             except Exception as e:
                 st.error("⚠️ Failed to rename session. Please try again.")
                 return
@@ -175,17 +167,18 @@ def delete_session(session_name):
             return
 
         try:
-            with get_db_connection() as conn, conn.cursor() as cur:
-                # Delete session and its messages (cascade)
-                cur.execute("DELETE FROM sessions WHERE name = %s;", (session_name,))
-                conn.commit()
-                
-                # Clear session from state if it was active
-                if st.session_state.get("active_session") == session_name:
-                    st.session_state["active_session"] = "Default"
-                
-                st.success("✅ Session deleted successfully!")
-                st.rerun()
+            # Delete session and its messages (cascade)
+            deleted_id = delete_stored_session(session_name)
+            invalidate_session_list()
+            if deleted_id is not None:
+                invalidate_history(deleted_id)
+
+            # Clear session from state if it was active
+            if st.session_state.get("active_session") == session_name:
+                set_active_session("Default")
+
+            st.success("✅ Session deleted successfully!")
+            st.rerun()
         except Exception as e:
             st.error("⚠️ Failed to delete session. Please try again.")
             return
@@ -195,16 +188,19 @@ def delete_session(session_name):
 
 
 def switch_session(session_name):
-    """Switches to a different session."""
+    """Switches to a different session and starts loading its model."""
     try:
         # Verify session exists
-        with get_db_connection() as conn, conn.cursor() as cur:
-            cur.execute("SELECT name FROM sessions WHERE name = %s", (session_name,))
-            if not cur.fetchone():
-                st.error("⚠️ Session not found.")
-                return
+        session = get_session(session_name)
+        if session is None:
+            st.error("⚠️ Session not found.")
+            return
+
+        # Warm the model in the background while the page reruns
+        session_id, model = session
+        get_model_lifecycle().warm(model, session_key=session_id)
 
-        st.session_state["active_session"] = session_name
+        set_active_session(session_name)
         st.success(f"✅ Switched to session: {session_name}")
         st.rerun()
     except Exception as e:
@@ -0,0 +1,349 @@
+import logging
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from const import (SQLITE_PATH, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_LEAK_THRESHOLD, DB_POOL_TRACK_STACKS,
+                   EXPORT_FETCH_SIZE, IMPORT_BATCH_SIZE)
+from db_pool import ConnectionPool
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Same tables as postgres/init.sql. Timestamps are stored as fixed-width
+# "YYYY-MM-DD HH:MM:SS.ffffff" text in UTC, so they sort chronologically.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    model TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f000', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER REFERENCES sessions(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f000', 'now')),
+    reasoning TEXT,
+    rendered TEXT,
+    tokens INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_messages_session_created_at ON messages (session_id, created_at, id);
+
+-- Full-text search: an external-content FTS5 index kept in sync by triggers
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id', tokenize='porter unicode61'
+);
+
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+BUSY_TIMEOUT_MS = 5000
+
+
+class _Cursor(sqlite3.Cursor):
+    """Cursor usable as a context manager, like psycopg2's."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Connection(sqlite3.Connection):
+    """sqlite3 connection with the psycopg2 surface ConnectionPool relies on."""
+
+    closed = False
+
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+
+    def close(self):
+        super().close()
+        self.closed = True
+
+
+def _connect(path=None):
+    """Opens a connection in WAL mode: readers never block the single writer."""
+    conn = sqlite3.connect(path or SQLITE_PATH, timeout=BUSY_TIMEOUT_MS / 1000,
+                           factory=_Connection, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute("PRAGMA foreign_keys=ON;")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};")
+    return conn
+
+
+def _to_db(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.isoformat(sep=" ", timespec="microseconds")
+
+
+def _from_db(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+_SEARCH_TERM = re.compile(r'"([^"]*)"|([^\s"]+)')
+
+
+def _match_expression(query):
+    """Turns free text into an FTS5 query matching all of its words and "quoted phrases"."""
+    terms = (phrase or word for phrase, word in _SEARCH_TERM.findall(query))
+    return " ".join('"' + term + '"' for term in terms if term.strip())
+
+
+def _cursor_clause(op, cursor):
+    """Builds a keyset predicate for a (created_at, id) cursor; id may be unknown."""
+    created_at, message_id = cursor
+    if message_id is None:
+        return f"created_at {op} ?", [_to_db(created_at)]
+    return f"(created_at, id) {op} (?, ?)", [_to_db(created_at), message_id]
+
+
+class SqliteStorage(Storage):
+    """Embedded storage in a single SQLite file, for single-node deployments.
+
+    Connections are pooled and shared across threads; WAL mode lets reruns
+    read while the message writer commits.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=None):
+        self.path = path or SQLITE_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.pool = ConnectionPool(
+            lambda: _connect(self.path),
+            minconn=1,
+            maxconn=DB_POOL_MAX,
+            timeout=DB_POOL_TIMEOUT,
+            health_check_interval=float("inf"),  # a local file cannot drop the connection
+            leak_threshold=DB_POOL_LEAK_THRESHOLD,
+            track_stacks=DB_POOL_TRACK_STACKS,
+        )
+        with self.pool.connection() as conn:
+            has_fts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts';").fetchone()
+            # Add columns missing from databases created by earlier versions
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(messages);")}
+            for column, column_type in (("reasoning", "TEXT"), ("rendered", "TEXT"), ("tokens", "INTEGER")):
+                if columns and column not in columns:
+                    conn.execute(f"ALTER TABLE messages ADD COLUMN {column} {column_type};")
+            conn.executescript(SCHEMA)
+            if not has_fts:
+                # Index messages stored before search existed
+                conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild');")
+        logger.info(f"Using SQLite storage at {self.path}")
+
+    def connection(self):
+        """Checks out a pooled connection; commits on success and rolls back on error."""
+        return self.pool.connection()
+
+    @contextmanager
+    def bulk_connection(self):
+        """Opens a connection outside the pool for a long-running export or import."""
+        conn = _connect(self.path)
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    # Sessions
+
+    def save_session(self, name, model):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("INSERT OR IGNORE INTO sessions (name, model) VALUES (?, ?);", (name, model))
+            return cur.lastrowid if cur.rowcount else None
+
+    def get_session(self, name):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id, model FROM sessions WHERE name = ?;", (name,))
+            return cur.fetchone()
+
+    def list_sessions(self):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT name, model FROM sessions ORDER BY created_at DESC, id DESC;")
+            return cur.fetchall()
+
+    def session_exists(self, name):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM sessions WHERE name = ?;", (name,))
+            return cur.fetchone() is not None
+
+    def rename_session(self, old_name, new_name):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("UPDATE sessions SET name = ? WHERE name = ?;", (new_name, old_name))
+            return cur.rowcount > 0
+
+    def delete_session(self, name):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id FROM sessions WHERE name = ?;", (name,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            # Messages are removed by ON DELETE CASCADE
+            cur.execute("DELETE FROM sessions WHERE id = ?;", row)
+            return row[0]
+
+    # Messages
+
+    def save_message(self, session_id, role, content, reasoning=None, rendered=None, tokens=None):
+        created_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("INSERT INTO messages (session_id, role, content, created_at, reasoning, rendered, tokens) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?);",
+                        (session_id, role, content, _to_db(created_at), reasoning, rendered, tokens))
+            return cur.lastrowid, created_at
+
+    def save_messages(self, rows):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.executemany(
+                "INSERT INTO messages (session_id, role, content, created_at, reasoning, rendered, tokens) "
+                "SELECT ?, ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM sessions WHERE id = ?);",
+                [(session_id, role, content, _to_db(created_at), reasoning, rendered, tokens, session_id)
+                 for session_id, role, content, created_at, reasoning, rendered, tokens in rows])
+
+    def get_unnormalized_messages(self, limit, after=0):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT id, role, content, reasoning FROM messages WHERE tokens IS NULL AND id > ? "
+                "ORDER BY id LIMIT ?;", (after, limit))
+            return cur.fetchall()
+
+    def save_normalized_messages(self, rows):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.executemany(
+                "UPDATE messages SET content = ?, reasoning = ?, rendered = ?, tokens = ? WHERE id = ?;",
+                [(content, reasoning, rendered, tokens, message_id)
+                 for message_id, content, reasoning, rendered, tokens in rows])
+
+    def get_chat_history(self, session_id):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY created_at ASC, id ASC;",
+                (session_id,))
+            return cur.fetchall()
+
+    def get_chat_history_page(self, session_id, limit, before=None, after=None):
+        clauses = ["session_id = ?"]
+        params = [session_id]
+        for op, cursor in (("<", before), (">", after)):
+            if cursor is not None:
+                clause, values = _cursor_clause(op, cursor)
+                clauses.append(clause)
+                params.extend(values)
+        params.append(limit)
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT id, role, content, created_at, reasoning, rendered, tokens "
+                f"FROM messages WHERE {' AND '.join(clauses)} "
+                "ORDER BY created_at DESC, id DESC LIMIT ?;", params)
+            rows = [(message_id, role, content, _from_db(created_at), *rest)
+                    for message_id, role, content, created_at, *rest in cur.fetchall()]
+        rows.reverse()
+        return rows
+
+    # Export and import
+
+    def iter_export_rows(self, after=None, fetch_size=EXPORT_FETCH_SIZE):
+        where, params = "", []
+        if after is not None:
+            session_id, created_at, message_id = after
+            if message_id is None:
+                where = "WHERE s.id > ? OR (s.id = ? AND m.id IS NOT NULL)"
+                params = [session_id, session_id]
+            else:
+                where = "WHERE s.id > ? OR (s.id = ? AND (m.created_at, m.id) > (?, ?))"
+                params = [session_id, session_id, _to_db(created_at), message_id]
+        # SQLite steps through the result as it is fetched; nothing is materialized
+        with self.bulk_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT s.id, s.name, s.model, s.created_at, m.id, m.role, m.content, m.created_at, "
+                "m.reasoning, m.rendered, m.tokens "
+                f"FROM sessions s LEFT JOIN messages m ON m.session_id = s.id {where} "
+                "ORDER BY s.id, m.created_at, m.id;", params)
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield (*row[:3], _from_db(row[3]), *row[4:7], _from_db(row[7]), *row[8:])
+
+    def import_rows(self, records, batch_size=IMPORT_BATCH_SIZE):
+        insert = ("INSERT INTO messages (session_id, role, content, created_at, reasoning, rendered, tokens) "
+                  "VALUES (?, ?, ?, ?, ?, ?, ?);")
+        counts = {"sessions": 0, "skipped": 0, "messages": 0}
+        session_id = None
+        batch = []
+        with self.bulk_connection() as conn, conn.cursor() as cur:
+            for record in records:
+                if record[0] == "session":
+                    _, name, model, created_at = record
+                    cur.execute(
+                        "INSERT OR IGNORE INTO sessions (name, model, created_at) "
+                        "VALUES (?, ?, COALESCE(?, strftime('%Y-%m-%d %H:%M:%f000', 'now')));",
+                        (name, model, _to_db(created_at) if created_at else None))
+                    session_id = cur.lastrowid if cur.rowcount else None
+                    counts["sessions" if session_id else "skipped"] += 1
+                elif session_id is not None:
+                    _, role, content, created_at, reasoning, rendered, tokens = record
+                    batch.append((session_id, role, content, _to_db(created_at), reasoning, rendered, tokens))
+                    counts["messages"] += 1
+                    if len(batch) >= batch_size:
+                        cur.executemany(insert, batch)
+                        batch = []
+            if batch:
+                cur.executemany(insert, batch)
+        return counts
+
+    # Search
+
+    def search_messages(self, query, limit, offset=0):
+        expression = _match_expression(query)
+        if not expression:
+            return []
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT s.name, m.session_id, m.id, m.role, "
+                "snippet(messages_fts, 0, '**', '**', ' … ', 24), m.created_at "
+                "FROM messages_fts "
+                "JOIN messages m ON m.id = messages_fts.rowid "
+                "JOIN sessions s ON s.id = m.session_id "
+                "WHERE messages_fts MATCH ? "
+                "ORDER BY messages_fts.rank, m.id DESC LIMIT ? OFFSET ?;",
+                (expression, limit, offset))
+            return [(name, session_id, message_id, role, snippet, _from_db(created_at))
+                    for name, session_id, message_id, role, snippet, created_at in cur.fetchall()]
+
+    # Lifecycle
+
+    def is_transient_error(self, error):
+        # "database is locked" and I/O errors; constraint and type errors are permanent
+        return super().is_transient_error(error) or isinstance(error, sqlite3.OperationalError)
+
+    def stats(self):
+        return self.pool.stats()
+
+    def close(self):
+        self.pool.closeall()
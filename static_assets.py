@@ -0,0 +1,55 @@
+import base64
+import functools
+import io
+import logging
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Logical pixels the logo is displayed at; the image is resized once to this
+# width times HIDPI_SCALE so high-density screens still get a sharp logo.
+LOGO_PATH = "assets/deep-seek.png"
+LOGO_DISPLAY_WIDTH = 150
+HIDPI_SCALE = 2
+
+
+def _optimize_png(data, max_width):
+    """Downscales and recompresses a PNG; returns the original bytes if that doesn't help."""
+    if Image is None:
+        return data
+    with Image.open(io.BytesIO(data)) as img:
+        if img.width > max_width:
+            height = round(img.height * max_width / img.width)
+            img = img.resize((max_width, height), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="PNG", optimize=True)
+    optimized = out.getvalue()
+    return optimized if len(optimized) < len(data) else data
+
+
+@functools.lru_cache(maxsize=16)
+def _load_data_uri(image_path, display_width):
+    with open(image_path, "rb") as img_file:
+        data = img_file.read()
+    try:
+        data = _optimize_png(data, display_width * HIDPI_SCALE)
+    except Exception:
+        logger.warning(f"Failed to optimize image, using original: {image_path}", exc_info=True)
+    logger.info(f"Loaded asset {image_path} ({len(data)} bytes)")
+    return f"data:image/png;base64,{base64.b64encode(data).decode()}"
+
+
+def get_image_data_uri(image_path, display_width=LOGO_DISPLAY_WIDTH):
+    """Returns an optimized `data:` URI for an image, built once per process.
+
+    Failures are not cached, so a later rerun retries.
+    """
+    try:
+        return _load_data_uri(image_path, display_width)
+    except Exception:
+        logger.error(f"Failed to load image asset: {image_path}", exc_info=True)
+        return ""
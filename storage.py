@@ -0,0 +1,156 @@
+import atexit
+import threading
+from abc import ABC, abstractmethod
+from const import STORAGE_BACKEND
+from db_pool import DatabaseUnavailable, PoolTimeout
+
+
+class Storage(ABC):
+    """Persistence operations for sessions and messages.
+
+    Timestamps are naive datetimes and message rows are
+    (id, role, content, created_at, reasoning, rendered, tokens) tuples,
+    whatever the backend. `reasoning` is the model's chain of thought, kept
+    apart from the content so it is never sent back in prompts. `rendered` is
+    the markdown to display when it differs from the content, and `tokens` the
+    content's prompt token count; both are computed when the message is written
+    (see message_format) and are None for messages stored before that.
+    """
+
+    name = None
+
+    # Sessions
+
+    @abstractmethod
+    def save_session(self, name, model):
+        """Creates a session; returns its id, or None if the name is taken."""
+
+    @abstractmethod
+    def get_session(self, name):
+        """Returns (id, model) of a session, or None."""
+
+    @abstractmethod
+    def list_sessions(self):
+        """Returns (name, model) of all sessions, newest first."""
+
+    @abstractmethod
+    def session_exists(self, name):
+        """Returns whether a session with this name exists."""
+
+    @abstractmethod
+    def rename_session(self, old_name, new_name):
+        """Renames a session; returns False if it does not exist."""
+
+    @abstractmethod
+    def delete_session(self, name):
+        """Deletes a session and its messages; returns its id, or None."""
+
+    # Messages
+
+    @abstractmethod
+    def save_message(self, session_id, role, content, reasoning=None, rendered=None, tokens=None):
+        """Inserts one message; returns (id, created_at)."""
+
+    @abstractmethod
+    def save_messages(self, rows):
+        """Inserts (session_id, role, content, created_at, reasoning, rendered, tokens)
+        rows in order, in one transaction. Rows whose session has been deleted
+        are skipped."""
+
+    @abstractmethod
+    def get_chat_history(self, session_id):
+        """Returns (role, content) of all messages of a session, oldest first."""
+
+    @abstractmethod
+    def get_chat_history_page(self, session_id, limit, before=None, after=None):
+        """Returns up to `limit` of the newest messages older than `before` and newer
+        than `after` (both (created_at, id) cursors), ordered oldest first."""
+
+    @abstractmethod
+    def get_unnormalized_messages(self, limit, after=0):
+        """Returns up to `limit` (id, role, content, reasoning) rows of messages
+        stored before messages were normalized on write (their `tokens` is NULL),
+        with ids above `after`, lowest id first."""
+
+    @abstractmethod
+    def save_normalized_messages(self, rows):
+        """Sets (id, content, reasoning, rendered, tokens) of existing messages in one transaction."""
+
+    # Export and import
+
+    @abstractmethod
+    def iter_export_rows(self, after=None):
+        """Streams every session with its messages, without loading them into memory.
+
+        Yields (session_id, name, model, session_created_at, message_id, role,
+        content, created_at, reasoning, rendered, tokens) rows ordered by session
+        id, then message (created_at, id); a session without messages yields one
+        row whose message fields are None. `after` resumes an interrupted export
+        after a (session_id, created_at, message_id) cursor, where a None
+        message_id means right after the session row itself.
+        """
+
+    @abstractmethod
+    def import_rows(self, records):
+        """Inserts ("session", name, model, created_at) records, each followed by
+        its ("message", role, content, created_at, reasoning, rendered, tokens)
+        records, in one transaction.
+
+        A session whose name is taken is skipped with its messages, so importing
+        the same data twice is a no-op. Returns {"sessions", "skipped", "messages"}
+        counts.
+        """
+
+    # Search
+
+    @abstractmethod
+    def search_messages(self, query, limit, offset=0):
+        """Full-text search over all messages, best matches first.
+
+        Returns (session_name, session_id, message_id, role, snippet, created_at)
+        rows; matched terms in the snippet are wrapped in ** for markdown.
+        """
+
+    # Lifecycle
+
+    def is_transient_error(self, error):
+        """Whether a failed call may succeed when retried, e.g. after the connection was lost."""
+        return isinstance(error, (DatabaseUnavailable, PoolTimeout))
+
+    def stats(self):
+        """Connection pool statistics, if the backend has a pool."""
+        return {}
+
+    def close(self):
+        pass
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    """Creates a storage backend by name; drivers are only imported when used."""
+    if backend == "postgres":
+        from postgres_storage import PostgresStorage
+        return PostgresStorage()
+    if backend == "sqlite":
+        from sqlite_storage import SqliteStorage
+        return SqliteStorage()
+    raise ValueError(f"Unknown storage backend: {backend!r} (expected 'postgres' or 'sqlite')")
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Returns the process-wide storage backend selected by STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+                atexit.register(_storage.close)
+    return _storage
+
+
+def current_storage():
+    """Returns the storage backend if it has been created, without creating it."""
+    return _storage
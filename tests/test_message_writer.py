@@ -0,0 +1,61 @@
+import threading
+
+from message_writer import MessageWriter
+
+
+class Transient(Exception):
+    pass
+
+
+class FakeDatabase:
+    """write_batch stand-in that rejects NUL bytes like psycopg2 and can be taken offline."""
+
+    def __init__(self, outages=0):
+        self.rows = []
+        self.outages = outages
+        self.lock = threading.Lock()
+
+    def write_batch(self, rows):
+        with self.lock:
+            if self.outages:
+                self.outages -= 1
+                raise Transient("connection refused")
+            if any("\x00" in row[2] for row in rows):
+                raise ValueError("A string literal cannot contain NUL (0x00) characters.")
+            self.rows.extend(rows)
+
+
+def make_writer(database, batch_size=10):
+    return MessageWriter(write_batch=database.write_batch, batch_size=batch_size, flush_interval=0.01,
+                         is_transient=lambda e: isinstance(e, Transient))
+
+
+def contents(database):
+    return [row[2] for row in database.rows]
+
+
+def test_failing_row_is_dropped_and_later_batches_land():
+    database = FakeDatabase()
+    writer = make_writer(database)
+    for content in ("before", "bad \x00 row", "same batch"):
+        writer.enqueue(1, "user", content)
+    assert writer.flush(5)
+    writer.enqueue(1, "assistant", "later")
+    assert writer.flush(5)
+    writer.close()
+
+    assert contents(database) == ["before", "same batch", "later"]
+    assert writer.stats["dropped"] == 1
+
+
+def test_transient_errors_are_retried_in_order():
+    database = FakeDatabase(outages=2)
+    writer = make_writer(database, batch_size=1)
+    for content in ("first", "second"):
+        writer.enqueue(1, "user", content)
+    assert writer.flush(5)
+    writer.close()
+
+    assert contents(database) == ["first", "second"]
+    assert writer.stats["retries"] == 2
+    assert writer.stats["dropped"] == 0
@@ -0,0 +1,56 @@
+import pytest
+
+from reasoning import ThinkParser, is_reasoning_model, split_reasoning
+
+
+def feed_chunks(chunks, implicit_open=False):
+    parser = ThinkParser(implicit_open)
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return parser.reasoning, parser.answer
+
+
+def test_leading_block_is_reasoning():
+    assert split_reasoning("<think>plan</think>answer") == ("plan", "answer")
+    assert split_reasoning("\n <think>plan</think>\nanswer") == ("plan", "answer")
+
+
+def test_bare_close_is_text_for_other_models():
+    text = "Use the </think> tag to close."
+    assert split_reasoning(text) == ("", text)
+
+
+def test_bare_close_ends_implicit_block_of_reasoning_models():
+    assert split_reasoning("plan</think>answer", implicit_open=True) == ("plan", "answer")
+
+
+def test_open_after_answer_text_is_text():
+    text = "Hello <think> not reasoning </think> end"
+    assert split_reasoning(text) == ("", text)
+    assert split_reasoning(text, implicit_open=True) == ("", text)
+
+
+def test_tags_after_reasoning_block_are_text():
+    assert split_reasoning("<think>a</think>b <think>c</think>") == ("a", "b <think>c</think>")
+
+
+@pytest.mark.parametrize("implicit_open", [False, True])
+def test_tags_split_across_chunks(implicit_open):
+    chunks = ["<th", "ink>pl", "an</th", "in", "k>ans", "wer"]
+    assert feed_chunks(chunks, implicit_open) == ("plan", "answer")
+
+
+def test_close_split_across_chunks_in_implicit_block():
+    assert feed_chunks(["plan</", "think", ">answer"], implicit_open=True) == ("plan", "answer")
+
+
+def test_partial_tag_at_end_is_text():
+    assert feed_chunks(["answer <thi"]) == ("", "answer <thi")
+
+
+def test_reasoning_models_match_without_tag():
+    assert is_reasoning_model("deepseek-r1:latest")
+    assert is_reasoning_model("deepseek-r1")
+    assert not is_reasoning_model("deepseek-coder")
+    assert not is_reasoning_model(None)
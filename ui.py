@@ -1,11 +1,19 @@
+import io
+import os
 import streamlit as st
-from utils import logger, display_chat_history, get_base64_image
+from const import SESSION_PAGE_SIZE, MESSAGE_SEARCH_PAGE_SIZE, SHOW_METRICS_PANEL
+import metrics
+from utils import logger
+from static_assets import get_image_data_uri, LOGO_PATH
+from config import search_messages
+from ollama_router import get_ollama_router
 
 # Import other modules with error handling
 try:
     from input_handle import handle_user_input
     from sessions import create_new_session, rename_session, delete_session, switch_session
-    from config import get_db_connection
+    from session_cache import get_session_names, filter_sessions
+    from session_transfer import export_sessions, import_sessions, incomplete_export, new_export_path
 except ImportError as e:
     logger.error("Failed to import required modules", exc_info=True)
     st.error("⚠️ Failed to load required modules. Please check the error logs.")
@@ -16,11 +24,11 @@ def render_ui():
     """Renders the main UI header with an image and title."""
     try:
         session_name = st.session_state.get("active_session", "Default")
-        image_base64 = get_base64_image("assets/deep-seek.png")
+        logo_src = get_image_data_uri(LOGO_PATH)
 
         st.markdown(f"""
         <div style='text-align: center; padding: 20px;'>
-            <img src="data:image/png;base64,{image_base64}" width="120" style="margin-bottom: 10px;"/>
+            <img src="{logo_src}" width="120" style="margin-bottom: 10px;"/>
             <h1 style="color: #333; margin-bottom: 5px;">🤖 Mini ChatGPT</h1>
             <h4 style="color: #666; font-weight: normal;">💬 Session: <span style="color: #0078FF;">{session_name}</span></h4>
         </div>
@@ -35,7 +43,11 @@ def display_sidebar():
     try:
         with st.sidebar:
             render_sidebar_header()
+            render_message_search()
             render_session_management()
+            render_session_transfer()
+            if SHOW_METRICS_PANEL:
+                render_metrics_panel()
     except Exception as e:
         logger.error("Failed to display sidebar", exc_info=True)
         st.error("⚠️ Error displaying sidebar")
@@ -44,10 +56,10 @@ def display_sidebar():
 def render_sidebar_header():
     """Displays the logo and sidebar title."""
     try:
-        image_base64 = get_base64_image("assets/deep-seek.png")
+        logo_src = get_image_data_uri(LOGO_PATH)
         st.markdown(f"""
         <div style='text-align: center;'>
-            <img src="data:image/png;base64,{image_base64}" width="150"/>
+            <img src="{logo_src}" width="150"/>
         </div>
         """, unsafe_allow_html=True)
         st.title("💬 Chat Sessions")
@@ -56,22 +68,110 @@ def render_sidebar_header():
         st.error("⚠️ Error rendering sidebar header")
 
 
+def _set_session_page(page):
+    st.session_state["session_page"] = page
+
+
+def render_session_picker(sessions):
+    """Renders a search box and pager; returns the sessions on the current page."""
+    # Start over on the first page whenever the search changes
+    query = st.text_input("🔍 Search sessions", key="session_search", label_visibility="collapsed",
+                          placeholder="🔍 Search sessions", on_change=_set_session_page, args=(0,))
+    matches = filter_sessions(sessions, query)
+
+    page_count = max(1, -(-len(matches) // SESSION_PAGE_SIZE))
+    page = min(st.session_state.get("session_page", 0), page_count - 1)
+
+    if page_count > 1:
+        col_prev, col_info, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            st.button("◀", key="session_page_prev", disabled=page == 0,
+                      on_click=_set_session_page, args=(page - 1,))
+        with col_info:
+            st.caption(f"Page {page + 1} of {page_count} · {len(matches)} sessions")
+        with col_next:
+            st.button("▶", key="session_page_next", disabled=page >= page_count - 1,
+                      on_click=_set_session_page, args=(page + 1,))
+    elif query:
+        st.caption(f"{len(matches)} matching sessions")
+
+    start = page * SESSION_PAGE_SIZE
+    return matches[start:start + SESSION_PAGE_SIZE]
+
+
+def _set_search_page(page):
+    st.session_state["message_search_page"] = page
+
+
+def _search_results(query, page):
+    """Returns one page of results plus whether more exist, memoized per query and page
+    so reruns that do not change the search never query the database."""
+    key = (query, page)
+    cached = st.session_state.get("message_search_results")
+    if cached and cached[0] == key:
+        return cached[1]
+    rows = search_messages(query, MESSAGE_SEARCH_PAGE_SIZE + 1, page * MESSAGE_SEARCH_PAGE_SIZE)
+    result = (rows[:MESSAGE_SEARCH_PAGE_SIZE], len(rows) > MESSAGE_SEARCH_PAGE_SIZE)
+    st.session_state["message_search_results"] = (key, result)
+    return result
+
+
+def render_message_search():
+    """Searches all messages and lists ranked snippets, one page at a time."""
+    try:
+        query = st.session_state.get("message_search", "").strip()
+        with st.expander("🔎 Search messages", expanded=bool(query)):
+            query = st.text_input("Search messages", key="message_search", label_visibility="collapsed",
+                                  placeholder="Words or \"a phrase\"", on_change=_set_search_page,
+                                  args=(0,)).strip()
+            if not query:
+                return
+
+            page = st.session_state.get("message_search_page", 0)
+            results, has_more = _search_results(query, page)
+            if not results:
+                st.caption("No matching messages." if page == 0 else "No more results.")
+
+            for name, _, message_id, role, snippet, created_at in results:
+                icon = "🧑" if role == "user" else "🤖"
+                when = created_at.strftime("%Y-%m-%d %H:%M") if created_at else ""
+                st.caption(f"{icon} {name} · {when}")
+                st.markdown(" ".join(snippet.split()))
+                if st.button("Open session", key=f"search_open_{message_id}"):
+                    switch_session(name)
+
+            if page > 0 or has_more:
+                col_prev, col_info, col_next = st.columns([1, 2, 1])
+                with col_prev:
+                    st.button("◀", key="search_page_prev", disabled=page == 0,
+                              on_click=_set_search_page, args=(page - 1,))
+                with col_info:
+                    st.caption(f"Page {page + 1}")
+                with col_next:
+                    st.button("▶", key="search_page_next", disabled=not has_more,
+                              on_click=_set_search_page, args=(page + 1,))
+    except Exception as e:
+        logger.error("Failed to search messages", exc_info=True)
+        st.error("⚠️ Message search failed. Please try again.")
+
+
 def render_session_management():
     """Displays session switching and management options."""
     try:
         with st.sidebar:
-            # Fetch sessions from database
+            # Fetch sessions from the process cache (database on a miss)
             try:
-                with get_db_connection() as conn, conn.cursor() as cur:
-                    cur.execute("SELECT name FROM sessions;")
-                    sessions = [row[0] for row in cur.fetchall()]
+                sessions = get_session_names()
             except Exception as e:
                 logger.error("Failed to fetch sessions from database", exc_info=True)
                 st.error("⚠️ Database connection error. Please check if the database is running.")
-                st.info("💡 Tip: Try restarting the Docker containers with 'docker-compose down && docker-compose up -d'")
+                st.info("💡 Tip: Try restarting the Docker containers with 'docker-compose down && docker-compose up -d', "
+                        "or set STORAGE_BACKEND=sqlite to run without them")
                 # Provide a default session if database is unavailable
                 sessions = ["Default"]
 
+            sessions = render_session_picker(sessions)
+
             for session_name in sessions:
                 try:
                     col1, col2 = st.columns([4, 1])
@@ -103,10 +203,99 @@ def render_session_management():
         st.error("⚠️ Error managing sessions")
 
 
+def render_session_transfer():
+    """Exports all sessions to an NDJSON file for download, or imports an uploaded one."""
+    try:
+        with st.expander("📦 Export / import"):
+            progress = st.empty()
+
+            def show_progress(sessions, messages):
+                progress.caption(f"{sessions} sessions, {messages} messages…")
+
+            if st.button("⬇️ Export all sessions", key="export_sessions", use_container_width=True):
+                # An interrupted export is resumed rather than started over
+                path = incomplete_export() or new_export_path()
+                try:
+                    counts = export_sessions(path, resume=True, on_progress=show_progress)
+                except Exception as e:
+                    logger.error(f"Failed to export sessions to {path}", exc_info=True)
+                    progress.error("⚠️ Export failed. Press the button again to resume it.")
+                else:
+                    progress.success(f"✅ {'Resumed' if counts['resumed'] else 'Exported'} "
+                                     f"{counts['sessions']} sessions and {counts['messages']} messages to `{path}`")
+                    # Served from the finished file, so the download is exactly what a re-import checks
+                    with open(path, "rb") as export:
+                        st.download_button("💾 Download export", export, file_name=os.path.basename(path),
+                                           mime="application/x-ndjson", key="download_sessions",
+                                           use_container_width=True)
+
+            upload = st.file_uploader("Import an export", type=["ndjson", "jsonl"], key="import_sessions_file")
+            if upload is not None and st.button("⬆️ Import", key="import_sessions", use_container_width=True):
+                try:
+                    counts = import_sessions(io.TextIOWrapper(upload, encoding="utf-8"), on_progress=show_progress)
+                except ValueError as e:
+                    progress.error(f"⚠️ {e}")
+                except Exception as e:
+                    logger.error("Failed to import sessions", exc_info=True)
+                    progress.error("⚠️ Import failed; nothing was imported.")
+                else:
+                    skipped = f"; skipped {counts['skipped']} with existing names" if counts["skipped"] else ""
+                    progress.success(f"✅ Imported {counts['sessions']} sessions and "
+                                     f"{counts['messages']} messages{skipped}")
+    except Exception as e:
+        logger.error("Failed to render export/import", exc_info=True)
+        st.error("⚠️ Error rendering export/import")
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.1f} ms" if seconds is not None else "–"
+
+
+def render_metrics_panel():
+    """Shows hot-path latency percentiles and cache statistics for this process."""
+    try:
+        with st.expander("📊 Metrics"):
+            ttft = metrics.TTFT_SECONDS
+            tps = metrics.TOKENS_PER_SECOND
+            col1, col2 = st.columns(2)
+            col1.metric("TTFT p50", _ms(ttft.quantile(0.5)))
+            col2.metric("TTFT p95", _ms(ttft.quantile(0.95)))
+            tps_p50 = tps.quantile(0.5)
+            col1.metric("Tokens/s p50", f"{tps_p50:.1f}" if tps_p50 is not None else "–")
+            queries = metrics.RERUN_DB_QUERIES.quantile(0.5)
+            col2.metric("DB calls/rerun p50", f"{queries:.1f}" if queries is not None else "–")
+            hit_rate = metrics.cache_hit_rate("history")
+            col1.metric("History cache hits", f"{hit_rate:.0%}" if hit_rate is not None else "–")
+            col2.metric("Rerun p95", _ms(metrics.RERUN_SECONDS.quantile(0.95)))
+
+            rows = []
+            for hist, label in ((metrics.SPAN_SECONDS, "span"), (metrics.DB_QUERY_SECONDS, "query")):
+                for labels in hist.label_sets():
+                    rows.append({
+                        "step": labels[label],
+                        "count": hist.count(**labels),
+                        "p50": _ms(hist.quantile(0.5, **labels)),
+                        "p95": _ms(hist.quantile(0.95, **labels)),
+                    })
+            if rows:
+                st.dataframe(rows, hide_index=True, use_container_width=True)
+
+            hosts = get_ollama_router().stats()
+            if len(hosts) > 1:
+                st.dataframe([{
+                    "host": h["host"],
+                    "status": {True: "up", False: "down", None: "unknown"}[h["healthy"]],
+                    "in flight": h["in_flight"],
+                    "loaded": ", ".join(h["loaded"]),
+                } for h in hosts], hide_index=True, use_container_width=True)
+    except Exception as e:
+        logger.error("Failed to render metrics panel", exc_info=True)
+        st.error("⚠️ Error rendering metrics")
+
+
 def display_chat():
     """Displays the chat interface for the active session."""
     try:
-        display_chat_history()
         handle_user_input()
     except Exception as e:
         logger.error("Failed to display chat interface", exc_info=True)
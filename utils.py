@@ -1,48 +1,221 @@
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
+import atexit
 import os
-import base64
+import queue
+import threading
+import time
 import streamlit as st
+from const import STREAM_RENDER_FPS, STREAM_FLUSH_CHARS, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLING
+from reasoning import ThinkParser, is_reasoning_model
+from message_format import render_markdown
 
-# Create logs directory if it doesn't exist
-if not os.path.exists('logs'):
-    os.makedirs('logs')
+LOG_DIR = 'logs'
+LOG_FORMAT = '[%(asctime)s.%(msecs)03dZ] [%(levelname)s] %(message)s\n%(pathname)s:%(lineno)d\n%(exc_info)s\n---\n'
+LOG_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+class DailyFileHandler(logging.FileHandler):
+    """Writes to logs/error_YYYY-MM-DD.log and switches files at UTC midnight.
+
+    The directory and file are only created when the first record is written.
+    """
+
+    def __init__(self, directory=LOG_DIR, prefix="error_"):
+        self.directory = directory
+        self.prefix = prefix
+        self._rollover_at = self._next_midnight()
+        super().__init__(self._current_file(), encoding='utf-8', mode='a', delay=True)
+
+    def _current_file(self):
+        return os.path.join(self.directory, f"{self.prefix}{datetime.utcnow().strftime('%Y-%m-%d')}.log")
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return super()._open()
+
+    @staticmethod
+    def _next_midnight():
+        return (int(time.time()) // 86400 + 1) * 86400
+
+    def emit(self, record):
+        if record.created >= self._rollover_at:
+            # The stream is reopened lazily on the new file by FileHandler.emit
+            self.close()
+            self.baseFilename = os.path.abspath(self._current_file())
+            self._rollover_at = self._next_midnight()
+        super().emit(record)
+
+class SamplingFilter(logging.Filter):
+    """Samples and rate-limits hot-path log records per category.
+
+    The category comes from `extra={"category": ...}`, falling back to the
+    logger name. A rule keeps one record in `every` and at most `per_second`
+    records per second. Warnings and errors are never dropped.
+    """
+
+    def __init__(self, rules):
+        super().__init__()
+        self.rules = rules
+        self._seen = {}
+        self._buckets = {}  # category -> [tokens, last refill]
+        self._lock = threading.Lock()
+        self.dropped = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        category = getattr(record, "category", record.name)
+        rule = self.rules.get(category)
+        if rule is None:
+            return True
+
+        with self._lock:
+            seen = self._seen.get(category, 0) + 1
+            self._seen[category] = seen
+            keep = seen % rule.get("every", 1) == 0
+            if keep and "per_second" in rule:
+                rate = rule["per_second"]
+                now = time.monotonic()
+                tokens, last = self._buckets.get(category, (rate, now))
+                tokens = min(rate, tokens + (now - last) * rate)
+                keep = tokens >= 1
+                self._buckets[category] = (tokens - 1 if keep else tokens, now)
+            if not keep:
+                self.dropped[category] = self.dropped.get(category, 0) + 1
+        return keep
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the writer falls behind."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_log_listener = None
+_log_lock = threading.Lock()
 
 # Configure logging with UTF-8 encoding
 def setup_logging():
-    # Get current date for log file name
-    current_date = datetime.utcnow().strftime('%Y-%m-%d')
-    log_file = f'logs/error_{current_date}.log'
-    
-    # Configure logging format
-    logging.basicConfig(
-        level=logging.INFO,
-        format='[%(asctime)s.%(msecs)03dZ] [%(levelname)s] %(message)s\n%(pathname)s:%(lineno)d\n%(exc_info)s\n---\n',
-        datefmt='%Y-%m-%dT%H:%M:%S',
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8', mode='a'),
-            logging.StreamHandler()
-        ]
-    )
-    
+    """Routes all logging through a bounded queue drained by a background thread.
+
+    Request threads only pay for filtering and an enqueue; formatting and
+    file/console I/O happen on the listener thread. Called once by the entry
+    point (app.py); importing this module has no side effects.
+    """
+    global _log_listener
+    with _log_lock:
+        if _log_listener is not None:
+            return logging.getLogger(__name__)
+
+        formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+        formatter.converter = time.gmtime
+        file_handler = DailyFileHandler()
+        file_handler.setFormatter(formatter)
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+
+        queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        queue_handler.addFilter(SamplingFilter(LOG_SAMPLING))
+
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(queue_handler)
+
+        _log_listener = QueueListener(queue_handler.queue, file_handler, stream_handler, respect_handler_level=True)
+        _log_listener.start()
+        atexit.register(_log_listener.stop)
+
     return logging.getLogger(__name__)
 
-logger = setup_logging()
+logger = logging.getLogger(__name__)
 
-def get_base64_image(image_path):
-    """Convert an image to base64 string."""
-    try:
-        with open(image_path, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode()
-    except Exception as e:
-        logger.error(f"Failed to convert image to base64: {image_path}", exc_info=True)
-        return ""
+def extract_chunk_content(chunk):
+    """Returns the text of a streamed chunk, handling the different response formats."""
+    if hasattr(chunk, 'message') and chunk.message:
+        return chunk.message.content
+    elif hasattr(chunk, 'content'):
+        return chunk.content
+    elif isinstance(chunk, dict):
+        return chunk.get('content', '')
+    elif isinstance(chunk, str):
+        return chunk
+    return None
+
+class StreamRenderer:
+    """Buffers streamed chunks and repaints a placeholder at a bounded rate.
+
+    Chunks are appended to a list and only handed to the <think> parser when
+    the placeholder is repainted, which happens at most `fps` times per second
+    or once `flush_chars` characters are pending, instead of on every token.
+    The answer goes to `placeholder`; reasoning goes to a collapsed expander
+    created in `reasoning_slot` once the model starts thinking.
+    """
+
+    def __init__(self, placeholder, reasoning_slot=None, fps=STREAM_RENDER_FPS, flush_chars=STREAM_FLUSH_CHARS,
+                 model=None):
+        self.placeholder = placeholder
+        self.reasoning_slot = reasoning_slot
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.flush_chars = flush_chars
+        self.parser = ThinkParser(is_reasoning_model(model))
+        self._reasoning_view = None
+        self._reasoning_chars = 0
+        self._pending = []
+        self._pending_chars = 0
+        self._last_flush = 0.0
+
+    def write(self, text):
+        now = time.perf_counter()
+        self._pending.append(text)
+        self._pending_chars += len(text)
+        if self._pending_chars >= self.flush_chars or now - self._last_flush >= self.interval:
+            self._flush(now)
+
+    def _feed_pending(self):
+        if self._pending:
+            self.parser.feed("".join(self._pending))
+            self._pending.clear()
+            self._pending_chars = 0
+
+    def _render_reasoning(self, cursor=""):
+        reasoning = self.parser.reasoning
+        if self.reasoning_slot is None or len(reasoning) == self._reasoning_chars:
+            return
+        if self._reasoning_view is None:
+            with self.reasoning_slot.container():
+                self._reasoning_view = st.expander("💭 Reasoning", expanded=False).empty()
+        self._reasoning_view.markdown(reasoning + cursor)
+        self._reasoning_chars = len(reasoning)
+
+    def _flush(self, now):
+        self._feed_pending()
+        self._render_reasoning("▌")
+        self.placeholder.markdown(self.parser.answer + "▌")
+        self._last_flush = now
 
-def process_stream(stream, status_text="Processing..."):
+    def close(self):
+        """Returns the answer without reasoning; the caller renders the final version."""
+        self._feed_pending()
+        self.parser.close()
+        self._reasoning_chars = -1  # repaint without the cursor
+        self._render_reasoning()
+        return self.parser.answer
+
+    @property
+    def reasoning(self):
+        return self.parser.reasoning
+
+def process_stream(stream, status_text="Processing...", model=None):
     """Process a streaming response with a status indicator."""
     try:
+        reasoning_slot = st.empty()
         message_placeholder = st.empty()
-        full_response = ""
+        renderer = StreamRenderer(message_placeholder, reasoning_slot, model=model)
         
         # Display status with spinner
         with st.spinner(status_text):
@@ -51,32 +224,28 @@ def process_stream(stream, status_text="Processing..."):
                     logger.warning("Received empty chunk in stream")
                     continue
                     
-                # Log chunk structure for debugging
-                logger.info(f"Chunk structure: {chunk.__dict__}")
-                
-                # Handle different response formats
-                chunk_content = None
-                if hasattr(chunk, 'message') and chunk.message:
-                    chunk_content = chunk.message.content
-                elif hasattr(chunk, 'content'):
-                    chunk_content = chunk.content
-                elif isinstance(chunk, dict):
-                    chunk_content = chunk.get('content', '')
-                elif isinstance(chunk, str):
-                    chunk_content = chunk
+                # Log chunk structure for debugging (sampled, see LOG_SAMPLING)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Chunk structure: {getattr(chunk, '__dict__', chunk)}", extra={"category": "stream.chunk"})
                 
+                chunk_content = extract_chunk_content(chunk)
+
                 if chunk_content:
-                    full_response += chunk_content
-                    message_placeholder.markdown(full_response + "▌")
+                    renderer.write(chunk_content)
                 else:
                     logger.warning(f"Could not extract content from chunk: {chunk}")
             
+            answer = renderer.close()
+
             # Final update without cursor
-            if full_response:
-                # Clean up any <think> tags from the response
-                cleaned_response = full_response.replace('<think>', '').replace('</think>', '')
-                message_placeholder.markdown(cleaned_response)
-                return cleaned_response
+            if answer:
+                message_placeholder.markdown(render_markdown(answer))
+                return answer
+            elif renderer.reasoning:
+                message_placeholder.empty()
+                logger.error("The model stopped before answering")
+                st.error("⚠️ The model stopped before giving an answer")
+                return ""
             else:
                 logger.error("No content was extracted from the stream")
                 st.error("⚠️ No response content received")
@@ -87,30 +256,27 @@ def process_stream(stream, status_text="Processing..."):
         st.error("⚠️ Error processing response")
         return ""
 
+def display_reasoning(reasoning):
+    """Shows a model's reasoning in a collapsed expander."""
+    with st.expander("💭 Reasoning", expanded=False):
+        st.markdown(reasoning)
+
 def display_message(message):
     """Display a chat message with proper formatting."""
     try:
         with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+            if message.get("reasoning"):
+                display_reasoning(message["reasoning"])
+            st.markdown(message.get("rendered") or message["content"])
     except Exception as e:
         logger.error(f"Failed to display message: {message}", exc_info=True)
         st.error("⚠️ Error displaying message")
 
-def display_assistant_message(content):
-    """Display an assistant message with proper formatting."""
-    try:
-        st.markdown(content)
-    except Exception as e:
-        logger.error(f"Failed to display assistant message", exc_info=True)
-        st.error("⚠️ Error displaying assistant message")
-
-def display_chat_history():
-    """Display the chat history from the session state."""
+def display_chat_history(messages):
+    """Display stored messages, oldest first, exactly as they were normalized on write."""
     try:
-        if "messages" in st.session_state:
-            for message in st.session_state.messages:
-                with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
+        for message in messages:
+            display_message(message)
     except Exception as e:
         logger.error("Failed to display chat history", exc_info=True)
         st.error("⚠️ Error displaying chat history")